@@ -1,19 +1,230 @@
 #routes.py
 
-from fastapi import APIRouter
-from app.models.schemas import OptimizationRequest, OptimizationResponse
-from app.core.optimizer import find_profitable_pairs
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.schemas import (
+    BatchOptimizationResult,
+    FleetPlanResponse,
+    InventoryChange,
+    InventoryUpdateResponse,
+    MultiStopRequest,
+    MultiStopResponse,
+    OptimizationRequest,
+    OptimizationResponse,
+    OptimizationUpdate,
+)
+from app.core.batch import optimize_batch
+from app.core import metrics
+from app.core.fleet import optimize_fleet
+from app.core.multistop import find_multistop_plan
+from app.core.optimizer import (
+    candidate_query_params,
+    find_profitable_pairs,
+    iter_ranked_candidates,
+    load_candidate_arrays,
+    rank_candidates,
+)
+from app.core.result_cache import RESULT_CACHE_ENABLED, result_cache
+from app.db import async_session, candidate_source, warehouse_index
+from app.db.inventory import apply_inventory_deltas
+from app.db.inventory_version import bump_version, current_version
+from app.db.db_session import get_db
+from app.db.warehouse_index import get_warehouse_index, refresh_warehouse_index
 
 router = APIRouter()
 
 @router.post("/optimize", response_model=OptimizationResponse)
-def optimize_route(req: OptimizationRequest):
-    pairs = find_profitable_pairs(
+async def optimize_route(req: OptimizationRequest, db: Session = Depends(get_db)):
+    # Repeat queries for the same depots and similar trucks are served from cache
+    version = current_version()
+    key = result_cache.key(
+        req.start_location, req.end_location, req.t_max,
+        req.cost_per_km_per_kg, req.max_truck_weight_kg, req.curr_truck_weight_kg,
+    )
+    if RESULT_CACHE_ENABLED:
+        cached = result_cache.get(key, version)
+        if cached is not None:
+            return _optimization_response(cached)
+
+    if async_session.ASYNC_DB_ENABLED and get_warehouse_index() is None:
+        # Await the DB on the event loop; only scoring takes a worker thread
+        with metrics.span("candidate_load"):
+            warehouses = await async_session.load_warehouses_by_item_async(
+                **candidate_query_params(
+                    req.start_location, req.end_location, req.cost_per_km_per_kg, req.max_truck_weight_kg
+                )
+            )
+        pairs = await run_in_threadpool(
+            rank_candidates,
+            warehouses,
+            req.start_location,
+            req.end_location,
+            req.t_max,
+            req.cost_per_km_per_kg,
+            req.max_truck_weight_kg,
+        )
+    else:
+        pairs = await run_in_threadpool(
+            find_profitable_pairs,
+            start_location=req.start_location,
+            end_location=req.end_location,
+            t_max=req.t_max,
+            cost_per_km_per_kg=req.cost_per_km_per_kg,
+            max_truck_weight_kg=req.max_truck_weight_kg,
+            curr_truck_weight_kg=req.curr_truck_weight_kg,
+            db=db
+        )
+
+    if RESULT_CACHE_ENABLED:
+        result_cache.put(key, version, pairs)
+    return _optimization_response(pairs)
+
+
+def _optimization_response(pairs) -> Response:
+    # Validated and encoded once here (and timed), not again by FastAPI
+    with metrics.span("serialization"):
+        body = OptimizationResponse(profitable_pairs=pairs).model_dump_json()
+    return Response(body, media_type="application/json")
+
+
+@router.post("/optimize/stream")
+async def optimize_route_stream(
+    req: OptimizationRequest,
+    request: Request,
+    stream_format: Literal["ndjson", "sse"] = Query("ndjson", alias="format"),
+    db: Session = Depends(get_db),
+):
+    """
+    Progressive /optimize: the haversine (or travel model) ranking is sent
+    as soon as it is scored, then a "road" update re-ranked on road distances once the
+    routing matrix arrives. Each update replaces the previous list. Closing
+    the connection cancels any update not yet started.
+    """
+    if async_session.ASYNC_DB_ENABLED and get_warehouse_index() is None:
+        with metrics.span("candidate_load"):
+            warehouses = await async_session.load_warehouses_by_item_async(
+                **candidate_query_params(
+                    req.start_location, req.end_location, req.cost_per_km_per_kg, req.max_truck_weight_kg
+                )
+            )
+    else:
+        # Loaded before streaming starts, while the request's session is open
+        warehouses = await run_in_threadpool(
+            load_candidate_arrays,
+            req.start_location,
+            req.end_location,
+            req.cost_per_km_per_kg,
+            req.max_truck_weight_kg,
+            db=db,
+        )
+
+    updates = iter_ranked_candidates(
+        warehouses,
+        req.start_location,
+        req.end_location,
+        req.t_max,
+        req.cost_per_km_per_kg,
+        req.max_truck_weight_kg,
+    )
+
+    async def events():
+        while not await request.is_disconnected():
+            update = await run_in_threadpool(next, updates, None)
+            if update is None:
+                return
+            phase, pairs = update
+            with metrics.span("serialization"):
+                body = OptimizationUpdate(phase=phase, profitable_pairs=pairs).model_dump_json()
+            if stream_format == "sse":
+                yield f"event: {phase}\ndata: {body}\n\n"
+            else:
+                yield body + "\n"
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+
+@router.post("/optimize/batch")
+def optimize_route_batch(reqs: List[OptimizationRequest]):
+    """
+    Plans a whole fleet in one call. Trucks with overlapping corridors share
+    one candidate load; results stream back as NDJSON, one line per truck
+    in completion order, tagged with the truck's index in the request.
+    """
+    def lines():
+        for i, pairs in optimize_batch(reqs):
+            yield BatchOptimizationResult(index=i, profitable_pairs=pairs).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/optimize/fleet", response_model=FleetPlanResponse)
+def optimize_route_fleet(reqs: List[OptimizationRequest], db: Session = Depends(get_db)):
+    """
+    Plans a whole fleet against shared inventory: at most one pair per
+    truck, with no warehouse stock promised to two trucks.
+    """
+    plan = optimize_fleet(reqs, db=db)
+    return {
+        "assignments": [{"index": i, "pair": plan[i]} for i in range(len(reqs))],
+        "total_net_profit": sum(p["net_profit"] for p in plan.values() if p is not None),
+    }
+
+
+@router.post("/optimize/multistop", response_model=MultiStopResponse)
+def optimize_route_multistop(req: MultiStopRequest, db: Session = Depends(get_db)):
+    """
+    Plans one trip with several buy and sell stops, mixing items to fill
+    the truck's remaining weight (and optional volume) within t_max.
+    """
+    return find_multistop_plan(
         start_location=req.start_location,
         end_location=req.end_location,
         t_max=req.t_max,
         cost_per_km_per_kg=req.cost_per_km_per_kg,
         max_truck_weight_kg=req.max_truck_weight_kg,
-        curr_truck_weight_kg=req.curr_truck_weight_kg
+        curr_truck_weight_kg=req.curr_truck_weight_kg,
+        max_truck_volume_m3=req.max_truck_volume_m3,
+        time_budget_s=req.time_budget_s,
+        db=db,
     )
-    return {"profitable_pairs": pairs}
+
+
+@router.get("/optimize/cache")
+def optimize_cache_stats():
+    """Hit/miss counters of the /optimize result cache."""
+    return {"enabled": RESULT_CACHE_ENABLED, "inventory_version": current_version(), **result_cache.snapshot()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Stage latency histograms and pair counters, Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.post("/index/refresh")
+def refresh_index(db: Session = Depends(get_db)):
+    """Reloads the in-memory warehouse index after the tables changed."""
+    if candidate_source.CANDIDATE_SNAPSHOT_PATH:
+        raise HTTPException(status_code=409, detail="Candidates are served from a snapshot")
+    if not warehouse_index.INDEX_ENABLED:
+        raise HTTPException(status_code=409, detail="Warehouse index is disabled")
+    index = refresh_warehouse_index(db)
+    bump_version()  # cached results may reflect the old tables
+    return {"warehouses": len(index)}
+
+
+@router.post("/inventory/deltas", response_model=InventoryUpdateResponse)
+def update_inventory(changes: List[InventoryChange], db: Session = Depends(get_db)):
+    """
+    Applies stock changes (e.g. completed trades) in one transaction and
+    updates the in-memory index and result cache without a reload.
+    """
+    try:
+        return apply_inventory_deltas([c.model_dump() for c in changes], db=db)
+    except IntegrityError as exc:
+        raise HTTPException(status_code=422, detail=f"Unknown warehouse or item: {exc.orig}")
@@ -0,0 +1,100 @@
+# batch.py
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from .optimizer import MAX_DETOUR_METERS, TOP_K, candidate_query_params, rank_candidates
+from app.db.warehouse_index import WarehouseIndex, corridor_bbox, get_warehouse_index
+
+BBox = Tuple[float, float, float, float]  # lat_min, lat_max, lon_min, lon_max
+
+
+def _overlaps(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]
+
+
+def _union(boxes: Sequence[BBox]) -> BBox:
+    return (
+        min(b[0] for b in boxes), max(b[1] for b in boxes),
+        min(b[2] for b in boxes), max(b[3] for b in boxes),
+    )
+
+
+def group_corridors(requests: Sequence, max_detour_meters: float = MAX_DETOUR_METERS) -> List[List[int]]:
+    """
+    Groups request indices whose corridor bounding boxes overlap
+    (transitively), sweeping boxes by lon_min with a union-find.
+    """
+    boxes = [
+        corridor_bbox(r.start_location[0], r.start_location[1],
+                      r.end_location[0], r.end_location[1], max_detour_meters)
+        for r in requests
+    ]
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][2])
+    active: List[int] = []
+    for i in order:
+        # Drop boxes that end west of this one; they cannot overlap later ones either
+        active = [j for j in active if boxes[j][3] >= boxes[i][2]]
+        for j in active:
+            if _overlaps(boxes[i], boxes[j]):
+                parent[find(i)] = find(j)
+        active.append(i)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(boxes)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def iter_truck_candidates(requests: Sequence, db: Optional[Session] = None) -> Iterator[Tuple[int, List[Dict]]]:
+    """
+    Yields (request index, candidate rows) for every truck, group by group.
+    Each group of overlapping corridors loads its candidate warehouses
+    once, for the union of their boxes (or reuses the global in-memory
+    index), and every truck is then filtered against those shared arrays
+    in memory.
+    """
+    index = get_warehouse_index()
+
+    for group in group_corridors(requests):
+        if index is not None:
+            shared = index
+        else:
+            boxes = [
+                corridor_bbox(requests[i].start_location[0], requests[i].start_location[1],
+                              requests[i].end_location[0], requests[i].end_location[1], MAX_DETOUR_METERS)
+                for i in group
+            ]
+            shared = WarehouseIndex.load(db, bbox=_union(boxes))
+
+        for i in group:
+            req = requests[i]
+            yield i, shared.load_warehouses_by_item(
+                **candidate_query_params(
+                    req.start_location, req.end_location, req.cost_per_km_per_kg, req.max_truck_weight_kg
+                )
+            )
+
+
+def optimize_batch(
+    requests: Sequence, db: Optional[Session] = None, top_k: int = TOP_K
+) -> Iterator[Tuple[int, List[Dict]]]:
+    """Yields (request index, profitable pairs) for every truck as it is scored."""
+    for i, warehouses in iter_truck_candidates(requests, db):
+        req = requests[i]
+        yield i, rank_candidates(
+            warehouses,
+            req.start_location,
+            req.end_location,
+            req.t_max,
+            req.cost_per_km_per_kg,
+            req.max_truck_weight_kg,
+            top_k=top_k,
+        )
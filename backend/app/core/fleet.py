@@ -0,0 +1,109 @@
+# fleet.py
+
+import heapq
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from .batch import iter_truck_candidates
+from .optimizer import rank_candidates
+
+# Pairs kept per truck; more alternatives let trucks route around taken stock
+FLEET_PAIRS_PER_TRUCK = int(os.getenv("FLEET_PAIRS_PER_TRUCK", "100"))
+
+# Fields of a scored pair that scale linearly with the traded quantity
+SCALED_FIELDS = ("gross_profit", "net_profit", "transport_cost")
+
+StockKey = Tuple[int, int]  # (warehouse_id, item_id)
+
+
+def _scaled(pair: Dict, quantity: int) -> Dict:
+    """The pair re-costed for a smaller quantity (every term is per unit)."""
+    ratio = quantity / pair["traded_quantity"]
+    out = dict(pair, traded_quantity=quantity)
+    for f in SCALED_FIELDS:
+        out[f] = pair[f] * ratio
+    return out
+
+
+def assign_fleet(
+    truck_pairs: Dict[int, List[Dict]],
+    stock: Dict[StockKey, float],
+) -> Dict[int, Optional[Dict]]:
+    """
+    Gives each truck at most one pair so that, across the fleet, no
+    warehouse sells more of an item than it holds or buys more than it
+    asks for.
+
+    Greedy with reservations: all (truck, pair) options go into one max-heap
+    by net profit. The best option is taken if the truck is still free and
+    its stock is untouched; if earlier reservations shrank the quantity
+    available, it is re-costed and pushed back (lazy re-evaluation), since
+    net profit only falls as stock is used up. Runs in O(P log P) for P
+    options.
+
+    Args:
+        truck_pairs: truck index -> its scored pairs.
+        stock: (warehouse_id, item_id) -> units on hand (supply) or wanted
+            (demand), as absolute values.
+
+    Returns:
+        truck index -> assigned pair (re-costed if it was cut short) or None.
+    """
+    remaining = dict(stock)
+    heap = [
+        (-p["net_profit"], truck, n, p)
+        for truck, pairs in truck_pairs.items()
+        for n, p in enumerate(pairs)
+        if p["traded_quantity"] > 0
+    ]
+    heapq.heapify(heap)
+
+    plan: Dict[int, Optional[Dict]] = {truck: None for truck in truck_pairs}
+    while heap:
+        neg_profit, truck, n, pair = heapq.heappop(heap)
+        if plan[truck] is not None:
+            continue
+
+        buy = (pair["buy_warehouse_id"], pair["item_id"])
+        sell = (pair["sell_warehouse_id"], pair["item_id"])
+        quantity = int(min(pair["traded_quantity"], remaining.get(buy, 0), remaining.get(sell, 0)))
+        if quantity <= 0:
+            continue
+        if quantity < pair["traded_quantity"]:
+            pair = _scaled(pair, quantity)
+            if pair["net_profit"] <= 0:
+                continue
+            if heap and -heap[0][0] > pair["net_profit"]:
+                heapq.heappush(heap, (-pair["net_profit"], truck, n, pair))
+                continue
+
+        plan[truck] = pair
+        remaining[buy] -= quantity
+        remaining[sell] -= quantity
+    return plan
+
+
+def optimize_fleet(
+    requests: Sequence, db: Optional[Session] = None, pairs_per_truck: int = FLEET_PAIRS_PER_TRUCK
+) -> Dict[int, Optional[Dict]]:
+    """
+    Plans the whole fleet against shared inventory: scores every truck's
+    candidates (sharing loads between overlapping corridors), then assigns
+    pairs so that no two trucks count on the same stock.
+    """
+    truck_pairs: Dict[int, List[Dict]] = {}
+    stock: Dict[StockKey, float] = {}
+    for i, warehouses in iter_truck_candidates(requests, db):
+        req = requests[i]
+        for w in warehouses:
+            stock[(w["warehouse_id"], w["item_id"])] = abs(w["quantity"])
+        truck_pairs[i] = rank_candidates(
+            warehouses,
+            req.start_location,
+            req.end_location,
+            req.t_max,
+            req.cost_per_km_per_kg,
+            req.max_truck_weight_kg,
+            top_k=pairs_per_truck,
+        )
+    return assign_fleet(truck_pairs, stock)
@@ -1,8 +1,5 @@
-import os
 import math
-import openrouteservice
-from openrouteservice import Client
-
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env file
@@ -18,18 +15,84 @@ def haversine_km(lat1, lon1, lat2, lon2):
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
-# Initialize client globally to reuse connections
-client = openrouteservice.Client(key=os.getenv("ORS_API_KEY"))
+def haversine_km_np(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine_km. Arguments are scalars or NumPy arrays and are
+    broadcast against each other, so passing column/row vectors yields a full
+    distance matrix.
+    """
+    R = 6371
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(lon2) - np.radians(lon1)
+
+    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
 
 def get_travel_time_minutes(lat1, lon1, lat2, lon2):
     """
-    Query OpenRouteService for driving-car route duration in minutes.
+    Driving-car route duration in minutes, via the shared (cached) routing
+    provider.
     """
-    coords = ((lon1, lat1), (lon2, lat2))
-    res = client.directions(coords, profile="driving-car", format="geojson")
-    duration_sec = res["features"][0]["properties"]["summary"]["duration"]
+    from .routing import get_routing_provider
+
+    _, duration_sec = get_routing_provider().route((lon1, lat1), (lon2, lat2), profile="driving-car")
     return duration_sec / 60.0
 
+class DistanceMatrix:
+    """
+    Road distances (m) and durations (s) between [source, *warehouses,
+    destination] as two float32 arrays, plus a vectorized warehouse_id ->
+    index map. Accessors take arrays of warehouse ids and return arrays, so
+    the optimizer can pull whole rows, columns and blocks at once.
+    Unroutable cells are NaN.
+    """
+
+    __slots__ = ("warehouse_ids", "distances", "durations", "_sorted_ids", "_sorted_index")
+
+    def __init__(self, warehouse_ids, distances, durations):
+        self.warehouse_ids = np.asarray(warehouse_ids, dtype=np.int64)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.durations = np.asarray(durations, dtype=np.float32)
+
+        # Row/column of each warehouse, offset by +1 because of the source
+        order = np.argsort(self.warehouse_ids)
+        self._sorted_ids = self.warehouse_ids[order]
+        self._sorted_index = order + 1
+
+    def __len__(self):
+        return len(self.warehouse_ids)
+
+    def index_of(self, warehouse_ids) -> np.ndarray:
+        """Matrix indices of the given warehouse ids (KeyError if unknown)."""
+        warehouse_ids = np.asarray(warehouse_ids, dtype=np.int64)
+        at = np.searchsorted(self._sorted_ids, warehouse_ids)
+        at = np.minimum(at, len(self._sorted_ids) - 1)
+        if len(self._sorted_ids) == 0 or not np.array_equal(self._sorted_ids[at], warehouse_ids):
+            raise KeyError("warehouse id not in matrix")
+        return self._sorted_index[at]
+
+    def source_to_dest(self):
+        """(distance_m, duration_s) of the direct source → destination trip."""
+        return float(self.distances[0, -1]), float(self.durations[0, -1])
+
+    def from_source(self, warehouse_ids):
+        idx = self.index_of(warehouse_ids)
+        return self.distances[0, idx], self.durations[0, idx]
+
+    def to_dest(self, warehouse_ids):
+        idx = self.index_of(warehouse_ids)
+        return self.distances[idx, -1], self.durations[idx, -1]
+
+    def block(self, from_ids, to_ids):
+        """(len(from_ids), len(to_ids)) sub-matrices between warehouses."""
+        rows = self.index_of(from_ids)[:, None]
+        cols = self.index_of(to_ids)[None, :]
+        return self.distances[rows, cols], self.durations[rows, cols]
+
+
 def generate_warehouse_distance_matrix(warehouses, start_location, end_location):
     """
     warehouses: List of dicts with keys: warehouse_id, lat, lon
@@ -37,10 +100,7 @@ def generate_warehouse_distance_matrix(warehouses, start_location, end_location)
     end_location: tuple(lat, lon)
 
     Returns:
-        unique_ids: list of warehouse IDs
-        distances: full matrix
-        durations: full matrix
-        helper dicts for constant-time lookup
+        DistanceMatrix over [start_location, *unique warehouses, end_location]
     """
     # Remove duplicates
     seen = set()
@@ -53,74 +113,16 @@ def generate_warehouse_distance_matrix(warehouses, start_location, end_location)
             unique_warehouses.append(w)
             unique_ids.append(w["warehouse_id"])
 
-    # Build coordinates: [source, *warehouses, destination]
-    coords = [start_location] + [(w["lon"], w["lat"]) for w in unique_warehouses] + [end_location]
+    from .routing import get_routing_provider
 
-    ors_client = Client(key=os.getenv("ORS_API_KEY"))
-
-    matrix = ors_client.distance_matrix(
-        locations=coords,
-        profile="driving-car",
-        metrics=["distance", "duration"],
-        units="m",
-        optimized=False
+    # Build (lon, lat) coordinates: [source, *warehouses, destination]
+    coords = (
+        [(start_location[1], start_location[0])]
+        + [(w["lon"], w["lat"]) for w in unique_warehouses]
+        + [(end_location[1], end_location[0])]
     )
 
-    distances = matrix["distances"]
-    durations = matrix["durations"]
-
-    # Map warehouse_id -> index in matrix (offset by +1 because of start_location)
-    id_to_index = {wid: idx + 1 for idx, wid in enumerate(unique_ids)}
-
-    # Build lookup dicts
-    dist_lookup = {}
-    time_lookup = {}
-    for i, ida in enumerate(unique_ids):
-        dist_lookup[ida] = {}
-        time_lookup[ida] = {}
-        for j, idb in enumerate(unique_ids):
-            dist_lookup[ida][idb] = distances[i+1][j+1]
-            time_lookup[ida][idb] = durations[i+1][j+1]
-
-    # Distances/durations from source to each warehouse
-    dist_from_source = {}
-    time_from_source = {}
-    for i, wid in enumerate(unique_ids):
-        dist_from_source[wid] = distances[0][i+1]
-        time_from_source[wid] = durations[0][i+1]
-
-    # Distances/durations to destination
-    dist_to_dest = {}
-    time_to_dest = {}
-    for i, wid in enumerate(unique_ids):
-        dist_to_dest[wid] = distances[i+1][-1]
-        time_to_dest[wid] = durations[i+1][-1]
-
-    # Distances/durations from source to destination
-    dist_source_dest = distances[0][-1]
-    time_source_dest = durations[0][-1]
-
-    return {
-        "warehouse_ids": unique_ids,
-        "distances": distances,
-        "durations": durations,
-        "dist_lookup": dist_lookup,
-        "time_lookup": time_lookup,
-        "dist_from_source": dist_from_source,
-        "time_from_source": time_from_source,
-        "dist_to_dest": dist_to_dest,
-        "time_to_dest": time_to_dest,
-        "dist_source_to_dest": dist_source_dest,
-        "time_source_to_dest": time_source_dest,
-        "get_helpers": lambda: (
-            lambda wa, wb: (
-                time_lookup[wa][wb], dist_lookup[wa][wb]
-            ),
-            lambda wa: (
-                time_from_source[wa], dist_from_source[wa]
-            ),
-            lambda wa: (
-                time_to_dest[wa], dist_to_dest[wa]
-            )
-        )
-    }
\ No newline at end of file
+    # Cached cells are reused; only missing ones reach the routing backend
+    distances, durations = get_routing_provider().matrix(coords, profile="driving-car")
+
+    return DistanceMatrix(unique_ids, distances, durations)
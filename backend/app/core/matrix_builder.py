@@ -0,0 +1,172 @@
+# matrix_builder.py
+
+import os
+import time
+import math
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from .routing import DEFAULT_PROFILE, RoutingProvider
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads; rate <= 0 disables it."""
+
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate = rate_per_sec
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient provider failures."""
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def delay(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def is_retriable(exc: Exception) -> bool:
+        """
+        Only rate limiting (429), server errors (5xx), timeouts and
+        connection failures; anything else (other 4xx, bugs in our own
+        code) would fail the same way again.
+        """
+        # ORS ApiError carries the HTTP status
+        status = getattr(exc, "status", None)
+        if isinstance(status, int):
+            return status == 429 or status >= 500
+        return isinstance(exc, _transient_errors())
+
+
+_transient: Optional[Tuple[type, ...]] = None
+
+
+def _transient_errors() -> Tuple[type, ...]:
+    # The HTTP client libraries are only needed when ORS is used
+    global _transient
+    if _transient is None:
+        errors: List[type] = [TimeoutError, ConnectionError]
+        try:
+            import requests
+            errors += [requests.exceptions.Timeout, requests.exceptions.ConnectionError]
+        except ImportError:
+            pass
+        try:
+            from openrouteservice import exceptions
+            errors.append(exceptions.Timeout)
+        except ImportError:
+            pass
+        _transient = tuple(errors)
+    return _transient
+
+
+class TiledMatrixProvider(RoutingProvider):
+    """
+    Splits a sources × destinations matrix into tiles of at most max_cells
+    routes (the provider's per-request limit), fetches them concurrently
+    under a rate limit with retries, and assembles one dense array.
+    Each tile request only carries the coordinates it uses.
+    """
+
+    def __init__(
+        self,
+        provider: RoutingProvider,
+        max_cells: int = 3500,
+        max_workers: int = 4,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.provider = provider
+        self.max_cells = max_cells
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+        self.retry = retry or RetryPolicy()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="matrix")
+
+    @classmethod
+    def from_env(cls, provider: RoutingProvider) -> "TiledMatrixProvider":
+        workers = int(os.getenv("ROUTING_MAX_CONCURRENCY", "4"))
+        return cls(
+            provider,
+            max_cells=int(os.getenv("ROUTING_MATRIX_MAX_CELLS", "3500")),
+            max_workers=workers,
+            rate_limiter=RateLimiter(float(os.getenv("ROUTING_RATE_LIMIT_PER_MINUTE", "40")) / 60, burst=workers),
+            retry=RetryPolicy(
+                max_retries=int(os.getenv("ROUTING_MAX_RETRIES", "3")),
+                backoff_base=float(os.getenv("ROUTING_BACKOFF_SECONDS", "0.5")),
+            ),
+        )
+
+    def tiles(self, n_sources: int, n_destinations: int) -> List[Tuple[slice, slice]]:
+        """Row/column slices covering the matrix, each within max_cells."""
+        side = max(int(math.isqrt(self.max_cells)), 1)
+        rows = min(n_sources, side) or 1
+        cols = max(min(n_destinations, self.max_cells // rows), 1)
+        return [
+            (slice(r, min(r + rows, n_sources)), slice(c, min(c + cols, n_destinations)))
+            for r in range(0, n_sources, rows)
+            for c in range(0, n_destinations, cols)
+        ]
+
+    def matrix(self, locations, sources=None, destinations=None, profile=DEFAULT_PROFILE):
+        src = list(sources) if sources is not None else list(range(len(locations)))
+        dst = list(destinations) if destinations is not None else list(range(len(locations)))
+
+        distances = np.full((len(src), len(dst)), np.nan)
+        durations = np.full((len(src), len(dst)), np.nan)
+
+        tiles = self.tiles(len(src), len(dst))
+        if len(tiles) == 1:
+            block = self._fetch(locations, src, dst, profile)
+            distances[:], durations[:] = block
+            return distances, durations
+
+        futures = [
+            (rs, cs, self._pool.submit(self._fetch, locations, src[rs], dst[cs], profile))
+            for rs, cs in tiles
+        ]
+        for rs, cs, future in futures:
+            distances[rs, cs], durations[rs, cs] = future.result()
+        return distances, durations
+
+    def _fetch(self, locations, src: Sequence[int], dst: Sequence[int], profile):
+        # Send only this tile's coordinates, re-indexed
+        used = sorted(set(src) | set(dst))
+        local = {g: i for i, g in enumerate(used)}
+        coords = [locations[g] for g in used]
+        sub_src = [local[g] for g in src]
+        sub_dst = [local[g] for g in dst]
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return self.provider.matrix(coords, sources=sub_src, destinations=sub_dst, profile=profile)
+            except Exception as exc:
+                if attempt >= self.retry.max_retries or not self.retry.is_retriable(exc):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
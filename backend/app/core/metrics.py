@@ -0,0 +1,153 @@
+# metrics.py
+
+import os
+import time
+import random
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Fraction of requests whose per-request details are logged at DEBUG
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key: LabelValues, extra: str = "") -> str:
+        parts = [f'{n}="{v}"' for n, v in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic counter, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        # An unlabelled counter is exported as 0 before its first increment
+        self._values: Dict[LabelValues, float] = {} if self.labels else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return super().render() + [f"{self.name}{self._label_text(k)} {v:g}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (Prometheus semantics: le is inclusive)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def render(self):
+        with self._lock:
+            snapshot = {k: (list(s[0]), s[1], s[2]) for k, s in self._series.items()}
+        lines = super().render()
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for le, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                bound = "+Inf" if le == float("inf") else f"{le:g}"
+                labels = self._label_text(key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {total:g}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "optimizer_stage_seconds",
+    "Time spent per optimizer stage (candidate_load, shortlist, matrix_build, scoring, serialization).",
+    ["stage"],
+)
+PAIRS = Counter(
+    "optimizer_pairs_total",
+    "Scored buy/sell pairs by outcome (profitable or the reason they were skipped).",
+    ["outcome"],
+)
+ROUTING_FALLBACKS = Counter(
+    "optimizer_routing_fallbacks_total",
+    "Requests scored on straight-line legs because the routing matrix failed.",
+)
+
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block into optimizer_stage_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_scoring_stats(stats: Dict[str, int]):
+    """Adds score_pairs stats to optimizer_pairs_total."""
+    PAIRS.inc(stats["profitable_count"], outcome="profitable")
+    PAIRS.inc(stats["t_max_count"], outcome="t_max")
+    PAIRS.inc(stats["q_max_count"], outcome="q_max")
+    PAIRS.inc(stats["net_profit_count"], outcome="net_profit")
+    PAIRS.inc(stats["pruned_count"], outcome="pruned")
+
+
+def sampled(log: logging.Logger) -> bool:
+    """True for about LOG_SAMPLE_RATE of calls when log has DEBUG enabled."""
+    return LOG_SAMPLE_RATE > 0 and log.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
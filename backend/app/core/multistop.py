@@ -0,0 +1,298 @@
+# multistop.py
+
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from .optimizer import build_legs, load_candidate_arrays
+from .scoring import CandidateArrays, HaversineLegs, score_pairs
+
+# Single pairs scored up front; their warehouses are the stops the search may use
+MULTISTOP_SEED_PAIRS = int(os.getenv("MULTISTOP_SEED_PAIRS", "200"))
+# Wall-clock budget for the insertion / 2-opt search, in seconds
+MULTISTOP_TIME_BUDGET_S = float(os.getenv("MULTISTOP_TIME_BUDGET_S", "0.5"))
+
+
+def _pad(column: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], column, [0]])
+
+
+class MultiStopPlanner:
+    """
+    Chains several buy and sell stops into one A→…→B trip, mixing items
+    under the truck's weight and volume limits and t_max.
+
+    The best single pairs from score_pairs seed the search: their
+    warehouses become the nodes of a precomputed distance/time matrix
+    (node 0 is A, the last node is B). Trades are then added by cheapest
+    insertion, placing the buy and the sell of a trade at the pair of route
+    positions that gains the most profit, and the route is tightened with
+    2-opt moves that keep every buy ahead of its sell. The two alternate
+    until neither improves or the time budget runs out.
+
+    Costs follow the single-pair model: transport_cost is the extra
+    distance over A→B times cost_per_km_per_kg times the kilograms traded.
+    """
+
+    def __init__(
+        self,
+        candidates: CandidateArrays,
+        start_location: Tuple[float, float],
+        end_location: Tuple[float, float],
+        t_max: float,
+        cost_per_km_per_kg: float,
+        capacity_kg: float,
+        capacity_m3: Optional[float] = None,
+        legs: Optional[HaversineLegs] = None,
+        seed_pairs: int = MULTISTOP_SEED_PAIRS,
+    ):
+        if legs is None:
+            legs = HaversineLegs(candidates, start_location, end_location)
+        self.t_max = t_max
+        self.cost_per_km_per_kg = cost_per_km_per_kg
+        self.capacity_kg = capacity_kg
+        self.capacity_m3 = np.inf if capacity_m3 is None else capacity_m3
+
+        pairs, _ = score_pairs(
+            candidates, start_location, end_location, t_max=t_max,
+            cost_per_km_per_kg=cost_per_km_per_kg, max_truck_weight_kg=capacity_kg,
+            top_k=seed_pairs, legs=legs,
+        )
+        row_of = {
+            (int(w), int(i)): r for r, (w, i) in enumerate(zip(candidates.warehouse_id, candidates.item_id))
+        }
+        options = [
+            (row_of[(p["buy_warehouse_id"], p["item_id"])], row_of[(p["sell_warehouse_id"], p["item_id"])])
+            for p in pairs
+        ]
+        rows = np.array(sorted({r for option in options for r in option}), dtype=np.int64)
+        node_of = {int(r): k + 1 for k, r in enumerate(rows)}
+        self.options = [(node_of[b], node_of[s]) for b, s in options]
+
+        # Node attributes; A and B are padding at both ends
+        n = len(rows)
+        self.end = n + 1
+        self.warehouse_id = _pad(candidates.warehouse_id[rows])
+        self.item_id = _pad(candidates.item_id[rows])
+        self.stock = _pad(np.abs(candidates.quantity[rows]))
+        self.unit_weight = _pad(candidates.unit_weight[rows])
+        self.unit_volume = _pad(candidates.unit_volume[rows])
+        self.buy_price = _pad(candidates.buy_price[rows])
+        self.sell_price = _pad(candidates.sell_price[rows])
+
+        self.D = np.zeros((n + 2, n + 2))
+        self.T = np.zeros((n + 2, n + 2))
+        self.D_AB, T_AB = legs.source_to_dest()
+        self.D[0, self.end], self.T[0, self.end] = self.D_AB, T_AB
+        if n:
+            inner = slice(1, n + 1)
+            self.D[0, inner], self.T[0, inner] = legs.from_source(rows)
+            self.D[inner, inner], self.T[inner, inner] = legs.between(rows, rows)
+            self.D[inner, self.end], self.T[inner, self.end] = legs.to_dest(rows)
+
+        # Route: stops as (node, trade, +1 buy / -1 sell); trades as [buy, sell, quantity]
+        self.route: List[Tuple[int, int, int]] = []
+        self.trades: List[List] = []
+        self.remaining = self.stock.copy()
+        self.gross = 0.0
+        self.traded_kg = 0.0
+
+    # Route measures
+
+    def _path(self, route) -> np.ndarray:
+        return np.array([0] + [stop[0] for stop in route] + [self.end], dtype=np.int64)
+
+    def _measure(self, route) -> Tuple[float, float]:
+        path = self._path(route)
+        return float(self.D[path[:-1], path[1:]].sum()), float(self.T[path[:-1], path[1:]].sum())
+
+    def _loads(self, route) -> Tuple[np.ndarray, np.ndarray]:
+        """Weight and volume on board along each gap (A→first stop, …, last stop→B)."""
+        w = np.zeros(len(route))
+        v = np.zeros(len(route))
+        for k, (node, t, sign) in enumerate(route):
+            q = self.trades[t][2]
+            w[k] = sign * q * self.unit_weight[node]
+            v[k] = sign * q * self.unit_volume[node]
+        return np.concatenate([[0.0], np.cumsum(w)]), np.concatenate([[0.0], np.cumsum(v)])
+
+    def _profit(self, distance: float, gross: float, traded_kg: float) -> float:
+        return gross - (distance - self.D_AB) * self.cost_per_km_per_kg * traded_kg
+
+    # Search moves
+
+    def _best_insertion(self, deadline: float) -> Optional[Tuple[float, int, int, int, int]]:
+        """(gain, option, buy gap, sell gap, quantity) of the best trade to add."""
+        path = self._path(self.route)
+        prev, nxt = path[:-1], path[1:]
+        gaps = len(prev)
+        distance, duration = self._measure(self.route)
+        profit = self._profit(distance, self.gross, self.traded_kg)
+
+        # Peak load over gaps gi..gj for every gi <= gj
+        load_w, load_v = self._loads(self.route)
+        upper = np.triu(np.ones((gaps, gaps), dtype=bool))
+        peak_w = np.maximum.accumulate(np.where(upper, load_w[None, :], -np.inf), axis=1)
+        peak_v = np.maximum.accumulate(np.where(upper, load_v[None, :], -np.inf), axis=1)
+        diag = np.arange(gaps)
+
+        best = None
+        for o, (b, s) in enumerate(self.options):
+            if time.perf_counter() > deadline:
+                break
+            available = min(self.remaining[b], self.remaining[s])
+            if available < 1:
+                continue
+
+            # Detour of putting the buy in gap gi and the sell in gap gj
+            dD = (self.D[prev, b] + self.D[b, nxt] - self.D[prev, nxt])[:, None] \
+                + (self.D[prev, s] + self.D[s, nxt] - self.D[prev, nxt])[None, :]
+            dT = (self.T[prev, b] + self.T[b, nxt] - self.T[prev, nxt])[:, None] \
+                + (self.T[prev, s] + self.T[s, nxt] - self.T[prev, nxt])[None, :]
+            dD[diag, diag] = self.D[prev, b] + self.D[b, s] + self.D[s, nxt] - self.D[prev, nxt]
+            dT[diag, diag] = self.T[prev, b] + self.T[b, s] + self.T[s, nxt] - self.T[prev, nxt]
+
+            w, v = self.unit_weight[b], self.unit_volume[b]
+            room = (self.capacity_kg - peak_w) / w
+            if v > 0:
+                room = np.minimum(room, (self.capacity_m3 - peak_v) / v)
+            q = np.floor(np.minimum(room, available))
+
+            ok = upper & (q > 0) & (duration + dT <= self.t_max)
+            if not ok.any():
+                continue
+            margin = abs(self.sell_price[s] - self.buy_price[b])
+            gain = self._profit(distance + dD, self.gross + q * margin, self.traded_kg + q * w) - profit
+            gain = np.where(ok, gain, -np.inf)
+            gi, gj = np.unravel_index(np.argmax(gain), gain.shape)
+            if gain[gi, gj] > 1e-9 and (best is None or gain[gi, gj] > best[0]):
+                best = (float(gain[gi, gj]), o, int(gi), int(gj), int(q[gi, gj]))
+        return best
+
+    def _insert(self, option: int, gi: int, gj: int, quantity: int):
+        b, s = self.options[option]
+        t = len(self.trades)
+        self.trades.append([b, s, quantity])
+        self.route.insert(gi, (b, t, 1))
+        self.route.insert(gj + 1, (s, t, -1))
+        self.remaining[b] -= quantity
+        self.remaining[s] -= quantity
+        self.gross += quantity * abs(self.sell_price[s] - self.buy_price[b])
+        self.traded_kg += quantity * self.unit_weight[b]
+
+    def _feasible(self, route) -> bool:
+        seen = set()
+        for _, t, sign in route:
+            if sign < 0 and t not in seen:
+                return False  # sell before its buy
+            seen.add(t)
+        load_w, load_v = self._loads(route)
+        return load_w.max() <= self.capacity_kg + 1e-9 and load_v.max() <= self.capacity_m3 + 1e-9
+
+    def _two_opt(self, deadline: float) -> bool:
+        """Applies the first segment reversal that shortens the trip; True if one did."""
+        distance, _ = self._measure(self.route)
+        n = len(self.route)
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                if time.perf_counter() > deadline:
+                    return False
+                route = self.route[:i] + self.route[i:j + 1][::-1] + self.route[j + 1:]
+                d, t = self._measure(route)
+                if d < distance - 1e-9 and t <= self.t_max and self._feasible(route):
+                    self.route = route
+                    return True
+        return False
+
+    def solve(self, time_budget_s: float = MULTISTOP_TIME_BUDGET_S) -> Dict:
+        deadline = time.perf_counter() + time_budget_s
+        while time.perf_counter() < deadline:
+            move = self._best_insertion(deadline)
+            if move is not None:
+                self._insert(*move[1:])
+            elif not self._two_opt(deadline):
+                break
+        return self.plan()
+
+    def plan(self) -> Dict:
+        path = self._path(self.route)
+        distance, duration = self._measure(self.route)
+        load_w, load_v = self._loads(self.route)
+        arrival = np.cumsum(self.T[path[:-1], path[1:]])
+
+        stops = [
+            {
+                "warehouse_id": int(self.warehouse_id[node]),
+                "item_id": int(self.item_id[node]),
+                "action": "buy" if sign > 0 else "sell",
+                "quantity": self.trades[t][2],
+                "arrival_time": float(arrival[k]),
+                "load_kg": float(load_w[k + 1]),
+                "load_m3": float(load_v[k + 1]),
+            }
+            for k, (node, t, sign) in enumerate(self.route)
+        ]
+        trades = [
+            {
+                "buy_warehouse_id": int(self.warehouse_id[b]),
+                "sell_warehouse_id": int(self.warehouse_id[s]),
+                "item_id": int(self.item_id[b]),
+                "traded_quantity": q,
+            }
+            for b, s, q in self.trades
+        ]
+        extra_distance_km = distance - self.D_AB
+        transport_cost = extra_distance_km * self.cost_per_km_per_kg * self.traded_kg
+        return {
+            "stops": stops,
+            "trades": trades,
+            "gross_profit": float(self.gross),
+            "transport_cost": float(transport_cost),
+            "net_profit": float(self.gross - transport_cost),
+            "total_distance_km": distance,
+            "extra_distance_km": float(extra_distance_km),
+            "total_trip_time": duration,
+            "peak_load_kg": float(load_w.max()),
+            "peak_load_m3": float(load_v.max()),
+            "weight_utilization": float(load_w.max() / self.capacity_kg) if self.capacity_kg > 0 else 0.0,
+        }
+
+
+def find_multistop_plan(
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    t_max: float,
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    curr_truck_weight_kg: float,
+    max_truck_volume_m3: Optional[float] = None,
+    time_budget_s: Optional[float] = None,
+    db: Optional[Session] = None,
+) -> Dict:
+    """
+    Plans one multi-stop trip from A to B.
+
+    Args:
+        curr_truck_weight_kg: cargo already on board; only the remaining
+            capacity is planned for.
+        max_truck_volume_m3: volume limit for the cargo traded on this trip
+            (unlimited if omitted).
+        time_budget_s: search time limit, MULTISTOP_TIME_BUDGET_S by default.
+
+    Returns:
+        The plan: ordered stops, trades, profit and load figures.
+    """
+    capacity_kg = max(max_truck_weight_kg - curr_truck_weight_kg, 0.0)
+    candidates = load_candidate_arrays(start_location, end_location, cost_per_km_per_kg, capacity_kg, db=db)
+    planner = MultiStopPlanner(
+        candidates,
+        start_location,
+        end_location,
+        t_max,
+        cost_per_km_per_kg,
+        capacity_kg,
+        max_truck_volume_m3,
+        legs=build_legs(candidates, start_location, end_location) if len(candidates) else None,
+    )
+    return planner.solve(MULTISTOP_TIME_BUDGET_S if time_budget_s is None else time_budget_s)
@@ -1,200 +1,288 @@
 # optimizer.py
 
-from typing import Dict, List, Optional, Tuple
-import math
-from .geo_utils import generate_warehouse_distance_matrix, haversine_km
-from app.db.queries import load_warehouses_by_item
+import os
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from sqlalchemy.orm import Session
+from .geo_utils import generate_warehouse_distance_matrix
+from .metrics import ROUTING_FALLBACKS, record_scoring_stats, sampled, span
+from .pair_index import get_pair_index
+from .parallel import score_pairs_parallel
+from .scoring import CandidateArrays, HaversineLegs, MatrixLegs
+from .travel_model import ModelLegs, get_travel_model
+from app.db.candidate_source import CandidateSource, get_candidate_source
 
+logger = logging.getLogger(__name__)
 
-def find_profitable_pairs(
+MAX_DETOUR_METERS = 50000  # 50 km detour limit
+TOP_K = 30
+
+# Candidates per item and side (suppliers / demanders); opt-in, 0 keeps the
+# mixed top CANDIDATE_LIMIT, which can crowd out one side of an item
+CANDIDATES_PER_SIDE = int(os.getenv("CANDIDATES_PER_SIDE", "0"))
+
+# Score with road distances/times from the routing provider instead of haversine
+USE_ROAD_TIMES = os.getenv("OPTIMIZER_ROAD_TIMES", "false").lower() in ("1", "true", "yes")
+
+# With a travel model, road times are fetched only for the warehouses of
+# this many best pairs by estimated legs
+ROUTING_SHORTLIST_PAIRS = int(os.getenv("ROUTING_SHORTLIST_PAIRS", "200"))
+
+
+def candidate_query_params(
     start_location: Tuple[float, float],
     end_location: Tuple[float, float],
-    t_max: float,
     cost_per_km_per_kg: float,
     max_truck_weight_kg: float,
-    curr_truck_weight_kg: float,
-) -> List[Dict]:
-    """
-    Returns up to 30 most profitable buy-sell warehouse pairs.
-    
-    Args:
-        start_location: (lat, lon) of A.
-        end_location: (lat, lon) of B.
-        t_max: max trip time (hours).
-        cost_per_km_per_kg: transport cost per km per kg.
-        max_truck_weight_kg: truck capacity in kg.
-        get_time_distance: function(origin, dest) -> (time_hours, distance_km)
-        
-    Returns:
-        List of profitable pairs sorted by descending net profit.
-    """
-
-
-    warehouses = load_warehouses_by_item(
+) -> Dict:
+    """Keyword arguments for load_warehouses_by_item (SQL, async or in-memory)."""
+    return dict(
         src_lat=start_location[0],
         src_lon=start_location[1],
         dest_lat=end_location[0],
         dest_lon=end_location[1],
-        max_detour_meters=50000,  # 50 km detour limit
+        max_detour_meters=MAX_DETOUR_METERS,
         max_load_capacity=max_truck_weight_kg,
-        cost_per_km=cost_per_km_per_kg * max_truck_weight_kg  # To be edited (SQL query needs to be updated to use this value)
+        cost_per_km=cost_per_km_per_kg * max_truck_weight_kg,  # To be edited (SQL query needs to be updated to use this value)
+        per_side_limit=CANDIDATES_PER_SIDE or None,
     )
-    if not warehouses:
-        return []  # No warehouses found
-    
-    # matrix_result = generate_warehouse_distance_matrix(
-    #     warehouses,
-    #     start_location,
-    #     end_location
-    # )
-    # get_dist_time, get_dist_time_source, get_dist_time_dest = matrix_result["get_helpers"]()
 
 
-# ---------------------------------------to be changed---------------------------------------
+def load_candidates(
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    db: Optional[Session] = None,
+    source: Optional[CandidateSource] = None,
+) -> List[Dict]:
+    params = candidate_query_params(start_location, end_location, cost_per_km_per_kg, max_truck_weight_kg)
 
-    t_max_count = 0
-    q_max_count = 0
-    net_profit_count = 0
-    # Baseline A→B trip
-    # raw_T_AB = matrix_result["time_source_to_dest"]
-    # raw_D_AB = matrix_result["dist_source_to_dest"]
-    raw_D_AB = None
-    raw_T_AB = None
+    # Answer from the in-memory index when it is loaded, else from PostGIS
+    with span("candidate_load"):
+        source = source or get_candidate_source(db)
+        return source.load_warehouses_by_item(**params)
 
-    
-    if raw_D_AB is None:
-        # Estimate straight-line distance
-        D_AB = haversine_km(start_location[0], start_location[1], end_location[0], end_location[1])
-    else:
-        D_AB = raw_D_AB / 1000.0
 
-    if raw_T_AB is None:
-        # Estimate time assuming 25 km/h
-        T_AB = D_AB / 25.0
-        print(f"Fallback: estimated T_AB = {T_AB:.2f} hours for {D_AB:.2f} km.")
-    else:
-        T_AB = raw_T_AB / 3600.0
+def load_candidate_arrays(
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    db: Optional[Session] = None,
+    source: Optional[CandidateSource] = None,
+) -> CandidateArrays:
+    """load_candidates as CandidateArrays, streamed from SQL without row dicts when CANDIDATE_COPY_ENABLED."""
+    params = candidate_query_params(start_location, end_location, cost_per_km_per_kg, max_truck_weight_kg)
+
+    with span("candidate_load"):
+        source = source or get_candidate_source(db)
+        records = source.load_candidate_records(**params)
+    return CandidateArrays.from_records(records)
 
-# ---------------------------------------to be changed---------------------------------------
 
-    
-    profitable_pairs = []
-
-    for wb in warehouses:
-        if wb["quantity"] <= 0:
-            continue  # not a supplier
-        for ws in warehouses:
-            if ws["quantity"] >= 0:
-                continue  # not a demand point
-            if wb["item_id"] != ws["item_id"]:
-                continue  # different items
-
-# ---------------------------------------to be changed---------------------------------------
-
-            # Segment 1: A to Buy warehouse
-            # T_AWb_sec, D_AWb_m = get_dist_time_source(wb["warehouse_id"])
-            T_AWb_sec, D_AWb_m = None, None  # To be changed to use the new function
-            if T_AWb_sec is None or D_AWb_m is None:
-                D_AWb = haversine_km(
-                    start_location[0], start_location[1],
-                    wb["lat"], wb["lon"]
-                )
-                T_AWb = D_AWb / 25.0
-                print(f"Fallback A->Wb: {D_AWb:.2f} km, {T_AWb:.2f} hrs.")
-            else:
-                D_AWb = D_AWb_m / 1000.0
-                T_AWb = T_AWb_sec / 3600.0
-
-            # Segment 2: Wb to Ws
-            # T_WbWs_sec, D_WbWs_m = get_dist_time(wb["warehouse_id"], ws["warehouse_id"])
-            T_WbWs_sec, D_WbWs_m = None, None  # To be changed to use the new function
-            if T_WbWs_sec is None or D_WbWs_m is None:
-                D_WbWs = haversine_km(
-                    wb["lat"], wb["lon"],
-                    ws["lat"], ws["lon"]
-                )
-                T_WbWs = D_WbWs / 25.0
-                print(f"Fallback Wb->Ws: {D_WbWs:.2f} km, {T_WbWs:.2f} hrs.")
-            else:
-                D_WbWs = D_WbWs_m / 1000.0
-                T_WbWs = T_WbWs_sec / 3600.0
-
-            # Segment 3: Ws to B
-            # T_WsB_sec, D_WsB_m = get_dist_time_dest(ws["warehouse_id"])
-            T_WsB_sec, D_WsB_m = None, None  # To be changed to use the new function
-            if T_WsB_sec is None or D_WsB_m is None:
-                D_WsB = haversine_km(
-                    ws["lat"], ws["lon"],
-                    end_location[0], end_location[1]
-                )
-                T_WsB = D_WsB / 25.0
-                print(f"Fallback Ws->B: {D_WsB:.2f} km, {T_WsB:.2f} hrs.")
-            else:
-                D_WsB = D_WsB_m / 1000.0
-                T_WsB = T_WsB_sec / 3600.0
-
-# ---------------------------------------to be changed---------------------------------------
-
-            T_total = T_AWb + T_WbWs + T_WsB
-
-            if T_total > t_max:
-                t_max_count += 1
-                print(f"Skipping pair {wb['warehouse_id']} -> {ws['warehouse_id']} due to time limit.")
-                continue  # exceeds deadline
-
-            # Max feasible quantity
-            q_available = min(wb["quantity"], abs(ws["quantity"]))
-            q_capacity_limit = max_truck_weight_kg / wb["unit_weight"]
-            q_max = math.floor(min(q_available, q_capacity_limit))
-
-            if q_max <= 0:
-                q_max_count += 1
-                print(f"Skipping pair {wb['warehouse_id']} -> {ws['warehouse_id']} due to insufficient quantity.")
-                continue  # nothing can be carried
-
-            # Profits and costs
-            unit_gross_profit = abs(ws["sell_price"] - wb["buy_price"])
-            gross_profit = unit_gross_profit * q_max
-            extra_distance_km = (D_AWb + D_WbWs + D_WsB) - D_AB
-            transport_cost = extra_distance_km * cost_per_km_per_kg * (q_max * wb["unit_weight"])
-            net_profit = gross_profit - transport_cost
-            unit_profit_per_kg = unit_gross_profit / wb["unit_weight"]
-
-            if net_profit <= 0:
-                print(f"Skipping pair {wb['warehouse_id']} -> {ws['warehouse_id']} due to non-profitable trade.")
-                net_profit_count += 1
-                continue  # not profitable
-
-            profitable_pairs.append({
-                "buy_warehouse_id": wb["warehouse_id"],
-                "sell_warehouse_id": ws["warehouse_id"],
-                "item_id": wb["item_id"],
-                "traded_quantity": q_max,
-                "gross_profit": gross_profit,
-                "net_profit": net_profit,
-                "transport_cost": transport_cost,
-                "unit_profit_per_kg": unit_profit_per_kg,
-                "T_AWb": T_AWb,
-                "T_WbWs": T_WbWs,
-                "T_WsB": T_WsB,
-                "D_AWb": D_AWb,
-                "D_WbWs": D_WbWs,
-                "D_WsB": D_WsB,
-                "extra_distance_km": extra_distance_km,
-                "total_trip_time": T_total
-            })
-
-    # Sort descending by net profit
-    profitable_pairs.sort(key=lambda x: x["net_profit"], reverse=True)
-
-    print(f"Total pairs found: {len(profitable_pairs)}")
-    print(f"Pairs exceeding time limit: {t_max_count}")
-    print(f"Pairs with insufficient quantity: {q_max_count}")
-    print(f"Pairs with non-profitable trades: {net_profit_count}")
-    # Return top 30
-    return profitable_pairs[:30]
+def road_legs(
+    candidates: CandidateArrays,
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+) -> Optional[MatrixLegs]:
+    """Road legs from the routing provider, or None (haversine) if routing fails."""
+    try:
+        with span("matrix_build"):
+            matrix = generate_warehouse_distance_matrix(candidates.warehouse_points(), start_location, end_location)
+        return MatrixLegs(candidates, matrix, start_location, end_location)
+    except Exception as exc:
+        ROUTING_FALLBACKS.inc()
+        if sampled(logger):
+            logger.debug("Routing matrix unavailable (%s), using straight-line legs", exc)
+        return None
+
+
+def estimated_legs(
+    candidates: CandidateArrays,
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+) -> Optional[ModelLegs]:
+    """Legs from the calibrated travel model if one is configured, else None (haversine)."""
+    model = get_travel_model()
+    if model is None:
+        return None
+    return ModelLegs(candidates, model, start_location, end_location)
+
+
+def build_legs(
+    candidates: CandidateArrays,
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+) -> Optional[HaversineLegs]:
+    """
+    Road legs when USE_ROAD_TIMES is set and routing works, else travel
+    model estimates, else None (haversine).
+    """
+    if USE_ROAD_TIMES:
+        legs = road_legs(candidates, start_location, end_location)
+        if legs is not None:
+            return legs
+    return estimated_legs(candidates, start_location, end_location)
+
+
+def shortlist_rows(candidates: CandidateArrays, pairs: List[Dict]) -> CandidateArrays:
+    """Candidate rows that are the buy or sell side of one of pairs."""
+    if not pairs:
+        return candidates.take(np.zeros(len(candidates), dtype=bool))
+    # (warehouse_id, item_id) as one int64 key per row
+    stride = int(candidates.item_id.max()) + 1
+    keys = candidates.warehouse_id * stride + candidates.item_id
+    keep = [p["buy_warehouse_id"] * stride + p["item_id"] for p in pairs]
+    keep += [p["sell_warehouse_id"] * stride + p["item_id"] for p in pairs]
+    return candidates.take(np.isin(keys, keep))
+
+
+def _as_arrays(warehouses: Union[List[Dict], CandidateArrays]) -> CandidateArrays:
+    return warehouses if isinstance(warehouses, CandidateArrays) else CandidateArrays.from_rows(warehouses)
+
+
+def _shortlist(candidates, legs, start_location, end_location,
+               t_max, cost_per_km_per_kg, max_truck_weight_kg) -> CandidateArrays:
+    # Rank on estimated legs; only the rows behind the best pairs get routed
+    with span("shortlist"):
+        pairs, _ = score_pairs_parallel(
+            candidates,
+            start_location,
+            end_location,
+            t_max=t_max,
+            cost_per_km_per_kg=cost_per_km_per_kg,
+            max_truck_weight_kg=max_truck_weight_kg,
+            top_k=ROUTING_SHORTLIST_PAIRS,
+            legs=legs,
+        )
+    return shortlist_rows(candidates, pairs)
+
+
+def _rank(candidates, legs, start_location, end_location, t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k):
+    # Road legs from the routing matrix, else estimated ones, else haversine at 25 km/h
+    with span("scoring"):
+        profitable_pairs, stats = score_pairs_parallel(
+            candidates,
+            start_location,
+            end_location,
+            t_max=t_max,
+            cost_per_km_per_kg=cost_per_km_per_kg,
+            max_truck_weight_kg=max_truck_weight_kg,
+            top_k=top_k,
+            legs=legs,
+        )
+
+    # Skip reasons go to counters; full stats only for a sample of requests
+    record_scoring_stats(stats)
+    if sampled(logger):
+        logger.debug("Scored %d candidates (%s): %s",
+                     len(candidates), type(legs).__name__ if legs is not None else "HaversineLegs", stats)
+    # Top pairs from the bounded heap, sorted by descending net profit
+    return profitable_pairs
+
+
+def rank_candidates(
+    warehouses: Union[List[Dict], CandidateArrays],
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    t_max: float,
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    top_k: int = TOP_K,
+) -> List[Dict]:
+    """Scores already loaded candidate rows (dicts or CandidateArrays) and returns the top_k pairs."""
+    candidates = _as_arrays(warehouses)
+    if not len(candidates):
+        return []  # No warehouses found
 
+    estimate = estimated_legs(candidates, start_location, end_location)
+    if USE_ROAD_TIMES and estimate is not None:
+        candidates = _shortlist(candidates, estimate, start_location, end_location,
+                                t_max, cost_per_km_per_kg, max_truck_weight_kg)
+        if not len(candidates):
+            return []
+
+    legs = build_legs(candidates, start_location, end_location)
+    return _rank(candidates, legs, start_location, end_location,
+                 t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k)
+
+
+def iter_ranked_candidates(
+    warehouses: Union[List[Dict], CandidateArrays],
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    t_max: float,
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    top_k: int = TOP_K,
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Progressive rank_candidates: yields ("haversine", pairs) straight away
+    (("estimate", pairs) when a travel model is configured), then ("road",
+    pairs) re-scored on road distances/times once the routing matrix is in.
+    With a travel model only the shortlisted warehouses are routed. The road
+    update is skipped if routing is unavailable.
+    """
+    candidates = _as_arrays(warehouses)
+    if not len(candidates):
+        yield "haversine", []
+        return
+
+    estimate = estimated_legs(candidates, start_location, end_location)
+    yield ("haversine" if estimate is None else "estimate"), _rank(
+        candidates, estimate, start_location, end_location,
+        t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k,
+    )
 
+    if estimate is not None:
+        candidates = _shortlist(candidates, estimate, start_location, end_location,
+                                t_max, cost_per_km_per_kg, max_truck_weight_kg)
+        if not len(candidates):
+            return
 
+    legs = road_legs(candidates, start_location, end_location)
+    if legs is not None:
+        yield "road", _rank(candidates, legs, start_location, end_location,
+                            t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k)
 
 
+def find_profitable_pairs(
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    t_max: float,
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    curr_truck_weight_kg: float,
+    db: Optional[Session] = None,
+) -> List[Dict]:
+    """
+    Returns up to 30 most profitable buy-sell warehouse pairs.
+    
+    Args:
+        start_location: (lat, lon) of A.
+        end_location: (lat, lon) of B.
+        t_max: max trip time (hours).
+        cost_per_km_per_kg: transport cost per km per kg.
+        max_truck_weight_kg: truck capacity in kg.
+        db: session to query with; a pooled one is opened if omitted.
+        
+    Returns:
+        List of profitable pairs sorted by descending net profit.
+    """
+    # Precomputed pairs, when built; they are priced on straight-line legs only
+    pair_index = get_pair_index() if not USE_ROAD_TIMES and get_travel_model() is None else None
+    if pair_index is not None:
+        with span("scoring"):
+            pairs, stats = pair_index.score(
+                start_location, end_location, t_max, cost_per_km_per_kg, max_truck_weight_kg,
+                top_k=TOP_K, max_detour_meters=MAX_DETOUR_METERS,
+            )
+        record_scoring_stats(stats)
+        return pairs
+
+    candidates = load_candidate_arrays(start_location, end_location, cost_per_km_per_kg, max_truck_weight_kg, db=db)
+    return rank_candidates(
+        candidates, start_location, end_location, t_max, cost_per_km_per_kg, max_truck_weight_kg
+    )
@@ -0,0 +1,364 @@
+# pair_index.py
+
+import os
+import logging
+import threading
+from math import cos, radians
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .geo_utils import haversine_km_np
+from .scoring import FALLBACK_SPEED_KMH, new_stats
+from app.db.warehouse_index import WarehouseIndex, get_warehouse_index
+
+logger = logging.getLogger(__name__)
+
+PAIR_INDEX_ENABLED = os.getenv("PAIR_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+# Longest supplier → demander leg kept in the index
+PAIR_MAX_KM = float(os.getenv("PAIR_INDEX_MAX_KM", "150"))
+# Demanders kept per supplier and item, by offline score
+PAIRS_PER_SUPPLIER = int(os.getenv("PAIR_INDEX_PER_SUPPLIER", "20"))
+# Cost per km per kg the offline score charges the supplier → demander leg at
+REFERENCE_COST_PER_KM_PER_KG = float(os.getenv("PAIR_INDEX_REFERENCE_COST", "0.001"))
+# How often the background job applies inventory changes
+REFRESH_SECONDS = float(os.getenv("PAIR_INDEX_REFRESH_SECONDS", "5"))
+
+# Suppliers per distance block while building
+SUPPLIER_CHUNK = 256
+
+
+class ItemPairs:
+    """
+    One item's (supplier, demander) pairs as warehouse positions, sorted by
+    supplier, with CSR offsets over every warehouse position so the pairs of
+    any supplier set are gathered without a scan.
+    """
+
+    __slots__ = ("buy", "sell", "d_km", "offsets")
+
+    def __init__(self, buy: np.ndarray, sell: np.ndarray, d_km: np.ndarray, n_warehouses: int):
+        order = np.argsort(buy, kind="stable")
+        self.buy, self.sell, self.d_km = buy[order], sell[order], d_km[order]
+        self.offsets = np.searchsorted(self.buy, np.arange(n_warehouses + 1))
+
+    def __len__(self):
+        return len(self.buy)
+
+    def rows_of(self, suppliers: np.ndarray) -> np.ndarray:
+        """Row indices of the pairs of the given supplier positions."""
+        start = self.offsets[suppliers]
+        lens = self.offsets[suppliers + 1] - start
+        total = int(lens.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        before = np.concatenate(([0], np.cumsum(lens)[:-1]))
+        return np.arange(total) + np.repeat(start - before, lens)
+
+
+class PairIndex:
+    """
+    Precomputed supplier → demander pairs per item over a WarehouseIndex.
+
+    Every supplier keeps its PAIRS_PER_SUPPLIER best demanders within
+    PAIR_MAX_KM, ranked by margin * quantity less the cost of the leg
+    between them at REFERENCE_COST_PER_KM_PER_KG, with that leg's length.
+    A request then only gathers the pairs of the suppliers in its corridor
+    (the warehouse grid buckets them) and prices the A→Wb and Ws→B legs,
+    instead of crossing every supplier with every demander.
+
+    Quantities are read live from the warehouse index when scoring, so
+    inventory changes only affect which pairs exist; refresh() recomputes
+    the suppliers near changed warehouses.
+    """
+
+    def __init__(self, index: WarehouseIndex, items: Dict[int, ItemPairs]):
+        self.index = index
+        self.items = items
+
+    def __len__(self):
+        return sum(len(p) for p in self.items.values())
+
+    @classmethod
+    def build(cls, index: WarehouseIndex) -> "PairIndex":
+        # Changes from here on are picked up by the next refresh
+        index.track_changes = True
+        items = {}
+        for item_id, (positions, quantity) in list(index.by_item.items()):
+            if item_id in index.items:
+                items[item_id] = ItemPairs(*_item_pairs(index, item_id, positions[quantity > 0]), len(index))
+        return cls(index, items)
+
+    def refresh(self, changes: Dict[int, np.ndarray]) -> int:
+        """
+        Recomputes, for each changed item, the suppliers within PAIR_MAX_KM
+        of a changed warehouse (their best demanders may have changed) and
+        the changed warehouses themselves. Returns the suppliers recomputed.
+        """
+        index = self.index
+        recomputed = 0
+        for item_id, changed in changes.items():
+            if item_id not in index.items:
+                continue
+            positions, quantity = index.by_item.get(item_id, (np.empty(0, np.int64), np.empty(0)))
+            suppliers = positions[quantity > 0]
+            affected = np.union1d(changed, suppliers[_near(index, suppliers, changed)])
+
+            buy, sell, d_km = _item_pairs(index, item_id, affected[np.isin(affected, suppliers)])
+            old = self.items.get(item_id)
+            if old is not None:
+                keep = ~np.isin(old.buy, affected)
+                buy = np.concatenate((old.buy[keep], buy))
+                sell = np.concatenate((old.sell[keep], sell))
+                d_km = np.concatenate((old.d_km[keep], d_km))
+            self.items[item_id] = ItemPairs(buy, sell, d_km, len(index))
+            recomputed += len(affected)
+        return recomputed
+
+    def score(
+        self,
+        start_location: Tuple[float, float],
+        end_location: Tuple[float, float],
+        t_max: float,
+        cost_per_km_per_kg: float,
+        max_truck_weight_kg: float,
+        top_k: int,
+        max_detour_meters: float,
+    ) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        score_pairs over the indexed pairs with both ends in the corridor,
+        on straight-line legs. Same pair fields and stats; nothing is pruned.
+        """
+        index = self.index
+        (a_lat, a_lon), (b_lat, b_lon) = start_location, end_location
+        # Sorted corridor positions; membership and per-warehouse legs are
+        # looked up by binary search, so nothing here is sized by the dataset
+        corridor = index.corridor(a_lat, a_lon, b_lat, b_lon, max_detour_meters)
+        if not len(corridor):
+            return [], new_stats()
+
+        parts = []
+        for item_id, pairs in list(self.items.items()):
+            item = index.items.get(item_id)
+            if item is None:
+                continue
+            rows = pairs.rows_of(corridor)
+            rows = rows[_contains(corridor, pairs.sell[rows])]
+            if not len(rows):
+                continue
+            buy, sell = pairs.buy[rows], pairs.sell[rows]
+            # Live quantities of just the gathered ends
+            positions, quantity = index.by_item.get(item_id, (np.empty(0, np.int64), np.empty(0)))
+            q_buy, q_sell = _quantities(positions, quantity, buy), _quantities(positions, quantity, sell)
+            ok = (q_buy > 0) & (q_sell < 0)
+            n = int(np.count_nonzero(ok))
+            parts.append((
+                buy[ok], sell[ok], pairs.d_km[rows][ok], q_buy[ok], -q_sell[ok], np.full(n, item_id),
+                *(np.full(n, item[f], dtype=np.float64) for f in ("unit_weight", "buy_price", "sell_price")),
+            ))
+
+        stats = new_stats()
+        if not parts:
+            return [], stats
+        buy, sell, D_WbWs, q_buy, q_sell, item_id, unit_weight, buy_price, sell_price = (
+            np.concatenate(col) for col in zip(*parts)
+        )
+        stats["pairs_total"] = len(buy)
+
+        q_max = np.floor(np.minimum(np.minimum(q_buy, q_sell), max_truck_weight_kg / unit_weight))
+        unit_gross_profit = np.abs(sell_price - buy_price)
+        gross_profit = unit_gross_profit * q_max
+
+        # A→W and W→B once per corridor warehouse, then gathered per pair
+        D_AB = float(haversine_km_np(a_lat, a_lon, b_lat, b_lon))
+        D_A = haversine_km_np(a_lat, a_lon, index.lat[corridor], index.lon[corridor])
+        D_B = haversine_km_np(index.lat[corridor], index.lon[corridor], b_lat, b_lon)
+        D_AWb, D_WsB = D_A[np.searchsorted(corridor, buy)], D_B[np.searchsorted(corridor, sell)]
+        T_AWb, T_WbWs, T_WsB = D_AWb / FALLBACK_SPEED_KMH, D_WbWs / FALLBACK_SPEED_KMH, D_WsB / FALLBACK_SPEED_KMH
+        T_total = T_AWb + T_WbWs + T_WsB
+
+        extra_distance_km = np.maximum((D_AWb + D_WbWs + D_WsB) - D_AB, 0.0)
+        transport_cost = extra_distance_km * cost_per_km_per_kg * (q_max * unit_weight)
+        net_profit = gross_profit - transport_cost
+
+        time_ok = T_total <= t_max
+        qty_ok = time_ok & (q_max > 0)
+        keep = qty_ok & (net_profit > 0)
+        stats["t_max_count"] = int(np.count_nonzero(~time_ok))
+        stats["q_max_count"] = int(np.count_nonzero(time_ok & ~qty_ok))
+        stats["net_profit_count"] = int(np.count_nonzero(qty_ok & ~keep))
+        stats["profitable_count"] = int(np.count_nonzero(keep))
+
+        kept = np.nonzero(keep)[0]
+        if len(kept) > top_k:
+            kept = kept[np.argpartition(-net_profit[kept], top_k - 1)[:top_k]]
+        best = kept[np.lexsort((kept, -net_profit[kept]))]
+        return [
+            {
+                "buy_warehouse_id": int(index.warehouse_ids[buy[k]]),
+                "sell_warehouse_id": int(index.warehouse_ids[sell[k]]),
+                "item_id": int(item_id[k]),
+                "traded_quantity": int(q_max[k]),
+                "gross_profit": float(gross_profit[k]),
+                "net_profit": float(net_profit[k]),
+                "transport_cost": float(transport_cost[k]),
+                "unit_profit_per_kg": float(unit_gross_profit[k] / unit_weight[k]),
+                "T_AWb": float(T_AWb[k]),
+                "T_WbWs": float(T_WbWs[k]),
+                "T_WsB": float(T_WsB[k]),
+                "D_AWb": float(D_AWb[k]),
+                "D_WbWs": float(D_WbWs[k]),
+                "D_WsB": float(D_WsB[k]),
+                "extra_distance_km": float(extra_distance_km[k]),
+                "total_trip_time": float(T_total[k]),
+            }
+            for k in best
+        ], stats
+
+
+def _quantities(positions: np.ndarray, quantity: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Current quantity at each queried position of one item (0 if it has no row)."""
+    if not len(positions):
+        return np.zeros(len(query))
+    at = np.minimum(np.searchsorted(positions, query), len(positions) - 1)
+    return np.where(positions[at] == query, quantity[at], 0.0)
+
+
+def _contains(sorted_positions: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Mask over query: present in sorted_positions (non-empty)."""
+    at = np.minimum(np.searchsorted(sorted_positions, query), len(sorted_positions) - 1)
+    return sorted_positions[at] == query
+
+
+def _cell_keys(lat, lon, cell_lat, cell_lon):
+    row = np.floor((lat + 90) / cell_lat).astype(np.int64)
+    col = np.floor((lon + 180) / cell_lon).astype(np.int64)
+    return row * 1_000_000 + col
+
+
+def _pair_grid(index: WarehouseIndex) -> Tuple[float, float]:
+    """Cell sizes (deg) at least PAIR_MAX_KM across, so pairs span at most one cell."""
+    cell_lat = PAIR_MAX_KM / 111.0
+    max_lat = float(np.abs(index.lat).max()) if len(index) else 0.0
+    return cell_lat, cell_lat / max(cos(radians(min(max_lat, 85.0))), 0.05)
+
+
+def _item_pairs(index: WarehouseIndex, item_id: int, suppliers: np.ndarray):
+    """(buy, sell, d_km) rows of the given supplier positions of one item."""
+    empty = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0))
+    positions, quantity = index.by_item.get(item_id, (np.empty(0, np.int64), np.empty(0)))
+    demand = quantity < 0
+    if not len(suppliers) or not demand.any():
+        return empty
+    item = index.items[item_id]
+    margin = abs(item["sell_price"] - item["buy_price"])
+    unit_weight = item["unit_weight"]
+
+    demanders, demand_q = positions[demand], -quantity[demand]
+    supply_q = _quantities(positions, quantity, suppliers)
+    cell_lat, cell_lon = _pair_grid(index)
+    d_keys = _cell_keys(index.lat[demanders], index.lon[demanders], cell_lat, cell_lon)
+    d_order = np.argsort(d_keys, kind="stable")
+    d_keys = d_keys[d_order]
+    s_keys = _cell_keys(index.lat[suppliers], index.lon[suppliers], cell_lat, cell_lon)
+    block = np.array([dr * 1_000_000 + dc for dr in (-1, 0, 1) for dc in (-1, 0, 1)])
+
+    out = []
+    for key in np.unique(s_keys):
+        keys = key + block
+        lo, hi = np.searchsorted(d_keys, keys, "left"), np.searchsorted(d_keys, keys, "right")
+        near = d_order[np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])]
+        if not len(near):
+            continue
+        sup = np.nonzero(s_keys == key)[0]
+        k = min(PAIRS_PER_SUPPLIER, len(near))
+        for c in range(0, len(sup), SUPPLIER_CHUNK):
+            rows = sup[c:c + SUPPLIER_CHUNK]
+            d = haversine_km_np(
+                index.lat[suppliers[rows]][:, None], index.lon[suppliers[rows]][:, None],
+                index.lat[demanders[near]][None, :], index.lon[demanders[near]][None, :],
+            )
+            q = np.minimum(supply_q[rows][:, None], demand_q[near][None, :])
+            score = q * (margin - REFERENCE_COST_PER_KM_PER_KG * d * unit_weight)
+            score[(d > PAIR_MAX_KM) | (score <= 0)] = -np.inf
+
+            top = np.argpartition(-score, k - 1, axis=1)[:, :k]
+            live = np.isfinite(np.take_along_axis(score, top, axis=1))
+            r, t = np.nonzero(live)
+            cols = top[r, t]
+            out.append((suppliers[rows[r]], demanders[near[cols]], d[r, cols]))
+
+    if not out:
+        return empty
+    return tuple(np.concatenate(col) for col in zip(*out))
+
+
+def _near(index: WarehouseIndex, positions: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Mask over positions: within PAIR_MAX_KM of any target."""
+    mask = np.zeros(len(positions), dtype=bool)
+    for c in range(0, len(targets), 64):
+        t = targets[c:c + 64]
+        d = haversine_km_np(
+            index.lat[t][:, None], index.lon[t][:, None],
+            index.lat[positions][None, :], index.lon[positions][None, :],
+        )
+        mask |= (d <= PAIR_MAX_KM).any(axis=0)
+    return mask
+
+
+_pair_index: Optional[PairIndex] = None
+_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def get_pair_index() -> Optional[PairIndex]:
+    """The pair index if it is built over the loaded warehouse index, else None."""
+    pair_index = _pair_index
+    if pair_index is None or pair_index.index is not get_warehouse_index():
+        return None
+    return pair_index
+
+
+def refresh_pair_index() -> Optional[PairIndex]:
+    """
+    Brings the pair index up to date: rebuilds it when the warehouse index
+    was swapped (or dropped), else applies the changes tracked since the
+    last call.
+    """
+    global _pair_index
+    with _lock:
+        index = get_warehouse_index()
+        pair_index = _pair_index
+        if index is None:
+            _pair_index = None
+        elif pair_index is None or pair_index.index is not index:
+            _pair_index = PairIndex.build(index)
+            logger.info("Built pair index: %d pairs over %d warehouses", len(_pair_index), len(index))
+        else:
+            changes = index.take_changes()
+            if changes:
+                pair_index.refresh(changes)
+        return _pair_index
+
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh_pair_index()
+        except Exception:
+            logger.exception("Pair index refresh failed")
+        if _stop.wait(REFRESH_SECONDS):
+            return
+
+
+def start_pair_index_refresher():
+    """Builds the pair index in the background and keeps it following inventory changes."""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    _stop.clear()
+    _refresher = threading.Thread(target=_refresh_loop, name="pair-index-refresher", daemon=True)
+    _refresher.start()
+
+
+def stop_pair_index_refresher():
+    _stop.set()
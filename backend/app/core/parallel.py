@@ -0,0 +1,184 @@
+# parallel.py
+
+import os
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .geo_utils import DistanceMatrix
+from .scoring import (
+    CANDIDATE_FIELDS, CandidateArrays, HaversineLegs, MatrixLegs, TopK,
+    new_stats, plan_blocks, score_blocks, score_pairs,
+)
+from .travel_model import ModelLegs, TravelModel
+
+logger = logging.getLogger(__name__)
+
+# Scoring processes shared by all requests; 0 or 1 scores in the request thread
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "0"))
+# Smaller problems are scored serially: below this, IPC costs more than it saves
+PARALLEL_MIN_PAIRS = int(os.getenv("PARALLEL_MIN_PAIRS", "500000"))
+
+# (name, dtype, shape, byte offset) per array in a shared block
+Layout = List[Tuple[str, str, Tuple[int, ...], int]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: the API process has threads, which fork does not copy safely
+            _pool = ProcessPoolExecutor(max_workers=SCORING_WORKERS, mp_context=get_context("forkserver"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+class SharedArrays:
+    """Arrays copied once into a shared-memory block that workers map by name."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        arrays = {k: np.ascontiguousarray(v) for k, v in arrays.items()}
+        self.layout: Layout = []
+        offset = 0
+        for name, a in arrays.items():
+            self.layout.append((name, a.dtype.str, a.shape, offset))
+            offset += -(-a.nbytes // 8) * 8  # keep every array 8-byte aligned
+        self.shm = SharedMemory(create=True, size=max(offset, 1))
+        for (name, _, _, at), a in zip(self.layout, arrays.values()):
+            _view(self.shm, a.dtype.str, a.shape, at)[...] = a
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _view(shm: SharedMemory, dtype: str, shape, offset: int) -> np.ndarray:
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+
+def score_pairs_parallel(
+    candidates: CandidateArrays,
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    t_max: float,
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    top_k: int = 30,
+    legs: Optional[HaversineLegs] = None,
+) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    score_pairs, sharded across the process pool when SCORING_WORKERS > 1
+    and the problem has at least PARALLEL_MIN_PAIRS pairs. Legs types the
+    workers cannot rebuild (anything but haversine, matrix and travel
+    model legs) are scored serially.
+
+    The buy blocks are dealt round-robin in bound order, so every shard
+    starts with high-bound blocks and prunes as it goes. Candidate columns
+    (and the road matrix, for MatrixLegs) are placed in shared memory once
+    per call; each worker keeps its own top_k, and the shard heaps are
+    merged at the end. The result is the serial one; the pruned and skip
+    counters can differ, as each shard prunes against its own threshold.
+    """
+    if SCORING_WORKERS <= 1 or (legs is not None and type(legs) not in (HaversineLegs, MatrixLegs, ModelLegs)):
+        return score_pairs(candidates, start_location, end_location, t_max,
+                           cost_per_km_per_kg, max_truck_weight_kg, top_k, legs)
+    if legs is None:
+        legs = HaversineLegs(candidates, start_location, end_location)
+    D_AB, _ = legs.source_to_dest()
+
+    stats = new_stats()
+    top = TopK(top_k, floor=0.0)
+    blocks = plan_blocks(candidates, max_truck_weight_kg, stats)
+    n_shards = min(SCORING_WORKERS, len(blocks))
+    if stats["pairs_total"] < PARALLEL_MIN_PAIRS or n_shards <= 1:
+        score_blocks(candidates, legs, blocks, D_AB, t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats)
+        return top.items(), stats
+
+    arrays = {f: getattr(candidates, f) for f in CANDIDATE_FIELDS}
+    if isinstance(legs, MatrixLegs):
+        arrays.update(
+            matrix_ids=legs.matrix.warehouse_ids,
+            distances=legs.matrix.distances,
+            durations=legs.matrix.durations,
+        )
+    elif isinstance(legs, ModelLegs):
+        arrays.update(
+            model_bbox=np.array(legs.model.bbox),
+            model_cell_deg=np.array([legs.model.cell_deg]),
+            model_detour=legs.model.detour,
+            model_speed_kmh=legs.model.speed_kmh,
+        )
+    shared = SharedArrays(arrays)
+    try:
+        futures = [
+            get_pool().submit(
+                _score_shard, shared.name, shared.layout, blocks[k::n_shards],
+                start_location, end_location, D_AB, t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k,
+            )
+            for k in range(n_shards)
+        ]
+        for future in futures:
+            shard_top, shard_stats = future.result()
+            top.merge(shard_top)
+            for key, value in shard_stats.items():
+                stats[key] += value
+    except BrokenProcessPool:
+        logger.warning("Scoring pool died; restarting it and scoring this request serially")
+        shutdown_pool()
+        stats = new_stats()
+        top = TopK(top_k, floor=0.0)
+        blocks = plan_blocks(candidates, max_truck_weight_kg, stats)
+        score_blocks(candidates, legs, blocks, D_AB, t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats)
+    finally:
+        shared.close()
+    return top.items(), stats
+
+
+def _score_shard(name, layout, blocks, start_location, end_location, D_AB,
+                 t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k):
+    shm = SharedMemory(name=name)
+    try:
+        return _score_views(shm, layout, blocks, start_location, end_location, D_AB,
+                            t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k)
+    finally:
+        # Views into the block are gone once _score_views returns
+        shm.close()
+
+
+def _score_views(shm, layout, blocks, start_location, end_location, D_AB,
+                 t_max, cost_per_km_per_kg, max_truck_weight_kg, top_k):
+    arrays = {name: _view(shm, dtype, shape, offset) for name, dtype, shape, offset in layout}
+    candidates = CandidateArrays.from_sorted(**{f: arrays[f] for f in CANDIDATE_FIELDS})
+    if "distances" in arrays:
+        matrix = DistanceMatrix(arrays["matrix_ids"], arrays["distances"], arrays["durations"])
+        legs = MatrixLegs(candidates, matrix, start_location, end_location)
+    elif "model_detour" in arrays:
+        model = TravelModel(arrays["model_bbox"], float(arrays["model_cell_deg"][0]),
+                            arrays["model_detour"], arrays["model_speed_kmh"])
+        legs = ModelLegs(candidates, model, start_location, end_location)
+    else:
+        legs = HaversineLegs(candidates, start_location, end_location)
+
+    stats = new_stats()
+    top = TopK(top_k, floor=0.0)
+    score_blocks(candidates, legs, blocks, D_AB, t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats)
+    del stats["pairs_total"]  # counted once, by the caller
+    return top, stats
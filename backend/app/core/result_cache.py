@@ -0,0 +1,109 @@
+# result_cache.py
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class ResultCache:
+    """
+    LRU + TTL cache of /optimize responses.
+
+    Keys round the start/end coordinates to coord_decimals, so requests
+    from the same depots share one entry; t_max, cost and weights are
+    keyed exactly, as a hit is returned as-is and must not exceed the
+    caller's time or capacity limits. Each entry remembers the
+    inventory version it was computed against and is treated as a miss
+    once that version moves on.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 300,
+        coord_decimals: int = 3,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.coord_decimals = coord_decimals
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "stale": 0}
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024")),
+            ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300")),
+            coord_decimals=int(os.getenv("RESULT_CACHE_COORD_DECIMALS", "3")),
+        )
+
+    def key(
+        self,
+        start_location: Tuple[float, float],
+        end_location: Tuple[float, float],
+        t_max: float,
+        cost_per_km_per_kg: float,
+        max_truck_weight_kg: float,
+        curr_truck_weight_kg: float,
+        kind: str = "optimize",
+    ) -> Hashable:
+        d = self.coord_decimals
+        return (
+            kind,
+            round(start_location[0], d), round(start_location[1], d),
+            round(end_location[0], d), round(end_location[1], d),
+            float(t_max),
+            float(cost_per_km_per_kg),
+            float(max_truck_weight_kg),
+            float(curr_truck_weight_kg),
+        )
+
+    def get(self, key: Hashable, version: int) -> Optional[object]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            created, entry_version, value = entry
+            if entry_version != version:
+                self.stats["stale"] += 1
+            elif now - created > self.ttl_seconds:
+                self.stats["expired"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: Hashable, version: int, value: object):
+        with self._lock:
+            self._entries[key] = (time.time(), version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+result_cache = ResultCache.from_env()
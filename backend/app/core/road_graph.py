@@ -0,0 +1,380 @@
+# road_graph.py
+
+"""
+Local road-network routing: a directed road graph in CSR arrays with a
+contraction hierarchy (CH) over travel time, answering many-to-many
+matrices in-process instead of calling OpenRouteService.
+
+Graph files are .npz archives with
+    lat, lon                 node coordinates (float64, one per node)
+    indptr                   CSR offsets (n + 1); edges of node u are indptr[u]:indptr[u + 1]
+    head                     edge target node
+    duration_s, distance_m   edge travel time and length
+plus, once prepared, the CH arrays (rank, up_*, down_*). Converting an OSM
+extract to these arrays is left to external tooling (e.g. osmium or pyrosm);
+preparing the hierarchy is done once, offline (from backend/):
+    python -m app.core.road_graph roads.npz roads.ch.npz
+"""
+
+import os
+import heapq
+import logging
+import argparse
+from math import cos, inf, radians
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .geo_utils import haversine_km_np
+from .routing import DEFAULT_PROFILE, RoutingProvider
+
+logger = logging.getLogger(__name__)
+
+# Locations farther than this from every node are unroutable (NaN)
+SNAP_MAX_METERS = float(os.getenv("ROUTING_SNAP_MAX_METERS", "5000"))
+# Speed assumed on the straight line between a location and its node
+SNAP_SPEED_KMH = float(os.getenv("ROUTING_SNAP_SPEED_KMH", "20"))
+
+# Nodes settled per witness search while contracting; lower builds faster
+# but adds shortcuts that a full search would have found unnecessary
+WITNESS_SETTLE_LIMIT = int(os.getenv("ROUTING_CH_WITNESS_LIMIT", "500"))
+# Largest graph prepared or served. Contraction and queries run in pure
+# Python: a city or district extract is fine, a country-wide one is not
+# (route those through ORS or an external engine instead)
+MAX_GRAPH_NODES = int(os.getenv("ROUTING_GRAPH_MAX_NODES", "250000"))
+
+CH_ARRAYS = (
+    "rank",
+    "up_indptr", "up_head", "up_duration_s", "up_distance_m",
+    "down_indptr", "down_head", "down_duration_s", "down_distance_m",
+)
+
+Adjacency = List[List[Tuple[int, float, float]]]  # node -> [(node, duration_s, distance_m)]
+
+
+class RoadGraph:
+    """
+    Road graph plus its contraction hierarchy. Nodes are contracted in
+    order of rank; the upward graph keeps each node's edges to higher-ranked
+    nodes and the downward graph, stored reversed, the edges arriving from
+    them. A shortest path always climbs then descends in rank, so a query
+    only searches upward from both ends.
+    """
+
+    def __init__(
+        self,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        indptr: np.ndarray,
+        head: np.ndarray,
+        duration_s: np.ndarray,
+        distance_m: np.ndarray,
+        ch: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.head = np.asarray(head, dtype=np.int64)
+        self.duration_s = np.asarray(duration_s, dtype=np.float64)
+        self.distance_m = np.asarray(distance_m, dtype=np.float64)
+        self.ch = ch
+        self._views: Optional[Dict[str, memoryview]] = None
+        self._build_snap_grid()
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_edges(cls, lat, lon, tail, head, distance_m, duration_s) -> "RoadGraph":
+        """Builds the CSR arrays from an edge list (one entry per direction)."""
+        tail = np.asarray(tail, dtype=np.int64)
+        head = np.asarray(head, dtype=np.int64)
+        order = np.lexsort((head, tail))
+        counts = np.bincount(tail, minlength=len(lat))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return cls(lat, lon, indptr, head[order],
+                   np.asarray(duration_s)[order], np.asarray(distance_m)[order])
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with np.load(path) as z:
+            ch = {k: z[k] for k in CH_ARRAYS} if "rank" in z else None
+            return cls(z["lat"], z["lon"], z["indptr"], z["head"], z["duration_s"], z["distance_m"], ch=ch)
+
+    def save(self, path: str):
+        arrays = dict(
+            lat=self.lat, lon=self.lon, indptr=self.indptr, head=self.head,
+            duration_s=self.duration_s, distance_m=self.distance_m,
+        )
+        np.savez(path, **arrays, **(self.ch or {}))
+
+    # --- snapping -------------------------------------------------------
+
+    def _build_snap_grid(self):
+        max_lat = float(np.abs(self.lat).max()) if len(self.lat) else 0.0
+        # Cells at least SNAP_MAX_METERS wide, so the 3x3 block around a
+        # location holds every node it may snap to
+        self.snap_cell_deg = SNAP_MAX_METERS / 111_000 / max(cos(radians(min(max_lat, 85.0))), 0.05)
+        self._snap_cols = int(360 / self.snap_cell_deg) + 2
+        keys = self._cell_keys(self.lat, self.lon)
+        self._snap_order = np.argsort(keys, kind="stable")
+        self._snap_keys = keys[self._snap_order]
+
+    def _cell_keys(self, lat, lon):
+        row = np.floor((np.asarray(lat) + 90) / self.snap_cell_deg).astype(np.int64)
+        col = np.floor((np.asarray(lon) + 180) / self.snap_cell_deg).astype(np.int64)
+        return row * self._snap_cols + col
+
+    def snap(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest node per location and the distance to it (m); -1 when none is within SNAP_MAX_METERS."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        nodes = np.full(len(lat), -1, dtype=np.int64)
+        offsets = np.full(len(lat), np.nan)
+        centers = self._cell_keys(lat, lon)
+        block = np.array([dr * self._snap_cols + dc for dr in (-1, 0, 1) for dc in (-1, 0, 1)])
+        for k in range(len(lat)):
+            keys = centers[k] + block
+            lo = np.searchsorted(self._snap_keys, keys, side="left")
+            hi = np.searchsorted(self._snap_keys, keys, side="right")
+            near = np.concatenate([self._snap_order[a:b] for a, b in zip(lo, hi)])
+            if not len(near):
+                continue
+            d = haversine_km_np(lat[k], lon[k], self.lat[near], self.lon[near]) * 1000
+            best = int(np.argmin(d))
+            if d[best] <= SNAP_MAX_METERS:
+                nodes[k], offsets[k] = near[best], d[best]
+        return nodes, offsets
+
+    # --- contraction hierarchy -------------------------------------------
+
+    def prepare(self):
+        """
+        Contracts the graph (CH over duration_s; distance_m rides along as
+        the length of the fastest path). Node order is by edge difference
+        with lazy updates; witness searches are capped at
+        WITNESS_SETTLE_LIMIT settled nodes.
+        """
+        n = len(self)
+        if n > MAX_GRAPH_NODES:
+            raise ValueError(f"road graph has {n:,} nodes; ROUTING_GRAPH_MAX_NODES is {MAX_GRAPH_NODES:,}")
+        out: List[Dict[int, Tuple[float, float]]] = [{} for _ in range(n)]
+        inn: List[Dict[int, Tuple[float, float]]] = [{} for _ in range(n)]
+        tails = np.repeat(np.arange(n), np.diff(self.indptr))
+        for u, v, t, d in zip(tails.tolist(), self.head.tolist(), self.duration_s.tolist(), self.distance_m.tolist()):
+            if u != v and (v not in out[u] or t < out[u][v][0]):
+                out[u][v] = inn[v][u] = (t, d)
+
+        def witness_times(u, skip, limit):
+            best = {u: 0.0}
+            heap = [(0.0, u)]
+            settled = 0
+            while heap and settled < WITNESS_SETTLE_LIMIT:
+                t, x = heapq.heappop(heap)
+                if t > best[x]:
+                    continue
+                if t > limit:
+                    break
+                settled += 1
+                for y, (ty, _) in out[x].items():
+                    if y != skip and t + ty < best.get(y, inf):
+                        best[y] = t + ty
+                        heapq.heappush(heap, (t + ty, y))
+            return best
+
+        def shortcuts(v):
+            found = []
+            if not out[v]:
+                return found
+            max_out = max(t for t, _ in out[v].values())
+            for u, (tu, du) in inn[v].items():
+                reached = witness_times(u, v, tu + max_out)
+                for w, (tw, dw) in out[v].items():
+                    if w != u and reached.get(w, inf) > tu + tw:
+                        found.append((u, w, tu + tw, du + dw))
+            return found
+
+        deleted = [0] * n
+
+        def priority(v, added):
+            return len(added) - len(inn[v]) - len(out[v]) + deleted[v]
+
+        heap = [(priority(v, shortcuts(v)), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.zeros(n, dtype=np.int64)
+        up: Adjacency = [[] for _ in range(n)]
+        down: Adjacency = [[] for _ in range(n)]
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            added = shortcuts(v)
+            p = priority(v, added)
+            if heap and p > heap[0][0]:
+                heapq.heappush(heap, (p, v))
+                continue
+
+            rank[v] = order
+            order += 1
+            for w, (t, d) in out[v].items():
+                up[v].append((w, t, d))
+                del inn[w][v]
+                deleted[w] += 1
+            for u, (t, d) in inn[v].items():
+                down[v].append((u, t, d))
+                del out[u][v]
+                deleted[u] += 1
+            out[v], inn[v] = {}, {}
+            for u, w, t, d in added:
+                if w not in out[u] or t < out[u][w][0]:
+                    out[u][w] = inn[w][u] = (t, d)
+
+        self.ch = {"rank": rank, **_csr("up", up), **_csr("down", down)}
+        self._views = None
+
+    def _csr_views(self) -> Dict[str, memoryview]:
+        # Element access on a memoryview yields plain Python numbers without
+        # copying the arrays (which may be memory-mapped) into lists
+        if self._views is None:
+            self._views = {
+                k: memoryview(np.ascontiguousarray(self.ch[k]))
+                for k in CH_ARRAYS if k != "rank"
+            }
+        return self._views
+
+    def many_to_many(self, sources: np.ndarray, targets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (durations_s, distances_m) between node ids, inf where unreachable.
+        Bucket-based: one upward search per target leaves (target, time)
+        entries on the nodes it settles; one upward search per source then
+        meets them. Both searches stall on demand, so nodes reached on a
+        provably non-shortest path neither expand nor touch buckets.
+        """
+        if self.ch is None:
+            raise RuntimeError("RoadGraph.prepare() has not been run")
+        v = self._csr_views()
+        up = (v["up_indptr"], v["up_head"], v["up_duration_s"], v["up_distance_m"])
+        down = (v["down_indptr"], v["down_head"], v["down_duration_s"], v["down_distance_m"])
+
+        buckets: Dict[int, List[Tuple[int, float, float]]] = {}
+        for j, t in enumerate(np.asarray(targets).tolist()):
+            for node, (tt, dd) in _upward(down, up, t).items():
+                buckets.setdefault(node, []).append((j, tt, dd))
+
+        durations = np.full((len(sources), len(targets)), np.inf)
+        distances = np.full((len(sources), len(targets)), np.inf)
+        for i, s in enumerate(np.asarray(sources).tolist()):
+            row_t, row_d = durations[i], distances[i]
+            for node, (ts, ds) in _upward(up, down, s).items():
+                for j, tt, dd in buckets.get(node, ()):
+                    if ts + tt < row_t[j]:
+                        row_t[j] = ts + tt
+                        row_d[j] = ds + dd
+        return durations, distances
+
+
+def _upward(side, other, source: int) -> Dict[int, Tuple[float, float]]:
+    """
+    Dijkstra over one side of the hierarchy (CSR indptr, head, duration_s,
+    distance_m): settled node -> (duration_s, distance_m). A node is
+    stalled, i.e. neither expanded nor returned, when an edge of the other
+    side (which holds this side's edges from higher-ranked nodes, reversed)
+    reaches it faster from a node already in the search.
+    """
+    indptr, head, duration_s, distance_m = side
+    o_indptr, o_head, o_duration_s = other[:3]
+    best = {source: (0.0, 0.0)}
+    settled = {}
+    heap = [(0.0, source)]
+    while heap:
+        t, x = heapq.heappop(heap)
+        if t > best[x][0] or x in settled:
+            continue
+        stalled = False
+        for e in range(o_indptr[x], o_indptr[x + 1]):
+            if best.get(o_head[e], (inf,))[0] + o_duration_s[e] < t:
+                stalled = True
+                break
+        if stalled:
+            continue
+        d = best[x][1]
+        settled[x] = (t, d)
+        for e in range(indptr[x], indptr[x + 1]):
+            y, ty = head[e], t + duration_s[e]
+            if ty < best.get(y, (inf,))[0]:
+                best[y] = (ty, d + distance_m[e])
+                heapq.heappush(heap, (ty, y))
+    return settled
+
+
+def _csr(side: str, adjacency: Adjacency) -> Dict[str, np.ndarray]:
+    counts = [len(edges) for edges in adjacency]
+    flat = [e for edges in adjacency for e in edges]
+    return {
+        f"{side}_indptr": np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+        f"{side}_head": np.array([e[0] for e in flat], dtype=np.int64),
+        f"{side}_duration_s": np.array([e[1] for e in flat], dtype=np.float64),
+        f"{side}_distance_m": np.array([e[2] for e in flat], dtype=np.float64),
+    }
+
+
+class LocalGraphProvider(RoutingProvider):
+    """
+    Matrices from a local RoadGraph. Locations snap to their nearest node
+    and the straight-line snap legs are added at SNAP_SPEED_KMH; locations
+    with no node within SNAP_MAX_METERS, and unconnected pairs, are NaN.
+    The graph encodes one vehicle profile, so profile is ignored.
+    """
+
+    def __init__(self, graph: RoadGraph):
+        if len(graph) > MAX_GRAPH_NODES:
+            raise ValueError(f"road graph has {len(graph):,} nodes; ROUTING_GRAPH_MAX_NODES is {MAX_GRAPH_NODES:,}")
+        if graph.ch is None:
+            logger.warning("Road graph has no contraction hierarchy; preparing it now (slow for large graphs)")
+            graph.prepare()
+        self.graph = graph
+
+    @classmethod
+    def from_env(cls) -> "LocalGraphProvider":
+        path = os.getenv("ROUTING_GRAPH_PATH")
+        if not path:
+            raise RuntimeError("ROUTING_PROVIDER=local needs ROUTING_GRAPH_PATH")
+        return cls(RoadGraph.load(path))
+
+    def matrix(self, locations, sources=None, destinations=None, profile=DEFAULT_PROFILE):
+        coords = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        nodes, snap_m = self.graph.snap(coords[:, 1], coords[:, 0])
+        src = np.arange(len(coords)) if sources is None else np.asarray(sources, dtype=np.int64)
+        dst = np.arange(len(coords)) if destinations is None else np.asarray(destinations, dtype=np.int64)
+
+        src_nodes, dst_nodes = nodes[src], nodes[dst]
+        uniq_s = np.unique(src_nodes[src_nodes >= 0])
+        uniq_t = np.unique(dst_nodes[dst_nodes >= 0])
+        durations, distances = self.graph.many_to_many(uniq_s, uniq_t)
+
+        out_t = np.full((len(src), len(dst)), np.nan)
+        out_d = np.full((len(src), len(dst)), np.nan)
+        rows, cols = np.nonzero((src_nodes >= 0)[:, None] & (dst_nodes >= 0)[None, :])
+        if len(rows):
+            si = np.searchsorted(uniq_s, src_nodes[rows])
+            ti = np.searchsorted(uniq_t, dst_nodes[cols])
+            snap = snap_m[src][rows] + snap_m[dst][cols]
+            out_d[rows, cols] = distances[si, ti] + snap
+            out_t[rows, cols] = durations[si, ti] + snap / (SNAP_SPEED_KMH / 3.6)
+        out_t[~np.isfinite(out_t)] = np.nan
+        out_d[~np.isfinite(out_d)] = np.nan
+        return out_d, out_t
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy of a road graph file.")
+    parser.add_argument("graph", help=".npz with lat, lon, indptr, head, duration_s, distance_m")
+    parser.add_argument("out", help="output .npz (graph plus hierarchy)")
+    args = parser.parse_args()
+
+    graph = RoadGraph.load(args.graph)
+    graph.prepare()
+    graph.save(args.out)
+    shortcuts = len(graph.ch["up_head"]) + len(graph.ch["down_head"]) - len(graph.head)
+    print(f"Prepared {len(graph):,} nodes, {len(graph.head):,} edges (+{shortcuts:,} shortcuts) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# routing_cache.py
+
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from .routing import DEFAULT_PROFILE, RoutingProvider
+
+# (profile, a_lon, a_lat, b_lon, b_lat) with coordinates as scaled integers
+CacheKey = Tuple[str, int, int, int, int]
+
+SQLITE_BATCH = 150
+
+
+class RoutingCache:
+    """
+    Two-tier cache of (distance_m, duration_s) per directed coordinate pair.
+
+    Coordinates are rounded to `precision` decimals (4 ≈ 11 m) before
+    keying, so nearby requests for the same depot hit the same entry. The
+    first tier is an in-process LRU; the optional second tier is a SQLite
+    file shared by workers and restarts. Both honour ttl_seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 200_000,
+        ttl_seconds: float = 7 * 24 * 3600,
+        precision: int = 4,
+        path: Optional[str] = None,
+        max_persistent_entries: int = 5_000_000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.scale = 10 ** precision
+        self.max_persistent_entries = max_persistent_entries
+
+        self._lru: "OrderedDict[CacheKey, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes_since_evict = 0
+
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0}
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS route_cache (
+                    profile TEXT NOT NULL,
+                    a_lon INTEGER NOT NULL, a_lat INTEGER NOT NULL,
+                    b_lon INTEGER NOT NULL, b_lat INTEGER NOT NULL,
+                    distance REAL, duration REAL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (profile, a_lon, a_lat, b_lon, b_lat)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS route_cache_created_idx ON route_cache (created_at)")
+
+    @classmethod
+    def from_env(cls) -> "RoutingCache":
+        return cls(
+            max_entries=int(os.getenv("ROUTING_CACHE_MAX_ENTRIES", "200000")),
+            ttl_seconds=float(os.getenv("ROUTING_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            precision=int(os.getenv("ROUTING_CACHE_PRECISION", "4")),
+            path=os.getenv("ROUTING_CACHE_PATH") or None,
+            max_persistent_entries=int(os.getenv("ROUTING_CACHE_MAX_PERSISTENT", "5000000")),
+        )
+
+    def point(self, c) -> Tuple[int, int]:
+        """Rounded (lon, lat) as integers."""
+        return round(c[0] * self.scale), round(c[1] * self.scale)
+
+    def key(self, profile: str, a, b) -> CacheKey:
+        return (profile, *self.point(a), *self.point(b))
+
+    def get_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, Tuple[float, float]]:
+        now = time.time()
+        found = {}
+        pending = []
+        with self._lock:
+            for k in keys:
+                hit = self._lru.get(k)
+                if hit is not None and now - hit[2] <= self.ttl_seconds:
+                    self._lru.move_to_end(k)
+                    found[k] = hit[:2]
+                else:
+                    pending.append(k)
+            self.stats["memory_hits"] += len(found)
+
+            persisted = {}
+            if pending and self._db is not None:
+                persisted = self._read(pending, now - self.ttl_seconds)
+                for k, (d, t, created) in persisted.items():
+                    self._remember(k, d, t, created)
+                    found[k] = (d, t)
+            self.stats["persistent_hits"] += len(persisted)
+            self.stats["misses"] += len(pending) - len(persisted)
+        return found
+
+    def put_many(self, entries: Dict[CacheKey, Tuple[float, float]]):
+        now = time.time()
+        with self._lock:
+            for k, (d, t) in entries.items():
+                self._remember(k, d, t, now)
+            if self._db is not None and entries:
+                self._db.executemany(
+                    """
+                    INSERT INTO route_cache (profile, a_lon, a_lat, b_lon, b_lat, distance, duration, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (profile, a_lon, a_lat, b_lon, b_lat)
+                    DO UPDATE SET distance = excluded.distance, duration = excluded.duration,
+                                  created_at = excluded.created_at
+                    """,
+                    [(*k, _nullable(d), _nullable(t), now) for k, (d, t) in entries.items()],
+                )
+                self._writes_since_evict += len(entries)
+                if self._writes_since_evict >= 10_000:
+                    self._evict_persistent(now)
+
+    def _remember(self, k, d, t, created):
+        self._lru[k] = (d, t, created)
+        self._lru.move_to_end(k)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _read(self, keys, not_before):
+        out = {}
+        for i in range(0, len(keys), SQLITE_BATCH):
+            batch = keys[i:i + SQLITE_BATCH]
+            values = ",".join(["(?, ?, ?, ?, ?)"] * len(batch))
+            rows = self._db.execute(
+                f"""
+                SELECT profile, a_lon, a_lat, b_lon, b_lat, distance, duration, created_at
+                FROM route_cache
+                WHERE (profile, a_lon, a_lat, b_lon, b_lat) IN (VALUES {values})
+                  AND created_at >= ?
+                """,
+                [v for k in batch for v in k] + [not_before],
+            ).fetchall()
+            for row in rows:
+                out[tuple(row[:5])] = (_float(row[5]), _float(row[6]), row[7])
+        return out
+
+    def _evict_persistent(self, now):
+        """Drops expired rows, then the oldest rows beyond max_persistent_entries."""
+        self._writes_since_evict = 0
+        self._db.execute("DELETE FROM route_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM route_cache").fetchone()
+        excess = count - self.max_persistent_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM route_cache WHERE rowid IN "
+                "(SELECT rowid FROM route_cache ORDER BY created_at LIMIT ?)",
+                (excess,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM route_cache")
+
+
+def _nullable(v):
+    return None if v is None or np.isnan(v) else float(v)
+
+
+def _float(v):
+    return np.nan if v is None else float(v)
+
+
+class CachedRoutingProvider(RoutingProvider):
+    """
+    Serves matrix cells from a RoutingCache and asks the wrapped provider
+    only for the smallest source × destination block that covers the
+    missing cells.
+    """
+
+    def __init__(self, provider: RoutingProvider, cache: RoutingCache):
+        self.provider = provider
+        self.cache = cache
+
+    def matrix(self, locations, sources=None, destinations=None, profile=DEFAULT_PROFILE):
+        locations = [tuple(c) for c in locations]
+        src = list(sources) if sources is not None else list(range(len(locations)))
+        dst = list(destinations) if destinations is not None else list(range(len(locations)))
+
+        distances = np.full((len(src), len(dst)), np.nan)
+        durations = np.full((len(src), len(dst)), np.nan)
+        known = np.zeros((len(src), len(dst)), dtype=bool)
+
+        src_pts = [self.cache.point(locations[i]) for i in src]
+        dst_pts = [self.cache.point(locations[j]) for j in dst]
+        keys = {}
+        for r, sp in enumerate(src_pts):
+            for c, dp in enumerate(dst_pts):
+                if sp == dp:
+                    distances[r, c] = durations[r, c] = 0.0  # same point
+                    known[r, c] = True
+                else:
+                    keys.setdefault((profile, *sp, *dp), []).append((r, c))
+
+        for k, (d, t) in self.cache.get_many(list(keys)).items():
+            for r, c in keys[k]:
+                distances[r, c], durations[r, c] = d, t
+                known[r, c] = True
+
+        if not known.all():
+            rows = np.nonzero(~known.all(axis=1))[0]
+            cols = np.nonzero(~known.all(axis=0))[0]
+            block_d, block_t = self.provider.matrix(
+                locations,
+                sources=[src[r] for r in rows],
+                destinations=[dst[c] for c in cols],
+                profile=profile,
+            )
+            distances[np.ix_(rows, cols)] = block_d
+            durations[np.ix_(rows, cols)] = block_t
+
+            fresh = {}
+            for bi, r in enumerate(rows):
+                for bj, c in enumerate(cols):
+                    if src_pts[r] != dst_pts[c]:
+                        fresh[(profile, *src_pts[r], *dst_pts[c])] = (float(block_d[bi, bj]), float(block_t[bi, bj]))
+            self.cache.put_many(fresh)
+
+        return distances, durations
@@ -0,0 +1,356 @@
+# scoring.py
+
+from typing import Dict, List, Optional, Tuple
+import heapq
+import numpy as np
+from .geo_utils import haversine_km_np
+
+# Fallback speed used to turn straight-line km into hours.
+FALLBACK_SPEED_KMH = 25.0
+
+CANDIDATE_FIELDS = (
+    "warehouse_id", "item_id", "quantity", "lat", "lon",
+    "unit_weight", "unit_volume", "sell_price", "buy_price",
+)
+
+
+class CandidateArrays:
+    """
+    Columnar view of candidate warehouse rows (as returned by
+    load_warehouses_by_item), sorted by item_id so every item occupies one
+    contiguous slice.
+    """
+
+    __slots__ = CANDIDATE_FIELDS + ("item_ids", "item_offsets")
+
+    def __init__(self, **columns):
+        order = np.argsort(columns["item_id"], kind="stable")
+        for name in CANDIDATE_FIELDS:
+            setattr(self, name, np.asarray(columns[name])[order])
+
+        self.item_ids, starts = np.unique(self.item_id, return_index=True)
+        self.item_offsets = np.append(starts, len(self.item_id))
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict]) -> "CandidateArrays":
+        return cls(
+            warehouse_id=np.array([r["warehouse_id"] for r in rows], dtype=np.int64),
+            item_id=np.array([r["item_id"] for r in rows], dtype=np.int64),
+            quantity=np.array([r["quantity"] for r in rows], dtype=np.float64),
+            lat=np.array([r["lat"] for r in rows], dtype=np.float64),
+            lon=np.array([r["lon"] for r in rows], dtype=np.float64),
+            unit_weight=np.array([r["unit_weight"] for r in rows], dtype=np.float64),
+            unit_volume=np.array([r["unit_volume"] for r in rows], dtype=np.float64),
+            sell_price=np.array([r["sell_price"] for r in rows], dtype=np.float64),
+            buy_price=np.array([r["buy_price"] for r in rows], dtype=np.float64),
+        )
+
+    @classmethod
+    def from_records(cls, records: np.ndarray) -> "CandidateArrays":
+        """From a record array with the candidate row fields (e.g. queries.CANDIDATE_DTYPE)."""
+        return cls(**{name: records[name] for name in CANDIDATE_FIELDS})
+
+    @classmethod
+    def from_sorted(cls, **columns) -> "CandidateArrays":
+        """Wraps columns already sorted by item_id as they are (no copies)."""
+        self = cls.__new__(cls)
+        for name in CANDIDATE_FIELDS:
+            setattr(self, name, columns[name])
+        self.item_ids, starts = np.unique(self.item_id, return_index=True)
+        self.item_offsets = np.append(starts, len(self.item_id))
+        return self
+
+    def __len__(self):
+        return len(self.warehouse_id)
+
+    def take(self, mask: np.ndarray) -> "CandidateArrays":
+        """The rows selected by a boolean mask, still sorted by item_id."""
+        return CandidateArrays.from_sorted(**{name: getattr(self, name)[mask] for name in CANDIDATE_FIELDS})
+
+    def warehouse_points(self) -> List[Dict]:
+        """Unique warehouses as dicts with warehouse_id, lat, lon (for the routing matrix)."""
+        ids, first = np.unique(self.warehouse_id, return_index=True)
+        return [
+            {"warehouse_id": int(w), "lat": float(self.lat[k]), "lon": float(self.lon[k])}
+            for w, k in zip(ids, first)
+        ]
+
+    def groups(self):
+        """Yields (item_id, buy_indices, sell_indices) for every item."""
+        for k, item_id in enumerate(self.item_ids):
+            idx = np.arange(self.item_offsets[k], self.item_offsets[k + 1])
+            q = self.quantity[idx]
+            yield int(item_id), idx[q > 0], idx[q < 0]
+
+
+class HaversineLegs:
+    """
+    Straight-line trip legs in (km, hours), driven at FALLBACK_SPEED_KMH.
+    Accessors take candidate row indices and return arrays.
+    """
+
+    def __init__(self, candidates: CandidateArrays, start_location, end_location):
+        self.candidates = candidates
+        self.start = start_location
+        self.end = end_location
+
+    def source_to_dest(self):
+        D = float(haversine_km_np(self.start[0], self.start[1], self.end[0], self.end[1]))
+        return D, D / FALLBACK_SPEED_KMH
+
+    def from_source(self, rows):
+        c = self.candidates
+        D = haversine_km_np(self.start[0], self.start[1], c.lat[rows], c.lon[rows])
+        return D, D / FALLBACK_SPEED_KMH
+
+    def between(self, from_rows, to_rows):
+        c = self.candidates
+        D = haversine_km_np(
+            c.lat[from_rows][:, None], c.lon[from_rows][:, None],
+            c.lat[to_rows][None, :], c.lon[to_rows][None, :],
+        )
+        return D, D / FALLBACK_SPEED_KMH
+
+    def to_dest(self, rows):
+        c = self.candidates
+        D = haversine_km_np(c.lat[rows], c.lon[rows], self.end[0], self.end[1])
+        return D, D / FALLBACK_SPEED_KMH
+
+
+class MatrixLegs(HaversineLegs):
+    """
+    Road legs read from a DistanceMatrix (m, s), converted to (km, hours).
+    Cells the router could not fill fall back to the straight-line estimate.
+    """
+
+    def __init__(self, candidates: CandidateArrays, matrix, start_location, end_location):
+        super().__init__(candidates, start_location, end_location)
+        self.matrix = matrix
+        self.index = matrix.index_of(candidates.warehouse_id)
+
+    @staticmethod
+    def _merge(road, fallback):
+        D_m, T_s = road
+        D = np.where(np.isnan(D_m), fallback[0], D_m / 1000.0)
+        T = np.where(np.isnan(T_s), fallback[1], T_s / 3600.0)
+        return D, T
+
+    def source_to_dest(self):
+        D_m, T_s = self.matrix.source_to_dest()
+        D, T = self._merge((np.float64(D_m), np.float64(T_s)), super().source_to_dest())
+        return float(D), float(T)
+
+    def from_source(self, rows):
+        road = self.matrix.distances[0, self.index[rows]], self.matrix.durations[0, self.index[rows]]
+        return self._merge(road, super().from_source(rows))
+
+    def between(self, from_rows, to_rows):
+        r = self.index[from_rows][:, None]
+        c = self.index[to_rows][None, :]
+        road = self.matrix.distances[r, c], self.matrix.durations[r, c]
+        return self._merge(road, super().between(from_rows, to_rows))
+
+    def to_dest(self, rows):
+        road = self.matrix.distances[self.index[rows], -1], self.matrix.durations[self.index[rows], -1]
+        return self._merge(road, super().to_dest(rows))
+
+
+class TopK:
+    """
+    Bounded min-heap that keeps the k highest-scoring payloads seen so far.
+    Ties keep the payload that was pushed first.
+    """
+
+    def __init__(self, k: int, floor: float = float("-inf")):
+        self.k = k
+        self.floor = floor
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    @property
+    def threshold(self) -> float:
+        """Score a new payload has to beat to enter the heap."""
+        if len(self._heap) < self.k:
+            return self.floor
+        return self._heap[0][0]
+
+    def push(self, score: float, payload) -> bool:
+        if score <= self.threshold:
+            return False
+        entry = (score, -self._seq, payload)
+        self._seq += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heapreplace(self._heap, entry)
+        return True
+
+    def merge(self, other: "TopK"):
+        for score, _, payload in other.ranked():
+            self.push(score, payload)
+
+    def ranked(self) -> List[Tuple[float, int, object]]:
+        """Heap entries ordered best first."""
+        return sorted(self._heap, key=lambda e: (e[0], e[1]), reverse=True)
+
+    def items(self) -> List:
+        return [payload for _, _, payload in self.ranked()]
+
+
+# Buy warehouses are scored in blocks of this many rows against all sells.
+BUY_BLOCK_SIZE = 64
+
+
+def score_pairs(
+    candidates: CandidateArrays,
+    start_location: Tuple[float, float],
+    end_location: Tuple[float, float],
+    t_max: float,
+    cost_per_km_per_kg: float,
+    max_truck_weight_kg: float,
+    top_k: int = 30,
+    legs: Optional[HaversineLegs] = None,
+) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Scores (buy, sell) pairs of the same item and keeps the top_k by net
+    profit in a bounded heap.
+
+    Buy warehouses are visited in descending order of their profit upper
+    bound (unit_gross_profit * q_max, i.e. zero transport cost). Once that
+    bound cannot beat the current K-th best, the remaining buys are pruned,
+    and within a block only sells whose pair bound still can are passed to
+    the distance math. The bound needs a detour over A→B that is never
+    negative, which only straight-line legs guarantee: router distances
+    are the fastest route's length, MatrixLegs mix them with straight-line
+    fallbacks, and estimated legs (a TravelModel) are approximate. The
+    detour is therefore clamped at zero.
+
+    legs supplies the A→Wb, Wb→Ws and Ws→B distances/times; straight-line
+    HaversineLegs are used when it is omitted.
+
+    Returns:
+        (pairs, stats) where pairs are the top_k profitable pairs sorted by
+        descending net profit and stats holds the skip counters. Pruned
+        pairs are counted in pruned_count, not in the skip reasons.
+    """
+    if legs is None:
+        legs = HaversineLegs(candidates, start_location, end_location)
+    D_AB, _ = legs.source_to_dest()
+
+    stats = new_stats()
+    top = TopK(top_k, floor=0.0)
+    blocks = plan_blocks(candidates, max_truck_weight_kg, stats)
+    score_blocks(candidates, legs, blocks, D_AB, t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats)
+    return top.items(), stats
+
+
+def new_stats() -> Dict[str, int]:
+    return {
+        "pairs_total": 0, "profitable_count": 0, "pruned_count": 0,
+        "t_max_count": 0, "q_max_count": 0, "net_profit_count": 0,
+    }
+
+
+def plan_blocks(candidates: CandidateArrays, max_truck_weight_kg: float, stats: Dict[str, int]) -> List[Tuple]:
+    """
+    Blocks of buys (bound, buy rows, sell rows), each tagged with the best
+    bound of any pair inside it, sorted by descending bound.
+    """
+    blocks = []
+    for item_id, buy, sell in candidates.groups():
+        if len(buy) == 0 or len(sell) == 0:
+            continue
+        stats["pairs_total"] += len(buy) * len(sell)
+
+        q_cap = np.minimum(candidates.quantity[buy], max_truck_weight_kg / candidates.unit_weight[buy])
+        q_best = np.floor(np.minimum(q_cap, np.abs(candidates.quantity[sell]).max()))
+        margin = np.abs(candidates.sell_price[sell][None, :] - candidates.buy_price[buy][:, None]).max(axis=1)
+        bound = margin * q_best
+
+        order = np.argsort(-bound, kind="stable")
+        for k in range(0, len(order), BUY_BLOCK_SIZE):
+            rows = order[k:k + BUY_BLOCK_SIZE]
+            blocks.append((float(bound[rows[0]]), buy[rows], sell))
+
+    blocks.sort(key=lambda b: b[0], reverse=True)
+    return blocks
+
+
+def score_blocks(candidates, legs, blocks, D_AB, t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats):
+    """Scores planned blocks into top, pruning those whose bound cannot enter it."""
+    for bound, buy, sell in blocks:
+        if bound <= top.threshold:
+            stats["pruned_count"] += len(buy) * len(sell)
+            continue
+        _score_block(candidates, legs, buy, sell, D_AB,
+                     t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats)
+
+
+def _score_block(candidates, legs, buy, sell, D_AB,
+                 t_max, cost_per_km_per_kg, max_truck_weight_kg, top, stats):
+    # Max feasible quantity
+    unit_weight = candidates.unit_weight[buy][:, None]
+    q_available = np.minimum(candidates.quantity[buy][:, None], np.abs(candidates.quantity[sell])[None, :])
+    q_max = np.floor(np.minimum(q_available, max_truck_weight_kg / unit_weight))
+    unit_gross_profit = np.abs(candidates.sell_price[sell][None, :] - candidates.buy_price[buy][:, None])
+    gross_profit = unit_gross_profit * q_max
+
+    # Drop sell columns that cannot beat the K-th best even with zero detour
+    live = (gross_profit > top.threshold).any(axis=0)
+    stats["pruned_count"] += int(np.count_nonzero(~live)) * len(buy)
+    if not live.any():
+        return
+    sell = sell[live]
+    q_max = q_max[:, live]
+    unit_gross_profit = unit_gross_profit[:, live]
+    gross_profit = gross_profit[:, live]
+
+    # Legs: A→Wb (column), Wb→Ws (matrix), Ws→B (row)
+    D_AWb, T_AWb = legs.from_source(buy)
+    D_WbWs, T_WbWs = legs.between(buy, sell)
+    D_WsB, T_WsB = legs.to_dest(sell)
+    D_AWb, T_AWb = D_AWb[:, None], T_AWb[:, None]
+    D_WsB, T_WsB = D_WsB[None, :], T_WsB[None, :]
+    T_total = T_AWb + T_WbWs + T_WsB
+
+    # Profits and costs; a negative detour earns nothing (see score_pairs)
+    extra_distance_km = np.maximum((D_AWb + D_WbWs + D_WsB) - D_AB, 0.0)
+    transport_cost = extra_distance_km * cost_per_km_per_kg * (q_max * unit_weight)
+    net_profit = gross_profit - transport_cost
+
+    # Filters, counted in the same precedence as the original loop
+    time_ok = T_total <= t_max
+    qty_ok = time_ok & (q_max > 0)
+    keep = qty_ok & (net_profit > 0)
+
+    stats["t_max_count"] += int(np.count_nonzero(~time_ok))
+    stats["q_max_count"] += int(np.count_nonzero(time_ok & ~qty_ok))
+    stats["net_profit_count"] += int(np.count_nonzero(qty_ok & ~keep))
+    stats["profitable_count"] += int(np.count_nonzero(keep))
+
+    bi, si = np.nonzero(keep & (net_profit > top.threshold))
+    for i in np.argsort(-net_profit[bi, si], kind="stable"):
+        b, s = bi[i], si[i]
+        if net_profit[b, s] <= top.threshold:
+            break
+        top.push(float(net_profit[b, s]), {
+            "buy_warehouse_id": int(candidates.warehouse_id[buy[b]]),
+            "sell_warehouse_id": int(candidates.warehouse_id[sell[s]]),
+            "item_id": int(candidates.item_id[buy[b]]),
+            "traded_quantity": int(q_max[b, s]),
+            "gross_profit": float(gross_profit[b, s]),
+            "net_profit": float(net_profit[b, s]),
+            "transport_cost": float(transport_cost[b, s]),
+            "unit_profit_per_kg": float(unit_gross_profit[b, s] / unit_weight[b, 0]),
+            "T_AWb": float(T_AWb[b, 0]),
+            "T_WbWs": float(T_WbWs[b, s]),
+            "T_WsB": float(T_WsB[0, s]),
+            "D_AWb": float(D_AWb[b, 0]),
+            "D_WbWs": float(D_WbWs[b, s]),
+            "D_WsB": float(D_WsB[0, s]),
+            "extra_distance_km": float(extra_distance_km[b, s]),
+            "total_trip_time": float(T_total[b, s]),
+        })
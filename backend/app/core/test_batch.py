@@ -0,0 +1,28 @@
+from app.core.batch import group_corridors, optimize_batch
+from app.core.optimizer import find_profitable_pairs
+from app.db import warehouse_index
+from app.testing import DELHI, JAIPUR, MUMBAI, PUNE, THANE, make_index, truck
+
+
+def test_overlapping_corridors_are_grouped():
+    reqs = [truck(PUNE, MUMBAI), truck(DELHI, JAIPUR), truck(PUNE, THANE), truck(MUMBAI, THANE)]
+
+    groups = sorted(sorted(g) for g in group_corridors(reqs))
+
+    assert groups == [[0, 2, 3], [1]]
+
+
+def test_batch_matches_single_truck_results(monkeypatch):
+    index, _, _ = make_index(seed=2)
+    monkeypatch.setattr(warehouse_index, "_index", index)
+    reqs = [truck(PUNE, MUMBAI), truck(PUNE, THANE)]
+
+    results = dict(optimize_batch(reqs))
+
+    assert sorted(results) == [0, 1]
+    for i, req in enumerate(reqs):
+        single = find_profitable_pairs(
+            req.start_location, req.end_location, req.t_max, req.cost_per_km_per_kg,
+            req.max_truck_weight_kg, req.curr_truck_weight_kg,
+        )
+        assert results[i] == single
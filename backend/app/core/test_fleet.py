@@ -0,0 +1,58 @@
+from collections import defaultdict
+from app.core.fleet import assign_fleet, optimize_fleet
+from app.db import warehouse_index
+from app.testing import MUMBAI, PUNE, THANE, make_index, truck
+
+
+def pair(buy, sell, item, quantity, net_per_unit):
+    return {
+        "buy_warehouse_id": buy, "sell_warehouse_id": sell, "item_id": item,
+        "traded_quantity": quantity, "gross_profit": 2.0 * net_per_unit * quantity,
+        "net_profit": net_per_unit * quantity, "transport_cost": net_per_unit * quantity,
+    }
+
+
+def test_second_truck_gets_what_is_left():
+    # Both trucks want the same 100 units; the runner-up pair beats the remainder
+    pairs = {
+        0: [pair(1, 2, 7, 80, 10.0)],
+        1: [pair(1, 2, 7, 80, 9.0), pair(3, 4, 7, 50, 5.0)],
+    }
+    stock = {(1, 7): 100, (2, 7): 100, (3, 7): 50, (4, 7): 50}
+
+    plan = assign_fleet(pairs, stock)
+
+    assert plan[0]["traded_quantity"] == 80
+    assert plan[1]["buy_warehouse_id"] == 3 and plan[1]["traded_quantity"] == 50
+
+
+def test_shortened_pair_is_recosted():
+    pairs = {0: [pair(1, 2, 7, 80, 10.0)], 1: [pair(1, 2, 7, 80, 9.0)]}
+    stock = {(1, 7): 100, (2, 7): 100}
+
+    plan = assign_fleet(pairs, stock)
+
+    assert plan[1]["traded_quantity"] == 20
+    assert plan[1]["net_profit"] == 9.0 * 20
+    assert plan[1]["gross_profit"] == 18.0 * 20
+
+
+def test_fleet_plan_never_overbooks_stock(monkeypatch):
+    index, _, _ = make_index(seed=3)
+    monkeypatch.setattr(warehouse_index, "_index", index)
+    reqs = [truck(PUNE, MUMBAI), truck(PUNE, THANE), truck(MUMBAI, THANE)] * 4
+
+    plan = optimize_fleet(reqs)
+
+    used = defaultdict(float)
+    for p in plan.values():
+        if p is not None:
+            used[(p["buy_warehouse_id"], p["item_id"])] += p["traded_quantity"]
+            used[(p["sell_warehouse_id"], p["item_id"])] += p["traded_quantity"]
+    stock = {
+        (int(index.warehouse_ids[pos]), item): abs(q)
+        for item, (positions, quantities) in index.by_item.items()
+        for pos, q in zip(positions, quantities)
+    }
+    assert sum(p is not None for p in plan.values()) == len(reqs)
+    assert all(used[k] <= stock[k] for k in used)
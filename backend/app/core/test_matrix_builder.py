@@ -0,0 +1,81 @@
+import random
+import numpy as np
+import pytest
+from app.core.matrix_builder import RetryPolicy, TiledMatrixProvider
+from app.core.routing import RoutingProvider, StubProvider
+
+
+def random_coords(n, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(72, 78), rng.uniform(12, 28)) for _ in range(n)]
+
+
+class LimitedStub(StubProvider):
+    """Rejects requests over max_cells, like the ORS matrix endpoint."""
+
+    def __init__(self, max_cells, failures=0, status=None, error=None):
+        super().__init__()
+        self.max_cells = max_cells
+        self.failures = failures
+        self.status = status
+        self.error = error
+
+    def matrix(self, locations, sources=None, destinations=None, profile="driving-car"):
+        if self.failures:
+            self.failures -= 1
+            exc = self.error or RuntimeError("provider unavailable")
+            exc.status = self.status
+            raise exc
+        assert len(sources) * len(destinations) <= self.max_cells
+        return super().matrix(locations, sources, destinations, profile)
+
+
+def test_large_matrix_is_tiled_and_reassembled():
+    coords = random_coords(130)
+    stub = LimitedStub(max_cells=1000)
+    tiled = TiledMatrixProvider(stub, max_cells=1000, max_workers=4)
+
+    distances, durations = tiled.matrix(coords)
+
+    expected_d, expected_t = StubProvider().matrix(coords)
+    np.testing.assert_allclose(distances, expected_d)
+    np.testing.assert_allclose(durations, expected_t)
+    assert stub.calls == len(tiled.tiles(130, 130)) > 1
+
+
+def test_transient_failures_are_retried():
+    stub = LimitedStub(max_cells=3500, failures=2, status=503)
+    tiled = TiledMatrixProvider(stub, retry=RetryPolicy(max_retries=3, backoff_base=0.001))
+
+    distances, _ = tiled.matrix(random_coords(5))
+
+    assert distances.shape == (5, 5)
+
+
+def test_client_errors_are_not_retried():
+    stub = LimitedStub(max_cells=3500, failures=1, status=400)
+    tiled = TiledMatrixProvider(stub, retry=RetryPolicy(max_retries=3, backoff_base=0.001))
+
+    with pytest.raises(RuntimeError):
+        tiled.matrix(random_coords(5))
+
+
+def test_timeouts_are_retried_and_bugs_are_not():
+    stub = LimitedStub(max_cells=3500, failures=2, error=TimeoutError("read timed out"))
+    tiled = TiledMatrixProvider(stub, retry=RetryPolicy(max_retries=3, backoff_base=0.001))
+    assert tiled.matrix(random_coords(5))[0].shape == (5, 5)
+
+    stub = LimitedStub(max_cells=3500, failures=1, error=KeyError("distances"))
+    tiled = TiledMatrixProvider(stub, retry=RetryPolicy(max_retries=3, backoff_base=0.001))
+    # One failure only: a retry would have succeeded
+    with pytest.raises(KeyError):
+        tiled.matrix(random_coords(5))
+
+
+def test_providers_without_matrix_fail_on_creation():
+    class RouteOnly(RoutingProvider):
+        def route(self, a, b, profile="driving-car"):
+            return 0.0, 0.0
+
+    with pytest.raises(TypeError):
+        RouteOnly()
@@ -0,0 +1,35 @@
+from app.core.metrics import Counter, Histogram, REGISTRY, render
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("test_latency_seconds", "Test latency.", ["stage"], buckets=(0.1, 1.0))
+    try:
+        for v in (0.05, 0.1, 0.5, 3.0):
+            h.observe(v, stage="scoring")
+
+        lines = [l for l in render().splitlines() if l.startswith("test_latency_seconds")]
+    finally:
+        REGISTRY.remove(h)
+
+    assert lines == [
+        'test_latency_seconds_bucket{stage="scoring",le="0.1"} 2',
+        'test_latency_seconds_bucket{stage="scoring",le="1"} 3',
+        'test_latency_seconds_bucket{stage="scoring",le="+Inf"} 4',
+        'test_latency_seconds_sum{stage="scoring"} 3.65',
+        'test_latency_seconds_count{stage="scoring"} 4',
+    ]
+
+
+def test_counter_series_per_label():
+    c = Counter("test_pairs_total", "Test pairs.", ["outcome"])
+    try:
+        c.inc(3, outcome="t_max")
+        c.inc(outcome="t_max")
+        c.inc(2, outcome="q_max")
+        text = render()
+    finally:
+        REGISTRY.remove(c)
+
+    assert "# TYPE test_pairs_total counter" in text
+    assert 'test_pairs_total{outcome="t_max"} 4' in text
+    assert 'test_pairs_total{outcome="q_max"} 2' in text
@@ -0,0 +1,51 @@
+import pytest
+from pydantic import ValidationError
+from app.core.multistop import MultiStopPlanner
+from app.core.optimizer import rank_candidates
+from app.core.scoring import CandidateArrays
+from app.models.schemas import MULTISTOP_MAX_TIME_BUDGET_S, MultiStopRequest
+from app.testing import MUMBAI, PUNE, load_rows
+
+
+def check_plan(plan, rows, capacity_kg, capacity_m3, t_max):
+    stock = {(r["warehouse_id"], r["item_id"]): abs(r["quantity"]) for r in rows}
+    used = {}
+    for stop in plan["stops"]:
+        key = (stop["warehouse_id"], stop["item_id"])
+        used[key] = used.get(key, 0) + stop["quantity"]
+        assert -1e-6 <= stop["load_kg"] <= capacity_kg + 1e-6  # never sells what is not on board
+        assert stop["load_m3"] <= capacity_m3 + 1e-6
+    assert all(used[k] <= stock[k] for k in used)
+    assert plan["stops"][-1]["load_kg"] < 1e-6  # everything bought is sold
+    assert plan["total_trip_time"] <= t_max
+
+
+def test_plan_beats_best_single_pair_and_respects_limits():
+    rows = load_rows()
+    planner = MultiStopPlanner(CandidateArrays.from_rows(rows), PUNE, MUMBAI, 8, 0.001, 2000)
+    plan = planner.solve(time_budget_s=2.0)
+
+    best_single = rank_candidates(rows, PUNE, MUMBAI, 8, 0.001, 2000)[0]
+    assert len(plan["trades"]) > 1
+    assert plan["net_profit"] >= best_single["net_profit"]
+    check_plan(plan, rows, 2000, float("inf"), 8)
+
+
+def test_volume_limit_binds():
+    rows = load_rows()
+    planner = MultiStopPlanner(CandidateArrays.from_rows(rows), PUNE, MUMBAI, 8, 0.001, 2000, capacity_m3=3.0)
+    plan = planner.solve(time_budget_s=2.0)
+
+    assert plan["trades"]
+    assert plan["peak_load_m3"] <= 3.0 + 1e-9
+    check_plan(plan, rows, 2000, 3.0, 8)
+
+
+
+def test_time_budget_is_bounded():
+    req = dict(start_location=PUNE, end_location=MUMBAI, t_max=8, cost_per_km_per_kg=0.001,
+               max_truck_weight_kg=2000, curr_truck_weight_kg=0)
+    assert MultiStopRequest(**req, time_budget_s=MULTISTOP_MAX_TIME_BUDGET_S).time_budget_s == MULTISTOP_MAX_TIME_BUDGET_S
+    for budget in (0, -1, MULTISTOP_MAX_TIME_BUDGET_S * 2):
+        with pytest.raises(ValidationError):
+            MultiStopRequest(**req, time_budget_s=budget)
@@ -0,0 +1,30 @@
+from app.core import routing
+from app.core.optimizer import iter_ranked_candidates
+from app.core.routing import StubProvider
+from app.testing import MUMBAI, PUNE, load_rows
+
+
+class FailingProvider(StubProvider):
+    def matrix(self, *args, **kwargs):
+        raise RuntimeError("routing down")
+
+
+def test_stream_sends_haversine_then_road(monkeypatch):
+    monkeypatch.setattr(routing, "_provider", StubProvider(detour_factor=1.3))
+    rows = load_rows()
+
+    updates = list(iter_ranked_candidates(rows, PUNE, MUMBAI, 8, 0.001, 2000))
+
+    assert [phase for phase, _ in updates] == ["haversine", "road"]
+    (_, straight), (_, road) = updates
+    assert straight and road
+    # Stub road legs are 1.3x longer, so detours cost more
+    assert road[0]["net_profit"] <= straight[0]["net_profit"]
+
+
+def test_stream_stops_after_haversine_without_routing(monkeypatch):
+    monkeypatch.setattr(routing, "_provider", FailingProvider())
+
+    updates = list(iter_ranked_candidates(load_rows(), PUNE, MUMBAI, 8, 0.001, 2000))
+
+    assert [phase for phase, _ in updates] == ["haversine"]
@@ -0,0 +1,69 @@
+import numpy as np
+from app.core import pair_index
+from app.core.pair_index import PairIndex
+from app.core.scoring import CandidateArrays, score_pairs
+from app.testing import MUMBAI, PUNE, make_index
+
+START, END = PUNE, MUMBAI
+ARGS = dict(t_max=8, cost_per_km_per_kg=0.001, max_truck_weight_kg=2000, top_k=30)
+
+
+def all_pairs(monkeypatch):
+    # Keep every pair within reach, so the index is exact
+    monkeypatch.setattr(pair_index, "PAIRS_PER_SUPPLIER", 10 ** 6)
+    monkeypatch.setattr(pair_index, "PAIR_MAX_KM", 1000.0)
+    monkeypatch.setattr(pair_index, "REFERENCE_COST_PER_KM_PER_KG", 0.0)
+
+
+def brute_force(index, max_detour_meters):
+    rows = index.load_warehouses_by_item(
+        START[0], START[1], END[0], END[1], max_detour_meters, 2000, 0.001, limit=10 ** 9,
+    )
+    return score_pairs(CandidateArrays.from_rows(rows), START, END, **ARGS)[0]
+
+
+def key(pairs):
+    return [(p["buy_warehouse_id"], p["sell_warehouse_id"], p["item_id"], round(p["net_profit"], 6)) for p in pairs]
+
+
+def test_indexed_pairs_match_full_scoring(monkeypatch):
+    all_pairs(monkeypatch)
+    index, _, _ = make_index(n=600)
+    pairs, stats = PairIndex.build(index).score(START, END, max_detour_meters=40000, **ARGS)
+
+    assert len(pairs) == ARGS["top_k"]
+    assert key(pairs) == key(brute_force(index, 40000))
+    assert stats["pairs_total"] == stats["profitable_count"] + stats["t_max_count"] \
+        + stats["q_max_count"] + stats["net_profit_count"]
+
+
+def test_refresh_matches_rebuild_after_inventory_changes(monkeypatch):
+    monkeypatch.setattr(pair_index, "PAIRS_PER_SUPPLIER", 5)
+    monkeypatch.setattr(pair_index, "PAIR_MAX_KM", 60.0)
+    index, _, _ = make_index(n=800, seed=2)
+    pairs = PairIndex.build(index)
+
+    rng = np.random.default_rng(0)
+    ids = rng.choice(index.warehouse_ids, 40, replace=False)
+    # Flip suppliers to demanders and back, add new rows, change amounts
+    index.apply_quantities([(int(w), int(rng.integers(1, 4)), float(rng.uniform(-9000, 9000))) for w in ids])
+    pairs.refresh(index.take_changes())
+
+    fresh = PairIndex.build(index)
+    for item_id, rebuilt in fresh.items.items():
+        got = pairs.items[item_id]
+        assert sorted(zip(got.buy, got.sell)) == sorted(zip(rebuilt.buy, rebuilt.sell))
+        assert np.array_equal(got.offsets, rebuilt.offsets)
+
+
+def test_scoring_reads_live_quantities(monkeypatch):
+    all_pairs(monkeypatch)
+    index, _, _ = make_index(n=600)
+    pairs = PairIndex.build(index)
+    best = pairs.score(START, END, max_detour_meters=40000, **ARGS)[0][0]
+
+    index.apply_quantities([(best["sell_warehouse_id"], best["item_id"], 0.0)])  # demand filled
+    after = pairs.score(START, END, max_detour_meters=40000, **ARGS)[0]
+    assert (best["buy_warehouse_id"], best["sell_warehouse_id"], best["item_id"]) not in \
+        {(p["buy_warehouse_id"], p["sell_warehouse_id"], p["item_id"]) for p in after}
+    assert key(after) == key(brute_force(index, 40000))
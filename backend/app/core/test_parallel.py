@@ -0,0 +1,68 @@
+import numpy as np
+from app.core import parallel
+from app.core.geo_utils import DistanceMatrix, haversine_km_np
+from app.core.scoring import CandidateArrays, MatrixLegs, score_pairs
+from app.core.travel_model import ModelLegs, TravelModel
+from app.testing import MUMBAI, PUNE, make_rows
+
+KWARGS = dict(t_max=6, cost_per_km_per_kg=0.02, max_truck_weight_kg=2000, top_k=40)
+
+
+def test_sharded_scoring_matches_serial(monkeypatch):
+    monkeypatch.setattr(parallel, "SCORING_WORKERS", 3)
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_PAIRS", 0)
+    candidates = CandidateArrays.from_rows(make_rows(400, seed=3))
+
+    # Road legs from a matrix, so workers also read it from shared memory
+    ids = np.unique(candidates.warehouse_id)
+    first = np.searchsorted(candidates.warehouse_id[np.argsort(candidates.warehouse_id)], ids)
+    at = np.argsort(candidates.warehouse_id)[first]
+    lat = np.concatenate(([PUNE[0]], candidates.lat[at], [MUMBAI[0]]))
+    lon = np.concatenate(([PUNE[1]], candidates.lon[at], [MUMBAI[1]]))
+    km = haversine_km_np(lat[:, None], lon[:, None], lat[None, :], lon[None, :]) * 1.2
+    matrix = DistanceMatrix(ids, km * 1000, km / 40.0 * 3600)
+
+    # Travel model legs, rebuilt in the workers from the model's grid
+    model = TravelModel((8.0, 37.0, 68.0, 92.0), 1.0, np.full((29, 24), 1.3), np.full((29, 24), 40.0))
+
+    try:
+        for legs in (None, MatrixLegs(candidates, matrix, PUNE, MUMBAI), ModelLegs(candidates, model, PUNE, MUMBAI)):
+            serial, serial_stats = score_pairs(candidates, PUNE, MUMBAI, legs=legs, **KWARGS)
+            sharded, stats = parallel.score_pairs_parallel(candidates, PUNE, MUMBAI, legs=legs, **KWARGS)
+
+            assert len(serial) == KWARGS["top_k"]
+            assert [p["net_profit"] for p in sharded] == [p["net_profit"] for p in serial]
+            assert {(p["buy_warehouse_id"], p["sell_warehouse_id"], p["item_id"]) for p in sharded} == \
+                {(p["buy_warehouse_id"], p["sell_warehouse_id"], p["item_id"]) for p in serial}
+            assert stats["pairs_total"] == serial_stats["pairs_total"]
+            scored = stats["pairs_total"] - stats["pruned_count"]
+            assert stats["profitable_count"] + stats["t_max_count"] + stats["q_max_count"] \
+                + stats["net_profit_count"] == scored
+    finally:
+        parallel.shutdown_pool()
+
+
+def test_slow_model_legs_are_honoured_by_workers(monkeypatch):
+    monkeypatch.setattr(parallel, "SCORING_WORKERS", 3)
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_PAIRS", 0)
+    candidates = CandidateArrays.from_rows(make_rows(400, seed=3))
+    # At 1 km/h no pair fits in t_max; haversine workers (25 km/h) would find some
+    model = TravelModel((8.0, 37.0, 68.0, 92.0), 1.0, np.ones((29, 24)), np.full((29, 24), 1.0))
+    legs = ModelLegs(candidates, model, PUNE, MUMBAI)
+
+    try:
+        serial, _ = score_pairs(candidates, PUNE, MUMBAI, legs=legs, **KWARGS)
+        sharded, _ = parallel.score_pairs_parallel(candidates, PUNE, MUMBAI, legs=legs, **KWARGS)
+        assert sharded == serial == []
+    finally:
+        parallel.shutdown_pool()
+
+
+def test_small_problems_stay_in_process(monkeypatch):
+    monkeypatch.setattr(parallel, "SCORING_WORKERS", 3)
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_PAIRS", 10 ** 9)
+    candidates = CandidateArrays.from_rows(make_rows(50))
+
+    pairs, _ = parallel.score_pairs_parallel(candidates, PUNE, MUMBAI, **KWARGS)
+    assert pairs == score_pairs(candidates, PUNE, MUMBAI, **KWARGS)[0]
+    assert parallel._pool is None
@@ -0,0 +1,35 @@
+import time
+from app.core.result_cache import ResultCache
+
+PUNE = (18.5204, 73.8567)
+MUMBAI = (19.0760, 72.8777)
+
+
+def test_near_identical_requests_share_an_entry():
+    cache = ResultCache()
+    a = cache.key(PUNE, MUMBAI, 8.0, 0.02, 10000, 1520)
+    b = cache.key((18.52041, 73.85668), MUMBAI, 8.0, 0.02, 10000, 1520)
+
+    assert a == b
+    # Limits are exact: a neighbour's pairs could break this caller's t_max or capacity
+    assert a != cache.key(PUNE, MUMBAI, 7.9, 0.02, 10000, 1520)
+    assert a != cache.key(PUNE, MUMBAI, 8.0, 0.02, 9990, 1520)
+    assert a != cache.key(PUNE, MUMBAI, 8.0, 0.02, 10000, 1530)
+
+
+def test_entries_expire_go_stale_and_evict():
+    cache = ResultCache(max_entries=2, ttl_seconds=0.05)
+    cache.put("a", 1, ["pair"])
+
+    assert cache.get("a", 1) == ["pair"]
+    assert cache.get("a", 2) is None  # inventory changed
+
+    cache.put("b", 1, [])
+    time.sleep(0.1)
+    assert cache.get("b", 1) is None  # expired
+
+    for k in "cde":
+        cache.put(k, 1, [])
+    stats = cache.snapshot()
+    assert stats["entries"] == 2
+    assert (stats["hits"], stats["stale"], stats["expired"], stats["evictions"]) == (1, 1, 1, 1)
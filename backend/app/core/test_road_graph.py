@@ -0,0 +1,89 @@
+import heapq
+import random
+import numpy as np
+import pytest
+from app.core import road_graph
+from app.core.road_graph import LocalGraphProvider, RoadGraph
+
+LAT0, LON0, STEP = 18.5, 73.8, 0.01  # ~1.1 km grid spacing
+
+
+def make_graph(side=12, seed=0):
+    """Grid of roads with random speeds, some one-way, some missing."""
+    rng = random.Random(seed)
+    lat, lon = [], []
+    for r in range(side):
+        for c in range(side):
+            lat.append(LAT0 + r * STEP)
+            lon.append(LON0 + c * STEP)
+    edges = []
+    for r in range(side):
+        for c in range(side):
+            u = r * side + c
+            for v in ([u + 1] if c + 1 < side else []) + ([u + side] if r + 1 < side else []):
+                if rng.random() < 0.1:
+                    continue
+                dist = 1100 * rng.uniform(1.0, 1.3)
+                t = dist / (rng.choice([30, 50, 80]) / 3.6)
+                edges.append((u, v, dist, t))
+                if rng.random() < 0.85:
+                    edges.append((v, u, dist, t * rng.uniform(0.9, 1.1)))
+    tail, head, dist, t = zip(*edges)
+    return RoadGraph.from_edges(lat, lon, tail, head, dist, t)
+
+
+def dijkstra(graph, source):
+    best = {source: (0.0, 0.0)}
+    heap = [(0.0, source)]
+    while heap:
+        t, u = heapq.heappop(heap)
+        if t > best[u][0]:
+            continue
+        for e in range(graph.indptr[u], graph.indptr[u + 1]):
+            v, nt = int(graph.head[e]), t + graph.duration_s[e]
+            if nt < best.get(v, (np.inf,))[0]:
+                best[v] = (nt, best[u][1] + graph.distance_m[e])
+                heapq.heappush(heap, (nt, v))
+    return best
+
+
+def test_hierarchy_matches_dijkstra(tmp_path):
+    graph = make_graph()
+    graph.prepare()
+    path = str(tmp_path / "roads.npz")
+    graph.save(path)
+    graph = RoadGraph.load(path)
+
+    nodes = np.arange(len(graph))
+    durations, distances = graph.many_to_many(nodes, nodes)
+    for s in range(0, len(graph), 7):
+        reached = dijkstra(graph, s)
+        for t in nodes:
+            expected_t, expected_d = reached.get(int(t), (np.inf, np.inf))
+            assert durations[s, t] == pytest.approx(expected_t)
+            if np.isfinite(expected_t):
+                assert distances[s, t] == pytest.approx(expected_d)
+
+
+def test_provider_snaps_locations_and_marks_unroutable_nan():
+    graph = make_graph()
+    provider = LocalGraphProvider(graph)
+    # (lon, lat); the last one is far from every node
+    locations = [(LON0 + 0.001, LAT0), (LON0 + 0.05, LAT0 + 0.05), (LON0 + 0.1, LAT0 + 0.02), (80.0, 25.0)]
+    distances, durations = provider.matrix(locations, sources=[0, 3], destinations=[1, 2])
+
+    assert distances.shape == (2, 2)
+    assert np.isnan(distances[1]).all() and np.isnan(durations[1]).all()
+    nodes, snap = graph.snap([LAT0, LAT0 + 0.05], [LON0 + 0.001, LON0 + 0.05])
+    expected_t, expected_d = dijkstra(graph, int(nodes[0]))[int(nodes[1])]
+    assert distances[0, 0] == pytest.approx(expected_d + snap.sum())
+    assert durations[0, 0] > expected_t
+
+
+def test_oversized_graphs_are_refused(monkeypatch):
+    monkeypatch.setattr(road_graph, "MAX_GRAPH_NODES", 100)
+    graph = make_graph()
+    with pytest.raises(ValueError):
+        graph.prepare()
+    with pytest.raises(ValueError):
+        LocalGraphProvider(graph)
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+from app.core.routing import StubProvider
+from app.core.routing_cache import CachedRoutingProvider, RoutingCache
+
+DEPOTS = [(72.8777, 19.0760), (73.8567, 18.5204), (77.1025, 28.7041), (77.5946, 12.9716)]
+
+
+def test_repeat_matrix_is_served_from_cache():
+    stub = StubProvider()
+    provider = CachedRoutingProvider(stub, RoutingCache())
+
+    first = provider.matrix(DEPOTS)
+    second = provider.matrix(DEPOTS)
+
+    assert stub.calls == 1
+    np.testing.assert_allclose(first[0], second[0])
+    np.testing.assert_allclose(np.diag(second[1]), 0)
+
+
+def test_only_missing_block_is_requested():
+    stub = StubProvider()
+    provider = CachedRoutingProvider(stub, RoutingCache())
+    provider.matrix(DEPOTS, sources=[0, 1])
+    cells_before = stub.cells
+
+    distances, _ = provider.matrix(DEPOTS)
+
+    # Rows 0-1 are known, so only the 2×4 block of rows 2-3 is fetched
+    assert stub.calls == 2
+    assert stub.cells - cells_before == 8
+    np.testing.assert_allclose(distances, StubProvider().matrix(DEPOTS)[0])
+
+
+def test_persistent_tier_survives_new_process(tmp_path):
+    path = str(tmp_path / "routes.sqlite")
+    CachedRoutingProvider(StubProvider(), RoutingCache(path=path)).matrix(DEPOTS)
+
+    stub = StubProvider()
+    cache = RoutingCache(path=path)
+    CachedRoutingProvider(stub, cache).matrix(DEPOTS)
+
+    assert stub.calls == 0
+    assert cache.stats["persistent_hits"] == len(DEPOTS) * (len(DEPOTS) - 1)
+
+
+def test_expired_entries_are_refetched(tmp_path):
+    stub = StubProvider()
+    cache = RoutingCache(ttl_seconds=0.05, path=str(tmp_path / "routes.sqlite"))
+    provider = CachedRoutingProvider(stub, cache)
+
+    provider.matrix(DEPOTS)
+    time.sleep(0.1)
+    provider.matrix(DEPOTS)
+
+    assert stub.calls == 2
+
+
+def test_lru_tier_is_bounded():
+    cache = RoutingCache(max_entries=5)
+    CachedRoutingProvider(StubProvider(), cache).matrix(DEPOTS)
+
+    assert len(cache._lru) == 5
@@ -0,0 +1,147 @@
+import math
+import numpy as np
+from app.core.geo_utils import DistanceMatrix, haversine_km
+from app.core.scoring import CandidateArrays, MatrixLegs, TopK, score_pairs
+from app.testing import MUMBAI, PUNE, make_rows
+
+A, B = PUNE, MUMBAI
+
+
+def reference_pairs(rows, t_max, cost_per_km_per_kg, max_truck_weight_kg):
+    """The original nested-loop scorer, kept here as the oracle."""
+    D_AB = haversine_km(A[0], A[1], B[0], B[1])
+    pairs = []
+    for wb in rows:
+        if wb["quantity"] <= 0:
+            continue
+        for ws in rows:
+            if ws["quantity"] >= 0 or wb["item_id"] != ws["item_id"]:
+                continue
+            D_AWb = haversine_km(A[0], A[1], wb["lat"], wb["lon"])
+            D_WbWs = haversine_km(wb["lat"], wb["lon"], ws["lat"], ws["lon"])
+            D_WsB = haversine_km(ws["lat"], ws["lon"], B[0], B[1])
+            if (D_AWb + D_WbWs + D_WsB) / 25.0 > t_max:
+                continue
+            q_max = math.floor(min(wb["quantity"], abs(ws["quantity"]), max_truck_weight_kg / wb["unit_weight"]))
+            if q_max <= 0:
+                continue
+            extra = (D_AWb + D_WbWs + D_WsB) - D_AB
+            net = abs(ws["sell_price"] - wb["buy_price"]) * q_max - extra * cost_per_km_per_kg * q_max * wb["unit_weight"]
+            if net <= 0:
+                continue
+            pairs.append((wb["warehouse_id"], ws["warehouse_id"], wb["item_id"], q_max, net))
+    pairs.sort(key=lambda p: p[4], reverse=True)
+    return pairs
+
+
+def test_score_pairs_matches_reference_loop():
+    rows = make_rows(60)
+    expected = reference_pairs(rows, t_max=6, cost_per_km_per_kg=0.02, max_truck_weight_kg=2000)
+
+    pairs, stats = score_pairs(
+        CandidateArrays.from_rows(rows), A, B,
+        t_max=6, cost_per_km_per_kg=0.02, max_truck_weight_kg=2000, top_k=30,
+    )
+
+    assert len(pairs) == min(30, len(expected))
+    for got, want in zip(pairs, expected):
+        assert (got["buy_warehouse_id"], got["sell_warehouse_id"], got["item_id"], got["traded_quantity"]) == want[:4]
+        assert math.isclose(got["net_profit"], want[4], rel_tol=1e-9)
+
+
+def test_score_pairs_counts_every_skip_reason():
+    rows = make_rows(40, seed=3)
+    pairs, stats = score_pairs(
+        CandidateArrays.from_rows(rows), A, B,
+        t_max=4, cost_per_km_per_kg=0.05, max_truck_weight_kg=1500,
+    )
+
+    skipped = stats["t_max_count"] + stats["q_max_count"] + stats["net_profit_count"] + stats["pruned_count"]
+    assert skipped + stats["profitable_count"] == stats["pairs_total"]
+    assert [p["net_profit"] for p in pairs] == sorted((p["net_profit"] for p in pairs), reverse=True)
+
+
+def test_small_k_prunes_pairs_without_changing_the_winner():
+    rows = make_rows(200, seed=7)
+    expected = reference_pairs(rows, t_max=6, cost_per_km_per_kg=0.02, max_truck_weight_kg=2000)
+
+    pairs, stats = score_pairs(
+        CandidateArrays.from_rows(rows), A, B,
+        t_max=6, cost_per_km_per_kg=0.02, max_truck_weight_kg=2000, top_k=1,
+    )
+
+    assert stats["pruned_count"] > 0
+    assert (pairs[0]["buy_warehouse_id"], pairs[0]["sell_warehouse_id"]) == expected[0][:2]
+
+
+def test_top_k_keeps_best_and_first_seen_on_ties():
+    top = TopK(3, floor=0.0)
+    for score, name in [(5, "a"), (-1, "neg"), (9, "b"), (5, "c"), (7, "d"), (5, "e")]:
+        top.push(score, name)
+
+    assert top.items() == ["b", "d", "a"]
+    assert top.threshold == 5
+
+
+def test_matrix_legs_match_haversine_for_straight_line_router():
+    rows = make_rows(40, seed=5)
+    by_id = {}
+    for r in rows:  # one location per warehouse
+        r.update({k: by_id.setdefault(r["warehouse_id"], r)[k] for k in ("lat", "lon")})
+    candidates = CandidateArrays.from_rows(rows)
+
+    # [A, *warehouses, B] with a straight-line metric at 25 km/h
+    ids = sorted(by_id)
+    lat = np.array([A[0]] + [by_id[w]["lat"] for w in ids] + [B[0]])
+    lon = np.array([A[1]] + [by_id[w]["lon"] for w in ids] + [B[1]])
+    km = np.array([[haversine_km(la1, lo1, la2, lo2) for la2, lo2 in zip(lat, lon)] for la1, lo1 in zip(lat, lon)])
+    matrix = DistanceMatrix(ids, km * 1000, km / 25.0 * 3600)
+    matrix.distances[1, 2] = np.nan  # unroutable cell falls back to haversine
+
+    kwargs = dict(t_max=6, cost_per_km_per_kg=0.02, max_truck_weight_kg=2000)
+    road, _ = score_pairs(candidates, A, B, legs=MatrixLegs(candidates, matrix, A, B), **kwargs)
+    straight, _ = score_pairs(candidates, A, B, **kwargs)
+
+    assert [(p["buy_warehouse_id"], p["sell_warehouse_id"]) for p in road] == \
+        [(p["buy_warehouse_id"], p["sell_warehouse_id"]) for p in straight]
+    for r, h in zip(road, straight):
+        assert math.isclose(r["D_WbWs"], h["D_WbWs"], rel_tol=1e-5)
+
+
+def test_distance_matrix_block_accessors():
+    d = np.arange(25, dtype=np.float64).reshape(5, 5)
+    matrix = DistanceMatrix([30, 10, 20], d, d * 2)
+
+    assert list(matrix.index_of([10, 30])) == [2, 1]
+    assert matrix.block([20], [30, 10])[0].tolist() == [[16.0, 17.0]]
+    assert matrix.from_source([20])[1].tolist() == [6.0]
+    assert matrix.to_dest([30])[0].tolist() == [9.0]
+    assert matrix.distances.dtype == np.float32
+
+
+def test_pruning_keeps_the_winner_when_road_legs_undercut_the_direct_trip():
+    # Item 1: 1 → 2 earns 100 gross; item 2: 3 → 4 earns 120 gross
+    rows = [
+        {"warehouse_id": w, "item_id": item, "quantity": q, "lat": A[0], "lon": A[1],
+         "unit_weight": 1.0, "unit_volume": 0.1, "sell_price": sell, "buy_price": 10.0}
+        for w, item, q, sell in [(1, 1, 100, 11.0), (2, 1, -100, 11.0), (3, 2, 100, 11.2), (4, 2, -100, 11.2)]
+    ]
+    candidates = CandidateArrays.from_rows(rows)
+
+    # The router's direct A → B is a 150 km fastest route; 1 → 2 only covers 30 km
+    km = np.full((6, 6), 50.0)
+    km[0, 5] = 150.0
+    km[0, 1] = km[1, 2] = km[2, 5] = 10.0
+    km[0, 3] = km[3, 4] = 50.0
+    km[4, 5] = 60.0
+    matrix = DistanceMatrix([1, 2, 3, 4], km * 1000, np.full((6, 6), 600.0))
+    legs = MatrixLegs(candidates, matrix, A, B)
+
+    kwargs = dict(t_max=6, cost_per_km_per_kg=0.01, max_truck_weight_kg=2000)
+    pruned, stats = score_pairs(candidates, A, B, legs=legs, top_k=1, **kwargs)
+    full, _ = score_pairs(candidates, A, B, legs=legs, top_k=10, **kwargs)
+
+    assert stats["pruned_count"] > 0
+    assert (pruned[0]["buy_warehouse_id"], pruned[0]["sell_warehouse_id"]) == (3, 4)
+    assert pruned[0]["buy_warehouse_id"] == full[0]["buy_warehouse_id"]
+    assert math.isclose(full[1]["net_profit"], 100.0)  # negative detour earns nothing
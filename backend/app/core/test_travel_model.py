@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from app.core import optimizer, routing, travel_model
+from app.core.geo_utils import haversine_km_np
+from app.core.routing import StubProvider
+from app.core.travel_model import TravelModel, samples_from_provider
+from app.testing import MUMBAI, PUNE, load_rows
+
+
+def test_fit_recovers_stub_detour_and_speed():
+    samples = samples_from_provider(StubProvider(detour_factor=1.3, speed_kmh=50), 4000)
+    model = TravelModel.fit(*samples)
+
+    assert np.allclose(model.detour, 1.3)
+    assert np.allclose(model.speed_kmh, 50)
+    km, hours = model.estimate(PUNE[0], PUNE[1], MUMBAI[0], MUMBAI[1])
+    assert hours == pytest.approx(km / 50)
+
+
+def test_fit_is_regional():
+    # West of 80E roads wind (1.6x, 40 km/h); east of it they are straight and fast
+    rng = np.random.default_rng(1)
+    lat1, lat2 = rng.uniform(10, 30, (2, 5000))
+    lon1 = rng.uniform(70, 90, 5000)
+    lon2 = lon1 + rng.uniform(-0.5, 0.5, 5000)
+    straight_km = np.asarray(haversine_km_np(lat1, lon1, lat2, lon2))
+    west = (lon1 + lon2) / 2 < 80
+    road_km = straight_km * np.where(west, 1.6, 1.1)
+    hours = road_km / np.where(west, 40, 70)
+
+    model = TravelModel.fit(lat1, lon1, lat2, lon2, road_km * 1000, hours * 3600, cell_deg=5.0)
+
+    west_cell = model._cells(np.array([20.0]), np.array([72.0]))
+    east_cell = model._cells(np.array([20.0]), np.array([86.0]))
+    assert model.detour[west_cell] == pytest.approx(1.6, rel=0.05)
+    assert model.speed_kmh[west_cell] == pytest.approx(40, rel=0.05)
+    assert model.detour[east_cell] == pytest.approx(1.1, rel=0.05)
+    assert model.speed_kmh[east_cell] == pytest.approx(70, rel=0.05)
+    assert model.detour[0, 0] == pytest.approx(np.median(road_km / straight_km))  # no samples there
+
+
+def test_travel_model_shortlists_what_gets_routed(monkeypatch, tmp_path):
+    provider = StubProvider(detour_factor=1.3)
+    monkeypatch.setattr(routing, "_provider", provider)
+    model = TravelModel.fit(*samples_from_provider(StubProvider(detour_factor=1.3), 2000))
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    travel_model.set_travel_model(TravelModel.load(path))
+    monkeypatch.setattr(optimizer, "USE_ROAD_TIMES", True)
+    monkeypatch.setattr(optimizer, "ROUTING_SHORTLIST_PAIRS", 20)
+    rows = load_rows()
+    args = (rows, PUNE, MUMBAI, 8, 0.001, 2000)
+    try:
+        shortlisted = optimizer.rank_candidates(*args)
+        shortlisted_cells = provider.cells
+
+        travel_model.set_travel_model(None)
+        routed_all = optimizer.rank_candidates(*args)
+    finally:
+        travel_model.set_travel_model(None)
+
+    assert shortlisted_cells < (provider.cells - shortlisted_cells) / 2
+    assert shortlisted[0]["net_profit"] == pytest.approx(routed_all[0]["net_profit"])
@@ -0,0 +1,219 @@
+# travel_model.py
+
+"""
+Calibrated straight-line travel estimates: road km and driving hours
+predicted from haversine legs with per-region detour factors and speeds,
+fitted offline from routing results and stored as a small lookup grid.
+
+Fit from a routing cache file, or by sampling the configured provider
+(from backend/):
+    python -m app.core.travel_model travel_model.npz --cache /app/data/routes.sqlite
+    python -m app.core.travel_model travel_model.npz --samples 20000
+"""
+
+import os
+import sqlite3
+import argparse
+import threading
+from typing import Optional, Tuple
+import numpy as np
+from .geo_utils import haversine_km_np
+from .scoring import FALLBACK_SPEED_KMH, CandidateArrays, HaversineLegs
+
+TRAVEL_MODEL_PATH = os.getenv("TRAVEL_MODEL_PATH", "")
+
+# The India box data/seed_warehouses.py places warehouses in
+DEFAULT_BBOX = (8.0, 37.0, 68.0, 92.0)  # lat_min, lat_max, lon_min, lon_max
+DEFAULT_CELL_DEG = 1.0
+
+# Cells are blended with the country-wide fit as if it were this many samples
+PRIOR_SAMPLES = 20
+# Legs shorter than this are dominated by snapping noise and not fitted
+MIN_FIT_KM = 2.0
+
+
+class TravelModel:
+    """
+    Lookup grid of detour factor (road km / straight-line km, at least 1)
+    and average speed (km/h). A leg uses the cell of its midpoint; legs
+    outside the box use the nearest edge cell.
+    """
+
+    def __init__(self, bbox, cell_deg: float, detour: np.ndarray, speed_kmh: np.ndarray):
+        self.bbox = tuple(float(v) for v in bbox)
+        self.cell_deg = float(cell_deg)
+        self.detour = np.asarray(detour, dtype=np.float64)
+        self.speed_kmh = np.asarray(speed_kmh, dtype=np.float64)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        lat_min, lat_max, lon_min, lon_max = self.bbox
+        return (int(np.ceil((lat_max - lat_min) / self.cell_deg)),
+                int(np.ceil((lon_max - lon_min) / self.cell_deg)))
+
+    def _cells(self, lat, lon):
+        lat_min, _, lon_min, _ = self.bbox
+        n_rows, n_cols = self.shape
+        row = np.clip(((lat - lat_min) // self.cell_deg).astype(np.int64), 0, n_rows - 1)
+        col = np.clip(((lon - lon_min) // self.cell_deg).astype(np.int64), 0, n_cols - 1)
+        return row, col
+
+    def estimate(self, lat1, lon1, lat2, lon2) -> Tuple[np.ndarray, np.ndarray]:
+        """(road km, hours) for straight legs; inputs broadcast like haversine_km_np."""
+        lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2)))
+        straight = haversine_km_np(lat1, lon1, lat2, lon2)
+        row, col = self._cells((lat1 + lat2) / 2, (lon1 + lon2) / 2)
+        km = straight * self.detour[row, col]
+        return km, km / self.speed_kmh[row, col]
+
+    @classmethod
+    def fit(cls, lat1, lon1, lat2, lon2, distance_m, duration_s,
+            bbox=DEFAULT_BBOX, cell_deg: float = DEFAULT_CELL_DEG) -> "TravelModel":
+        """
+        Fits the grid to routed legs: per cell, the median detour factor and
+        speed, shrunk towards the country-wide medians by PRIOR_SAMPLES.
+        Cells without samples get the country-wide values.
+        """
+        lat1, lon1, lat2, lon2, distance_m, duration_s = (
+            np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2, distance_m, duration_s)
+        )
+        straight = haversine_km_np(lat1, lon1, lat2, lon2)
+        ok = (straight >= MIN_FIT_KM) & np.isfinite(distance_m) & np.isfinite(duration_s) & (duration_s > 0)
+        if not ok.any():
+            raise ValueError("no usable routed legs to fit")
+        road_km = distance_m[ok] / 1000
+        ratio = np.maximum(road_km / straight[ok], 1.0)
+        speed = road_km / (duration_s[ok] / 3600)
+
+        model = cls(bbox, cell_deg, np.empty(0), np.empty(0))
+        n_rows, n_cols = model.shape
+        row, col = model._cells((lat1[ok] + lat2[ok]) / 2, (lon1[ok] + lon2[ok]) / 2)
+        cell = row * n_cols + col
+
+        global_ratio, global_speed = float(np.median(ratio)), float(np.median(speed))
+        detour = np.full(n_rows * n_cols, global_ratio)
+        speed_kmh = np.full(n_rows * n_cols, global_speed)
+        for c in np.unique(cell):
+            sel = cell == c
+            n = np.count_nonzero(sel)
+            detour[c] = (n * np.median(ratio[sel]) + PRIOR_SAMPLES * global_ratio) / (n + PRIOR_SAMPLES)
+            speed_kmh[c] = (n * np.median(speed[sel]) + PRIOR_SAMPLES * global_speed) / (n + PRIOR_SAMPLES)
+
+        model.detour = detour.reshape(n_rows, n_cols)
+        model.speed_kmh = speed_kmh.reshape(n_rows, n_cols)
+        return model
+
+    @classmethod
+    def load(cls, path: str) -> "TravelModel":
+        with np.load(path) as z:
+            return cls(z["bbox"], float(z["cell_deg"]), z["detour"], z["speed_kmh"])
+
+    def save(self, path: str):
+        np.savez(path, bbox=np.array(self.bbox), cell_deg=self.cell_deg,
+                 detour=self.detour, speed_kmh=self.speed_kmh)
+
+
+class ModelLegs(HaversineLegs):
+    """Trip legs (km, hours) from a TravelModel instead of a fixed 25 km/h."""
+
+    def __init__(self, candidates: CandidateArrays, model: TravelModel, start_location, end_location):
+        super().__init__(candidates, start_location, end_location)
+        self.model = model
+
+    def source_to_dest(self):
+        D, T = self.model.estimate(self.start[0], self.start[1], self.end[0], self.end[1])
+        return float(D), float(T)
+
+    def from_source(self, rows):
+        c = self.candidates
+        return self.model.estimate(self.start[0], self.start[1], c.lat[rows], c.lon[rows])
+
+    def between(self, from_rows, to_rows):
+        c = self.candidates
+        return self.model.estimate(
+            c.lat[from_rows][:, None], c.lon[from_rows][:, None],
+            c.lat[to_rows][None, :], c.lon[to_rows][None, :],
+        )
+
+    def to_dest(self, rows):
+        c = self.candidates
+        return self.model.estimate(c.lat[rows], c.lon[rows], self.end[0], self.end[1])
+
+
+_model: Optional[TravelModel] = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def get_travel_model() -> Optional[TravelModel]:
+    """The model at TRAVEL_MODEL_PATH, loaded on first use; None if unset."""
+    global _model, _model_loaded
+    with _model_lock:
+        if not _model_loaded:
+            _model = TravelModel.load(TRAVEL_MODEL_PATH) if TRAVEL_MODEL_PATH else None
+            _model_loaded = True
+        return _model
+
+
+def set_travel_model(model: Optional[TravelModel]):
+    global _model, _model_loaded
+    with _model_lock:
+        _model, _model_loaded = model, True
+
+
+def samples_from_cache(path: str, precision: int = 4, limit: int = 1_000_000):
+    """Routed legs stored by RoutingCache's SQLite tier, as fit() arguments."""
+    with sqlite3.connect(path) as db:
+        rows = db.execute(
+            "SELECT a_lat, a_lon, b_lat, b_lon, distance, duration FROM route_cache "
+            "WHERE distance IS NOT NULL AND duration IS NOT NULL LIMIT ?",
+            (limit,),
+        ).fetchall()
+    a = np.array(rows, dtype=np.float64).reshape(-1, 6)
+    a[:, :4] /= 10 ** precision
+    return tuple(a.T)
+
+
+def samples_from_provider(provider, count: int, bbox=DEFAULT_BBOX, cluster: int = 20,
+                          radius_km: float = 150.0, seed: int = 0):
+    """
+    About count routed legs: clusters of points within radius_km of a
+    random centre in bbox, routed all-to-all (trip legs are regional).
+    """
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max, lon_min, lon_max = bbox
+    parts = []
+    for _ in range(max(1, count // (cluster * (cluster - 1)))):
+        lat0, lon0 = rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max)
+        lat = lat0 + rng.uniform(-1, 1, cluster) * radius_km / 111.0
+        lon = lon0 + rng.uniform(-1, 1, cluster) * radius_km / (111.0 * np.cos(np.radians(lat0)))
+        distances, durations = provider.matrix(list(zip(lon, lat)))
+        i, j = np.nonzero(~np.eye(cluster, dtype=bool))
+        parts.append(np.stack([lat[i], lon[i], lat[j], lon[j], distances[i, j], durations[i, j]], axis=1))
+    return tuple(np.concatenate(parts).T)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the straight-line travel model grid.")
+    parser.add_argument("out", help="output .npz")
+    parser.add_argument("--cache", help="fit from this routing cache SQLite file instead of routing")
+    parser.add_argument("--cache-precision", type=int, default=int(os.getenv("ROUTING_CACHE_PRECISION", "4")))
+    parser.add_argument("--samples", type=int, default=20000, help="legs to route when not using --cache")
+    parser.add_argument("--cell-deg", type=float, default=DEFAULT_CELL_DEG)
+    args = parser.parse_args()
+
+    if args.cache:
+        samples = samples_from_cache(args.cache, args.cache_precision)
+    else:
+        from .routing import get_routing_provider
+        samples = samples_from_provider(get_routing_provider(), args.samples)
+
+    model = TravelModel.fit(*samples, cell_deg=args.cell_deg)
+    model.save(args.out)
+    print(f"Fitted {model.shape[0]}x{model.shape[1]} cells from {len(samples[0]):,} legs "
+          f"(median detour {np.median(model.detour):.2f}, speed {np.median(model.speed_kmh):.1f} km/h, "
+          f"fallback was {FALLBACK_SPEED_KMH:g} km/h) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
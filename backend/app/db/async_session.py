@@ -0,0 +1,66 @@
+import os
+from typing import Dict, List, Optional
+from app.db.db_session import (
+    DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT_MS,
+)
+from app.db.queries import warehouses_by_item_params, warehouses_by_item_sql, warehouse_rows
+
+# Optional asyncpg-backed query path for the API
+ASYNC_DB_ENABLED = os.getenv("DB_ASYNC_ENABLED", "false").lower() in ("1", "true", "yes")
+
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    """Creates the async engine on first use, so asyncpg is only needed when enabled."""
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=(
+                {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+                if DB_STATEMENT_TIMEOUT_MS else {}
+            ),
+        )
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+async def load_warehouses_by_item_async(
+    src_lat: float,
+    src_lon: float,
+    dest_lat: float,
+    dest_lon: float,
+    max_detour_meters: float,
+    max_load_capacity: float,
+    cost_per_km: float,
+    per_side_limit: Optional[int] = None,
+) -> List[Dict]:
+    """Async version of queries.load_warehouses_by_item."""
+    params = warehouses_by_item_params(
+        src_lat, src_lon, dest_lat, dest_lon, max_detour_meters, max_load_capacity, cost_per_km,
+        per_side_limit,
+    )
+    async with get_async_sessionmaker()() as db:
+        result = await db.execute(warehouses_by_item_sql(per_side_limit), params)
+        return warehouse_rows(result.fetchall())
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_sessionmaker = None
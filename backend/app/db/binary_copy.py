@@ -0,0 +1,170 @@
+"""
+Query results streamed from PostgreSQL straight into NumPy record arrays.
+
+The query runs as COPY (...) TO STDOUT in binary format with every column
+cast to int8 or float8, so each row arrives as the same fixed-width run of
+big-endian fields. Buffered rows are reinterpreted with np.frombuffer and
+copied column by column into a preallocated record array: no Row objects
+or dicts are built, and memory peaks at the result plus one buffered chunk.
+NULLs (the nullable items columns) shorten their tuple, so a chunk holding
+one is walked tuple by tuple instead, with NULL floats read as NaN.
+"""
+
+import os
+import struct
+from typing import Dict, Optional
+import numpy as np
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from sqlalchemy.orm import Session
+
+# Bytes of COPY data buffered before they are parsed into the result
+COPY_CHUNK_BYTES = int(os.getenv("DB_COPY_CHUNK_BYTES", str(1 << 20)))
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# Signature, flags (int32) and header extension length (int32)
+HEADER_SIZE = len(COPY_SIGNATURE) + 8
+# Field count of -1 (int16) ends the data
+TRAILER = b"\xff\xff"
+
+
+def wire_dtype(dtype: np.dtype) -> np.dtype:
+    """One binary COPY tuple of dtype's columns: field count, then (length, value) per field."""
+    names, formats, offsets = ["fields"], [">i2"], [0]
+    for k, name in enumerate(dtype.names):
+        if dtype[name].itemsize != 8 or dtype[name].kind not in "if":
+            raise ValueError(f"column {name} is {dtype[name]}, only 8-byte ints and floats are streamed")
+        names += [f"{name}_length", name]
+        formats += [">i4", dtype[name].newbyteorder(">")]
+        offsets += [2 + 12 * k, 6 + 12 * k]
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": 2 + 12 * len(dtype.names)})
+
+
+class BinaryCopyReader:
+    """
+    File-like sink for cursor.copy_expert: collects a binary COPY stream of
+    dtype's columns, in order, into a record array of dtype. The array
+    starts at capacity rows and doubles when full; finish() returns it
+    trimmed to the rows received. NULL floats become NaN, as they do in
+    rows fetched the usual way; NULL ints are rejected.
+    """
+
+    def __init__(self, dtype, capacity: int = 1024, chunk_bytes: int = COPY_CHUNK_BYTES):
+        self.dtype = np.dtype(dtype)
+        self.wire = wire_dtype(self.dtype)
+        self.chunk_bytes = max(chunk_bytes, self.wire.itemsize)
+        self.records = np.empty(max(capacity, 1), dtype=self.dtype)
+        self.size = 0
+        self._buf = bytearray()
+        self._header = False
+
+    def write(self, data) -> int:
+        self._buf += data
+        if len(self._buf) >= self.chunk_bytes:
+            self._parse()
+        return len(data)
+
+    def finish(self) -> np.ndarray:
+        self._parse()
+        self._parse_tuples()  # a tail of NULL-shortened tuples
+        if not self._header or bytes(self._buf) != TRAILER:
+            raise ValueError("binary COPY stream ended early")
+        self._buf = bytearray()
+        return self.records[:self.size]
+
+    def _parse(self):
+        if not self._header:
+            if len(self._buf) < HEADER_SIZE:
+                return
+            if bytes(self._buf[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+                raise ValueError("not a binary COPY stream")
+            extension, = struct.unpack_from(">i", self._buf, HEADER_SIZE - 4)
+            if len(self._buf) < HEADER_SIZE + extension:
+                return
+            del self._buf[:HEADER_SIZE + extension]
+            self._header = True
+
+        n = len(self._buf) // self.wire.itemsize
+        if n == 0:
+            return
+        size = n * self.wire.itemsize
+        rows = np.frombuffer(bytes(self._buf[:size]), dtype=self.wire)
+
+        # The buffer starts on a tuple, so if every tuple checks out as
+        # fixed-width they are all aligned
+        names = self.dtype.names
+        if (rows["fields"] != len(names)).any() or any((rows[f"{name}_length"] != 8).any() for name in names):
+            self._parse_tuples()
+            return
+        del self._buf[:size]
+        self._append(rows)
+
+    def _parse_tuples(self):
+        """Parses the buffered tuples one at a time, allowing NULL floats."""
+        names, buf = self.dtype.names, self._buf
+        parsed, pos = [], 0
+        while len(buf) - pos >= 2:
+            fields, = struct.unpack_from(">h", buf, pos)
+            if fields == -1:  # trailer
+                break
+            if fields != len(names):
+                raise ValueError(f"binary COPY rows do not have {len(names)} fields")
+            row, at = [], pos + 2
+            for name in names:
+                if len(buf) - at < 4:
+                    break
+                length, = struct.unpack_from(">i", buf, at)
+                at += 4
+                if length == -1 and self.dtype[name].kind == "f":
+                    row.append(np.nan)
+                    continue
+                if length != 8:
+                    raise ValueError(f"column {name} has NULL or non-8-byte values")
+                if len(buf) - at < 8:
+                    break
+                row.append(struct.unpack_from(">q" if self.dtype[name].kind == "i" else ">d", buf, at)[0])
+                at += 8
+            else:
+                parsed.append(tuple(row))
+                pos = at
+                continue
+            break  # incomplete tuple, wait for more data
+        del buf[:pos]
+        if parsed:
+            self._append(np.array(parsed, dtype=self.dtype))
+
+    def _append(self, rows: np.ndarray):
+        n = len(rows)
+        names = self.dtype.names
+        if self.size + n > len(self.records):
+            grown = np.empty(max(2 * len(self.records), self.size + n), dtype=self.dtype)
+            grown[:self.size] = self.records[:self.size]
+            self.records = grown
+        out = self.records[self.size:self.size + n]
+        for name in names:
+            out[name] = rows[name]
+        self.size += n
+
+
+def copy_statement(stmt, dtype: np.dtype) -> str:
+    """
+    COPY ... TO STDOUT (FORMAT binary) of stmt's rows, selecting and casting
+    dtype's columns in order; bind parameters are left as %(name)s.
+    """
+    query = str(stmt.compile(dialect=PGDialect_psycopg2())).strip().rstrip(";")
+    columns = ", ".join(
+        f"q.{name}::{'int8' if dtype[name].kind == 'i' else 'float8'}" for name in dtype.names
+    )
+    return f"COPY (SELECT {columns} FROM ({query}) q) TO STDOUT WITH (FORMAT binary)"
+
+
+def copy_records(db: Session, stmt, params: Dict, dtype, capacity: Optional[int] = None) -> np.ndarray:
+    """Runs stmt with params on db's connection and returns its rows as a record array of dtype."""
+    dtype = np.dtype(dtype)
+    reader = BinaryCopyReader(dtype, capacity or 1024)
+    cursor = db.connection().connection.cursor()
+    try:
+        sql = cursor.mogrify(copy_statement(stmt, dtype), params).decode()
+        cursor.copy_expert(sql, reader)
+    finally:
+        cursor.close()
+    return reader.finish()
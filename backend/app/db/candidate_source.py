@@ -0,0 +1,178 @@
+import os
+import csv
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy.orm import Session
+from app.db.queries import load_warehouses_by_item, records_from_rows, stream_warehouses_by_item
+from app.db.snapshot import is_snapshot, load_snapshot as load_columnar_snapshot
+from app.db.warehouse_index import WarehouseIndex, get_warehouse_index, set_warehouse_index
+
+# Serve candidates from this snapshot (see from_path) instead of PostGIS
+CANDIDATE_SNAPSHOT_PATH = os.getenv("CANDIDATE_SNAPSHOT_PATH", "")
+
+# Stream SQL candidates into NumPy arrays with binary COPY instead of fetching row dicts
+CANDIDATE_COPY_ENABLED = os.getenv("CANDIDATE_COPY_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Columns of each table in CSV / NPZ snapshots
+WAREHOUSE_COLUMNS = ("id", "lat", "lon")
+WAREHOUSE_ITEM_COLUMNS = ("warehouse_id", "item_id", "quantity")
+ITEM_COLUMNS = ("id", "unit_weight", "unit_volume", "buy_price", "sell_price")
+
+
+class CandidateSource(ABC):
+    """
+    Where the optimizer gets candidate rows from. Implementations return
+    the rows of queries.load_warehouses_by_item (same detour filter, same
+    demand_metric ranking) for the same keyword arguments.
+    """
+
+    @abstractmethod
+    def load_warehouses_by_item(
+        self,
+        src_lat: float,
+        src_lon: float,
+        dest_lat: float,
+        dest_lon: float,
+        max_detour_meters: float,
+        max_load_capacity: float,
+        cost_per_km: float,
+        per_side_limit: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        ...
+
+    def load_candidate_records(self, **kwargs) -> np.ndarray:
+        """The same rows as a queries.CANDIDATE_DTYPE record array."""
+        return records_from_rows(self.load_warehouses_by_item(**kwargs))
+
+
+class SqlCandidateSource(CandidateSource):
+    """
+    PostGIS, through queries.load_warehouses_by_item, or with
+    CANDIDATE_COPY_ENABLED queries.stream_warehouses_by_item for records.
+    """
+
+    def __init__(self, db: Optional[Session] = None):
+        self.db = db
+
+    def load_warehouses_by_item(self, *args, **kwargs):
+        return load_warehouses_by_item(*args, **kwargs, db=self.db)
+
+    def load_candidate_records(self, **kwargs):
+        if CANDIDATE_COPY_ENABLED:
+            return stream_warehouses_by_item(**kwargs, db=self.db)
+        return super().load_candidate_records(**kwargs)
+
+
+class InMemoryCandidateSource(CandidateSource):
+    """
+    A WarehouseIndex, built from the live tables or from a snapshot on disk,
+    so the optimizer runs without a database (offline what-if runs,
+    hermetic load tests).
+    """
+
+    def __init__(self, index: WarehouseIndex):
+        self.index = index
+
+    def load_warehouses_by_item(self, *args, **kwargs):
+        return self.index.load_warehouses_by_item(*args, **kwargs)
+
+    @classmethod
+    def from_csv(cls, directory: str) -> "InMemoryCandidateSource":
+        """
+        Reads warehouses.csv, warehouse_items.csv and items.csv (headers
+        required, extra columns ignored), e.g. as written by psql \\copy
+        with lat/lon taken from ST_Y/ST_X of the location.
+        """
+        w = _read_csv(os.path.join(directory, "warehouses.csv"), WAREHOUSE_COLUMNS)
+        wi = _read_csv(os.path.join(directory, "warehouse_items.csv"), WAREHOUSE_ITEM_COLUMNS)
+        it = _read_csv(os.path.join(directory, "items.csv"), ITEM_COLUMNS)
+        return cls(_index_from_columns(w, wi, it))
+
+    @classmethod
+    def from_npz(cls, path: str) -> "InMemoryCandidateSource":
+        """Reads a snapshot written by save_npz."""
+        with np.load(path) as z:
+            tables = [
+                {c: z[f"{table}.{c}"] for c in columns}
+                for table, columns in (
+                    ("warehouses", WAREHOUSE_COLUMNS),
+                    ("warehouse_items", WAREHOUSE_ITEM_COLUMNS),
+                    ("items", ITEM_COLUMNS),
+                )
+            ]
+        return cls(_index_from_columns(*tables))
+
+    @classmethod
+    def from_path(cls, path: str) -> "InMemoryCandidateSource":
+        """A columnar snapshot (memory-mapped), a .npz file or a directory of CSV files."""
+        if is_snapshot(path):
+            return cls(load_columnar_snapshot(path))
+        return cls.from_npz(path) if path.endswith(".npz") else cls.from_csv(path)
+
+
+def save_npz(index: WarehouseIndex, path: str):
+    """Writes the index's three tables to one compressed .npz snapshot."""
+    wi_pos, wi_item, wi_qty = [], [], []
+    for item_id, (positions, quantity) in index.by_item.items():
+        wi_pos.append(positions)
+        wi_item.append(np.full(len(positions), item_id, dtype=np.int64))
+        wi_qty.append(quantity)
+    item_ids = np.array(sorted(index.items), dtype=np.int64)
+
+    arrays = {
+        "warehouses.id": index.warehouse_ids,
+        "warehouses.lat": index.lat,
+        "warehouses.lon": index.lon,
+        "warehouse_items.warehouse_id": index.warehouse_ids[np.concatenate(wi_pos)] if wi_pos else np.empty(0, np.int64),
+        "warehouse_items.item_id": np.concatenate(wi_item) if wi_item else np.empty(0, np.int64),
+        "warehouse_items.quantity": np.concatenate(wi_qty) if wi_qty else np.empty(0),
+        "items.id": item_ids,
+    }
+    for c in ITEM_COLUMNS[1:]:
+        arrays[f"items.{c}"] = np.array([index.items[int(i)][c] for i in item_ids], dtype=np.float64)
+    np.savez_compressed(path, **arrays)
+
+
+def _read_csv(path: str, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    with open(path, newline="") as f:
+        header = next(csv.reader(f))
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError(f"{path} lacks columns {missing}")
+    data = np.loadtxt(
+        path, delimiter=",", skiprows=1, ndmin=2,
+        usecols=[header.index(c) for c in columns], dtype=np.float64,
+    )
+    return {c: data[:, k] for k, c in enumerate(columns)}
+
+
+def _index_from_columns(w: Dict, wi: Dict, it: Dict) -> WarehouseIndex:
+    return WarehouseIndex(
+        warehouse_ids=w["id"].astype(np.int64),
+        lat=w["lat"],
+        lon=w["lon"],
+        wi_warehouse_id=wi["warehouse_id"].astype(np.int64),
+        wi_item_id=wi["item_id"].astype(np.int64),
+        wi_quantity=wi["quantity"],
+        items={
+            int(item_id): {c: float(it[c][k]) for c in ITEM_COLUMNS[1:]}
+            for k, item_id in enumerate(it["id"])
+        },
+    )
+
+
+def load_snapshot(path: str) -> WarehouseIndex:
+    """Loads a snapshot and installs it as the process-wide index."""
+    index = InMemoryCandidateSource.from_path(path).index
+    set_warehouse_index(index)
+    return index
+
+
+def get_candidate_source(db: Optional[Session] = None) -> CandidateSource:
+    """The loaded in-memory index if there is one, else PostGIS via db."""
+    index = get_warehouse_index()
+    if index is not None:
+        return InMemoryCandidateSource(index)
+    return SqlCandidateSource(db)
@@ -0,0 +1,107 @@
+import json
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import text
+from app.db.db_session import session_scope
+from app.db.inventory_version import DELTA_CHANNEL, bump_version
+from app.db.warehouse_index import apply_inventory_rows, inventory_lock
+
+# Rows per pg_notify payload (payloads must stay under 8000 bytes)
+NOTIFY_ROWS = 150
+
+Key = Tuple[int, int]  # (warehouse_id, item_id)
+
+_UPSERT = """
+    INSERT INTO warehouse_items (warehouse_id, item_id, quantity)
+    SELECT * FROM unnest(
+        CAST(:warehouse_ids AS integer[]),
+        CAST(:item_ids AS integer[]),
+        CAST(:quantities AS double precision[])
+    )
+    ON CONFLICT (warehouse_id, item_id) DO UPDATE SET quantity = {new_quantity}
+    RETURNING warehouse_id, item_id, quantity
+"""
+
+# quantity given: replace the stored value
+SET_QUANTITIES_SQL = text(_UPSERT.format(new_quantity="EXCLUDED.quantity"))
+# delta given: add to the stored value (new rows start from zero)
+ADD_QUANTITIES_SQL = text(_UPSERT.format(new_quantity="warehouse_items.quantity + EXCLUDED.quantity"))
+
+
+def fold_changes(changes: Iterable[Dict]) -> Tuple[Dict[Key, float], Dict[Key, float]]:
+    """
+    Collapses a batch to at most one write per (warehouse_id, item_id),
+    in order: a change with "quantity" replaces whatever came before it,
+    changes with "delta" add up.
+
+    Returns:
+        (sets, adds): keys whose final value is absolute, and keys that
+        only carry a sum of deltas.
+    """
+    sets: Dict[Key, float] = {}
+    adds: Dict[Key, float] = {}
+    for c in changes:
+        key = (c["warehouse_id"], c["item_id"])
+        if c.get("quantity") is not None:
+            sets[key] = c["quantity"]
+            adds.pop(key, None)
+        elif key in sets:
+            sets[key] += c["delta"]
+        else:
+            adds[key] = adds.get(key, 0.0) + c["delta"]
+    return sets, adds
+
+
+def _columns(batch: Dict[Key, float]) -> Dict:
+    return {
+        "warehouse_ids": [k[0] for k in batch],
+        "item_ids": [k[1] for k in batch],
+        "quantities": list(batch.values()),
+    }
+
+
+def apply_inventory_deltas(changes: Iterable[Dict], db=None) -> Dict:
+    """
+    Applies a batch of stock changes in one transaction.
+
+    Each change names warehouse_id and item_id plus either "delta" (added
+    to the stored quantity) or "quantity" (replaces it); missing rows are
+    inserted. Quantities keep the table's sign convention: positive is
+    supply, negative is demand, so a completed trade adds -q at the seller
+    and +q at the buyer.
+
+    The resulting rows are published on DELTA_CHANNEL with the commit,
+    applied to this process's in-memory index, and the inventory version
+    is bumped so cached /optimize results are dropped. The commit and the
+    local apply hold inventory_lock, which the listener also takes to
+    replay deltas, so a later batch from another process cannot be
+    overwritten by this one's older rows.
+
+    Returns:
+        {"changed": rows written, "version": new inventory version}
+    """
+    sets, adds = fold_changes(changes)
+    rows: List[Tuple[int, int, float]] = []
+
+    with session_scope(db) as db:
+        try:
+            for sql, batch in ((SET_QUANTITIES_SQL, sets), (ADD_QUANTITIES_SQL, adds)):
+                if batch:
+                    rows += [tuple(r) for r in db.execute(sql, _columns(batch)).fetchall()]
+            # Delivered on commit, so listeners never see a rolled-back change
+            for i in range(0, len(rows), NOTIFY_ROWS):
+                db.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": DELTA_CHANNEL, "payload": json.dumps(rows[i:i + NOTIFY_ROWS])},
+                )
+            # Conflicting batches already wait on row locks above; the lock
+            # keeps the local apply ahead of replays of later commits
+            with inventory_lock:
+                db.commit()
+                # Don't wait for our own notification to update the local index
+                apply_inventory_rows(rows)
+                version = bump_version()
+        except Exception:
+            db.rollback()
+            raise
+
+    return {"changed": len(rows), "version": version}
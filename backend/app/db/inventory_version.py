@@ -0,0 +1,94 @@
+import os
+import json
+import logging
+import select
+import threading
+from typing import Optional
+from app.db.db_session import engine
+from app.db.warehouse_index import apply_inventory_rows, inventory_lock
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel the warehouse_items trigger in init.sql notifies on
+CHANNEL = "inventory_changed"
+# Channel app.db.inventory publishes changed rows on, for in-memory indexes
+DELTA_CHANNEL = "inventory_delta"
+
+LISTEN_ENABLED = os.getenv("INVENTORY_LISTEN_ENABLED", "false").lower() in ("1", "true", "yes")
+
+_version = 0
+_lock = threading.Lock()
+_listener: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def current_version() -> int:
+    """Process-local inventory version; caches compare entries against it."""
+    return _version
+
+
+def bump_version(to: Optional[int] = None) -> int:
+    """Advances the version (to `to` if given and newer, else by one)."""
+    global _version
+    with _lock:
+        _version = max(_version + 1, to) if to is not None else _version + 1
+        return _version
+
+
+def handle_notification(channel: str, payload: str):
+    """Applies one NOTIFY from CHANNEL or DELTA_CHANNEL."""
+    if channel == DELTA_CHANNEL:
+        # Absolute quantities, so replaying our own changes is harmless
+        with inventory_lock:
+            apply_inventory_rows(json.loads(payload))
+    else:
+        bump_version(int(payload) if payload.isdigit() else None)
+
+
+def _listen_once(connected: threading.Event):
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        conn.autocommit = True  # required for LISTEN
+        conn.cursor().execute(f"LISTEN {CHANNEL}; LISTEN {DELTA_CHANNEL};")
+        connected.set()
+        while not _stop.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                handle_notification(note.channel, note.payload)
+    finally:
+        raw.invalidate()  # autocommit connection must not go back to the pool
+
+
+def _listen():
+    while not _stop.is_set():
+        connected = threading.Event()
+        try:
+            _listen_once(connected)
+        except Exception as exc:
+            if connected.is_set():
+                logger.warning("Inventory listener lost its connection: %s; reconnecting", exc)
+                bump_version()  # changes may have been missed while disconnected
+            else:
+                logger.warning("Inventory listener cannot connect: %s; retrying", exc)
+            _stop.wait(5.0)
+
+
+def start_inventory_listener():
+    """
+    Follows warehouse_items changes made by any process via LISTEN/NOTIFY:
+    bumps the version and applies published deltas to the in-memory index.
+    """
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen, name="inventory-listener", daemon=True)
+    _listener.start()
+
+
+def stop_inventory_listener():
+    _stop.set()
@@ -1,43 +1,204 @@
-from typing import List, Dict
+import os
+import math
+from typing import List, Dict, Optional
+import numpy as np
 from sqlalchemy import text
-from app.db.db_session import get_db
+from sqlalchemy.orm import Session
+from app.db.binary_copy import copy_records
+from app.db.db_session import session_scope
+from app.core.geo_utils import haversine_km
 
+EARTH_RADIUS_M = 6371000.0
 
-def load_candidate_warehouses(B: Dict, C: Dict, max_detour_km: float = 30) -> List[Dict]:
+# Rows in the mixed candidate ranking (WAREHOUSES_BY_ITEM_SQL)
+CANDIDATE_LIMIT = int(os.getenv("CANDIDATE_LIMIT", "50"))
+
+# One candidate row, as streamed by stream_warehouses_by_item
+CANDIDATE_DTYPE = np.dtype([
+    ("warehouse_id", "<i8"),
+    ("quantity", "<f8"),
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("item_id", "<i8"),
+    ("unit_weight", "<f8"),
+    ("unit_volume", "<f8"),
+    ("sell_price", "<f8"),
+    ("buy_price", "<f8"),
+    ("demand_metric", "<f8"),
+])
+
+
+def corridor_half_width_meters(
+    src_lat: float, src_lon: float, dest_lat: float, dest_lon: float, max_detour_meters: float
+) -> float:
     """
-    Loads warehouses near the B–C segment where total detour B→W→C is within max_detour_km.
-    Returns list of dicts with warehouse_id, lat, lon, and WKT location.
+    Widest distance from the src–dest segment of any point whose detour
+    d(W,src) + d(W,dest) - d(src,dest) is within max_detour_meters, i.e. the
+    semi-minor axis of the detour ellipse on the sphere. Used as the
+    ST_DWithin radius of the index-assisted pre-filter, padded to absorb the
+    sphere/spheroid difference.
     """
-    db = next(get_db())  
+    half = haversine_km(src_lat, src_lon, dest_lat, dest_lon) * 1000 / 2 / EARTH_RADIUS_M
+    reach = half + max_detour_meters / 2 / EARTH_RADIUS_M
+    if reach >= math.pi / 2:
+        return math.pi * EARTH_RADIUS_M  # ellipse wraps the globe, no useful bound
+    ratio = min(math.cos(reach) / math.cos(half), 1.0)
+    return math.acos(ratio) * EARTH_RADIUS_M * 1.005 + 100
+
+
+# Pre-filter: GiST-indexable ST_DWithin around the segment.
+# Exact check: detour ellipse, evaluated only on the pre-filtered rows.
+CORRIDOR_PREDICATE = """
+    ST_DWithin(
+        w.location,
+        ST_MakeLine(
+            ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326),
+            ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326)
+        )::geography,
+        :corridor_meters
+    )
+    AND
+    ST_Distance(
+        w.location,
+        ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326)::geography
+    ) +
+    ST_Distance(
+        w.location,
+        ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326)::geography
+    ) -
+    ST_Distance(
+        ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326)::geography,
+        ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326)::geography
+    )
+    <= :max_detour_meters
+"""
+
+
+def corridor_params(
+    src_lat: float, src_lon: float, dest_lat: float, dest_lon: float, max_detour_meters: float
+) -> Dict:
+    return {
+        "src_lat": src_lat, "src_lon": src_lon,
+        "dest_lat": dest_lat, "dest_lon": dest_lon,
+        "max_detour_meters": max_detour_meters,
+        "corridor_meters": corridor_half_width_meters(src_lat, src_lon, dest_lat, dest_lon, max_detour_meters),
+    }
 
-    sql = text("""
+
+CANDIDATE_WAREHOUSES_SQL = text(f"""
+    SELECT
+        w.id AS warehouse_id,
+        ST_Y(w.location::geometry) AS lat,
+        ST_X(w.location::geometry) AS lon
+    FROM warehouses w
+    WHERE {CORRIDOR_PREDICATE}
+""")
+
+
+WAREHOUSES_BY_ITEM_SQL = text(f"""
+    WITH filtered_warehouses AS (
         SELECT
-            w.id AS warehouse_id,
-            ST_Y(w.location::geometry) AS lat,
-            ST_X(w.location::geometry) AS lon
+            w.id,
+            w.location
         FROM warehouses w
-        WHERE
-            ST_Distance(
-                w.location,
-                ST_SetSRID(ST_MakePoint(:blon, :blat), 4326)::geography
-            ) +
-            ST_Distance(
-                w.location,
-                ST_SetSRID(ST_MakePoint(:clon, :clat), 4326)::geography
-            ) -
-            ST_Distance( 
-                ST_SetSRID(ST_MakePoint(:blon, :blat), 4326)::geography,
-                ST_SetSRID(ST_MakePoint(:clon, :clat), 4326)::geography
-            )
-            <= :max_detour_meters
-    """)
-
-
-    result = db.execute(sql, {
-        "blat": B["lat"], "blon": B["lon"],
-        "clat": C["lat"], "clon": C["lon"],
-        "max_detour_meters": max_detour_km * 1000
-    })
+        WHERE {CORRIDOR_PREDICATE}
+    )
+    SELECT
+        wi.warehouse_id,
+        wi.quantity,
+        ST_Y(f.location::geometry) AS lat,
+        ST_X(f.location::geometry) AS lon,
+        i.id AS item_id,
+        i.unit_weight,
+        i.unit_volume,
+        i.sell_price,
+        i.buy_price,
+        LEAST(
+            wi.quantity * (i.sell_price - i.buy_price),
+            :max_load_capacity * (i.sell_price - i.buy_price)/i.unit_weight
+        ) -
+        (
+            (
+                (
+                    ST_DistanceSphere(src_geom, f.location::geometry) * 1.25 +
+                    ST_DistanceSphere(dest_geom, f.location::geometry) * 0.75
+                ) / 2
+            ) * :cost_per_km
+        ) AS demand_metric
+    FROM warehouse_items wi
+    JOIN items i
+      ON wi.item_id = i.id
+    JOIN filtered_warehouses f
+      ON wi.warehouse_id = f.id,
+      (SELECT ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326) AS src_geom) src,
+      (SELECT ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326) AS dest_geom) dest
+    ORDER BY demand_metric DESC
+    LIMIT :limit;
+""")
+
+
+def _stock_side_sql(table: str, src_weight: float, dest_weight: float) -> str:
+    # Suppliers are visited first, so distance from the source weighs more;
+    # demanders mirror that towards the destination
+    return f"""
+        SELECT
+            w.warehouse_id,
+            w.quantity,
+            ST_Y(w.location::geometry) AS lat,
+            ST_X(w.location::geometry) AS lon,
+            w.item_id,
+            w.unit_weight,
+            w.unit_volume,
+            w.sell_price,
+            w.buy_price,
+            LEAST(w.stock_value, :max_load_capacity * w.margin_per_kg) -
+            (
+                (
+                    ST_DistanceSphere(src_geom, w.location::geometry) * {src_weight} +
+                    ST_DistanceSphere(dest_geom, w.location::geometry) * {dest_weight}
+                ) / 2
+            ) * :cost_per_km AS demand_metric
+        FROM {table} w,
+          (SELECT ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326) AS src_geom) src,
+          (SELECT ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326) AS dest_geom) dest
+        WHERE {CORRIDOR_PREDICATE}
+    """
+
+
+# Top suppliers and top demanders of every item in the corridor, ranked
+# independently from the item_supply / item_demand tables (see init.sql), so
+# each item keeps both sides instead of competing in one mixed LIMIT.
+ITEM_STOCK_SQL = text(f"""
+    WITH ranked AS (
+        SELECT
+            c.*,
+            row_number() OVER (
+                PARTITION BY c.item_id, c.quantity > 0
+                ORDER BY c.demand_metric DESC
+            ) AS side_rank
+        FROM (
+            {_stock_side_sql("item_supply", 1.25, 0.75)}
+            UNION ALL
+            {_stock_side_sql("item_demand", 0.75, 1.25)}
+        ) c
+    )
+    SELECT * FROM ranked
+    WHERE side_rank <= :per_side_limit
+    ORDER BY demand_metric DESC;
+""")
+
+
+def load_candidate_warehouses(B: Dict, C: Dict, max_detour_km: float = 30, db: Optional[Session] = None) -> List[Dict]:
+    """
+    Loads warehouses near the B–C segment where total detour B→W→C is within max_detour_km.
+    Returns list of dicts with warehouse_id, lat, lon, and WKT location.
+    """
+    with session_scope(db) as db:
+        result = db.execute(
+            CANDIDATE_WAREHOUSES_SQL,
+            corridor_params(B["lat"], B["lon"], C["lat"], C["lon"], max_detour_km * 1000)
+        )
+        rows = result.fetchall()
 
     return [
         {
@@ -45,87 +206,40 @@ def load_candidate_warehouses(B: Dict, C: Dict, max_detour_km: float = 30) -> Li
             "lat": row.lat,
             "lon": row.lon
         }
-        for row in result.fetchall()
+        for row in rows
     ]
 
-def load_warehouses_by_item(
+
+def warehouses_by_item_params(
     src_lat: float,
     src_lon: float,
     dest_lat: float,
     dest_lon: float,
     max_detour_meters: float,
     max_load_capacity: float,
-    cost_per_km: float
-) -> List[Dict]:
-    
-    db = next(get_db())
-
-    sql = text("""
-        WITH filtered_warehouses AS (
-            SELECT
-                w.id,
-                w.location
-            FROM warehouses w
-            WHERE
-                ST_Distance(
-                    w.location,
-                    ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326)::geography
-                ) +
-                ST_Distance(
-                    w.location,
-                    ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326)::geography
-                ) -
-                ST_Distance(
-                    ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326)::geography,
-                    ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326)::geography
-                )
-                <= :max_detour_meters
-        )
-        SELECT
-            wi.warehouse_id,
-            wi.quantity,
-            ST_Y(f.location::geometry) AS lat,
-            ST_X(f.location::geometry) AS lon,
-            i.id AS item_id,
-            i.unit_weight,
-            i.unit_volume,
-            i.sell_price,
-            i.buy_price,
-            LEAST(
-                wi.quantity * (i.sell_price - i.buy_price),
-                :max_load_capacity * (i.sell_price - i.buy_price)/i.unit_weight
-            ) -
-            (
-                (
-                    (
-                        ST_DistanceSphere(src_geom, f.location::geometry) * 1.25 +
-                        ST_DistanceSphere(dest_geom, f.location::geometry) * 0.75
-                    ) / 2
-                ) * :cost_per_km
-            ) AS demand_metric
-        FROM warehouse_items wi
-        JOIN items i
-          ON wi.item_id = i.id
-        JOIN filtered_warehouses f
-          ON wi.warehouse_id = f.id,
-          (SELECT ST_SetSRID(ST_MakePoint(:src_lon, :src_lat), 4326) AS src_geom) src,
-          (SELECT ST_SetSRID(ST_MakePoint(:dest_lon, :dest_lat), 4326) AS dest_geom) dest
-        ORDER BY demand_metric DESC
-        LIMIT 50;
-    """)
-
-    result = db.execute(sql, {
-        "max_detour_meters": max_detour_meters,
-        "src_lon": src_lon,
-        "src_lat": src_lat,
-        "dest_lon": dest_lon,
-        "dest_lat": dest_lat,
+    cost_per_km: float,
+    per_side_limit: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Dict:
+    params = corridor_params(src_lat, src_lon, dest_lat, dest_lon, max_detour_meters)
+    params.update({
         "max_load_capacity": max_load_capacity,
         "cost_per_km": cost_per_km
     })
+    if per_side_limit:
+        params["per_side_limit"] = per_side_limit
+    else:
+        params["limit"] = limit or CANDIDATE_LIMIT
+    return params
+
 
-    rows = result.fetchall()
+def warehouses_by_item_sql(per_side_limit: Optional[int] = None):
+    """Per-side ITEM_STOCK_SQL when a per-side limit is set, else the mixed top CANDIDATE_LIMIT."""
+    return ITEM_STOCK_SQL if per_side_limit else WAREHOUSES_BY_ITEM_SQL
 
+
+def warehouse_rows(rows) -> List[Dict]:
+    """Converts WAREHOUSES_BY_ITEM_SQL result rows to dicts."""
     warehouses = []
     for row in rows:
         warehouses.append({
@@ -141,4 +255,68 @@ def load_warehouses_by_item(
             "demand_metric": row.demand_metric
         })
 
-    return warehouses
\ No newline at end of file
+    return warehouses
+
+
+def records_from_rows(rows: List[Dict]) -> np.ndarray:
+    """Candidate row dicts as a CANDIDATE_DTYPE record array."""
+    records = np.empty(len(rows), dtype=CANDIDATE_DTYPE)
+    for name in CANDIDATE_DTYPE.names:
+        records[name] = [r[name] for r in rows]
+    return records
+
+
+def load_warehouses_by_item(
+    src_lat: float,
+    src_lon: float,
+    dest_lat: float,
+    dest_lon: float,
+    max_detour_meters: float,
+    max_load_capacity: float,
+    cost_per_km: float,
+    per_side_limit: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: Optional[Session] = None
+) -> List[Dict]:
+    """
+    Candidate rows in the corridor ranked by demand_metric: the top
+    CANDIDATE_LIMIT (or limit) overall, or with per_side_limit the top
+    suppliers and the top demanders of each item (from the item_supply /
+    item_demand tables).
+    """
+    params = warehouses_by_item_params(
+        src_lat, src_lon, dest_lat, dest_lon, max_detour_meters, max_load_capacity, cost_per_km,
+        per_side_limit, limit,
+    )
+    with session_scope(db) as db:
+        rows = db.execute(warehouses_by_item_sql(per_side_limit), params).fetchall()
+
+    return warehouse_rows(rows)
+
+
+def stream_warehouses_by_item(
+    src_lat: float,
+    src_lon: float,
+    dest_lat: float,
+    dest_lon: float,
+    max_detour_meters: float,
+    max_load_capacity: float,
+    cost_per_km: float,
+    per_side_limit: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: Optional[Session] = None
+) -> np.ndarray:
+    """
+    load_warehouses_by_item's rows, in the same order, as a CANDIDATE_DTYPE
+    record array streamed with binary COPY (see binary_copy), so large
+    limits cost no per-row Python objects.
+    """
+    params = warehouses_by_item_params(
+        src_lat, src_lon, dest_lat, dest_lon, max_detour_meters, max_load_capacity, cost_per_km,
+        per_side_limit, limit,
+    )
+    with session_scope(db) as db:
+        return copy_records(
+            db, warehouses_by_item_sql(per_side_limit), params, CANDIDATE_DTYPE,
+            capacity=None if per_side_limit else params["limit"],
+        )
@@ -0,0 +1,177 @@
+"""
+Columnar snapshots of the warehouse dataset.
+
+A snapshot is a directory with one .npy file per column plus manifest.json,
+which records the format version, the row count and dtype of every column
+and the grid the index was built with. Besides the raw tables it stores the
+index's derived arrays (grid cell order, id order, warehouse_items grouped
+by item), so loading is a handful of np.load(mmap_mode="r") calls: nothing
+is parsed, sorted or copied, and every worker mapping the same snapshot
+shares one copy in the page cache.
+
+Export from the configured database (from backend/):
+    python -m app.db.snapshot /data/snapshot
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import numpy as np
+from app.db.warehouse_index import WarehouseIndex
+
+SNAPSHOT_FORMAT = "trade_optimizer.warehouse_snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+
+ITEM_FIELDS = ("unit_weight", "unit_volume", "buy_price", "sell_price")
+
+# table -> column -> dtype; every column of a table has the same length
+SCHEMA = {
+    "warehouses": {"id": "<i8", "lat": "<f8", "lon": "<f8", "id_order": "<i8", "cell_order": "<i8"},
+    "grid": {"cell_start": "<i8"},
+    # Rows grouped by item_id, and by warehouse position within an item
+    "warehouse_items": {"warehouse_id": "<i8", "position": "<i8", "item_id": "<i8", "quantity": "<f8"},
+    # One row per item present in warehouse_items: its slice of that table
+    "item_rows": {"item_id": "<i8", "start": "<i8", "stop": "<i8"},
+    "items": {"id": "<i8", **{f: "<f8" for f in ITEM_FIELDS}},
+}
+
+
+def is_snapshot(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def export_snapshot(index: WarehouseIndex, directory: str, source: Optional[str] = None) -> Dict:
+    """
+    Writes index to directory as a snapshot and returns its manifest. The
+    manifest is written last, so a directory without one is incomplete.
+    """
+    item_ids = sorted(index.by_item)
+    groups = [index.by_item[i] for i in item_ids]
+    sizes = np.array([len(pos) for pos, _ in groups], dtype=np.int64)
+    stop = np.cumsum(sizes)
+    position = np.concatenate([pos for pos, _ in groups]) if groups else np.empty(0, np.int64)
+    catalog = sorted(index.items)
+
+    columns = {
+        "warehouses": {
+            "id": index.warehouse_ids,
+            "lat": index.lat,
+            "lon": index.lon,
+            "id_order": index._id_order,
+            "cell_order": index.cell_order,
+        },
+        "grid": {"cell_start": index.cell_start},
+        "warehouse_items": {
+            "warehouse_id": index.warehouse_ids[position],
+            "position": position,
+            "item_id": np.repeat(np.array(item_ids, dtype=np.int64), sizes),
+            "quantity": np.concatenate([q for _, q in groups]) if groups else np.empty(0),
+        },
+        "item_rows": {"item_id": np.array(item_ids), "start": stop - sizes, "stop": stop},
+        "items": {
+            "id": np.array(catalog),
+            **{f: np.array([index.items[i][f] for i in catalog]) for f in ITEM_FIELDS},
+        },
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    tables = {}
+    for table, cols in columns.items():
+        rows = None
+        for name, dtype in SCHEMA[table].items():
+            arr = np.ascontiguousarray(cols[name], dtype=dtype)
+            rows = len(arr) if rows is None else rows
+            if len(arr) != rows:
+                raise ValueError(f"{table}.{name} has {len(arr)} rows, expected {rows}")
+            np.save(os.path.join(directory, f"{table}.{name}.npy"), arr)
+        tables[table] = {"rows": rows, "columns": dict(SCHEMA[table])}
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "source": source,
+        "grid": index.grid_params(),
+        "tables": tables,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def read_manifest(directory: str) -> Dict:
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{directory} is not a warehouse snapshot")
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"{directory} has snapshot version {manifest.get('version')}, "
+            f"this build reads version {SNAPSHOT_VERSION}; re-export it"
+        )
+    return manifest
+
+
+def load_snapshot(directory: str, mmap: bool = True) -> WarehouseIndex:
+    """
+    Opens a snapshot as a WarehouseIndex. With mmap (the default) the
+    arrays are read-only memory maps of the .npy files; stock updates
+    (apply_quantities) still work, as they swap in new per-item arrays.
+    """
+    manifest = read_manifest(directory)
+    cols = {}
+    for table, spec in manifest["tables"].items():
+        for name, dtype in spec["columns"].items():
+            arr = np.load(os.path.join(directory, f"{table}.{name}.npy"), mmap_mode="r" if mmap else None)
+            if arr.dtype != np.dtype(dtype) or arr.shape != (spec["rows"],):
+                raise ValueError(f"{table}.{name} does not match the manifest ({arr.dtype}{arr.shape})")
+            cols[f"{table}.{name}"] = arr
+
+    position, quantity = cols["warehouse_items.position"], cols["warehouse_items.quantity"]
+    by_item = {
+        int(item_id): (position[start:stop], quantity[start:stop])
+        for item_id, start, stop in zip(
+            cols["item_rows.item_id"].tolist(), cols["item_rows.start"].tolist(), cols["item_rows.stop"].tolist()
+        )
+    }
+    items = {
+        int(item_id): {f: float(cols[f"items.{f}"][k]) for f in ITEM_FIELDS}
+        for k, item_id in enumerate(cols["items.id"].tolist())
+    }
+    return WarehouseIndex.from_built(
+        warehouse_ids=cols["warehouses.id"],
+        lat=cols["warehouses.lat"],
+        lon=cols["warehouses.lon"],
+        by_item=by_item,
+        items=items,
+        grid=manifest["grid"],
+        cell_order=cols["warehouses.cell_order"],
+        cell_start=cols["grid.cell_start"],
+        id_order=cols["warehouses.id_order"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the warehouse tables to a columnar snapshot.")
+    parser.add_argument("directory", help="output directory (created if missing)")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("LAT_MIN", "LAT_MAX", "LON_MIN", "LON_MAX"),
+                        help="only export warehouses inside this box")
+    args = parser.parse_args()
+
+    index = WarehouseIndex.load(bbox=args.bbox)
+    manifest = export_snapshot(index, args.directory, source="postgres")
+    print(f"Wrote {manifest['tables']['warehouses']['rows']:,} warehouses and "
+          f"{manifest['tables']['warehouse_items']['rows']:,} stock rows to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import struct
+import numpy as np
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.db.binary_copy import COPY_SIGNATURE, BinaryCopyReader, copy_statement
+from app.db.db_session import SessionLocal
+from app.db.queries import (
+    CANDIDATE_DTYPE,
+    WAREHOUSES_BY_ITEM_SQL,
+    load_warehouses_by_item,
+    records_from_rows,
+    stream_warehouses_by_item,
+)
+
+# Pune → Mumbai, 50 km detour
+PARAMS = dict(
+    src_lat=18.5204, src_lon=73.8567, dest_lat=19.0760, dest_lon=72.8777,
+    max_detour_meters=50000, max_load_capacity=2000, cost_per_km=2.0,
+)
+
+
+def make_records(n):
+    rng = np.random.default_rng(0)
+    records = np.zeros(n, dtype=CANDIDATE_DTYPE)
+    for name in CANDIDATE_DTYPE.names:
+        if CANDIDATE_DTYPE[name].kind == "i":
+            records[name] = rng.integers(-10**12, 10**12, n)
+        else:
+            records[name] = rng.normal(0, 1e6, n)
+    return records
+
+
+def copy_stream(records, extension=b"", nulls=()):
+    """What COPY ... TO STDOUT (FORMAT binary) sends for records, with (row, column) nulls sent as NULL."""
+    out = bytearray(COPY_SIGNATURE + struct.pack(">ii", 0, len(extension)) + extension)
+    for k, r in enumerate(records):
+        out += struct.pack(">h", len(r.dtype.names))
+        for name in r.dtype.names:
+            if (k, name) in nulls:
+                out += struct.pack(">i", -1)
+            else:
+                out += struct.pack(">i", 8) + struct.pack(">q" if r.dtype[name].kind == "i" else ">d", r[name])
+    return bytes(out + b"\xff\xff")
+
+
+def read(stream, piece=7, **kwargs):
+    reader = BinaryCopyReader(CANDIDATE_DTYPE, **kwargs)
+    for k in range(0, len(stream), piece):
+        reader.write(stream[k:k + piece])
+    return reader.finish()
+
+
+def test_reader_parses_rows_split_across_writes_and_grows():
+    records = make_records(300)
+    got = read(copy_stream(records, extension=b"ext"), capacity=4, chunk_bytes=500)
+    assert got.dtype == CANDIDATE_DTYPE
+    assert np.array_equal(got, records)
+
+
+def test_reader_handles_empty_result():
+    assert len(read(copy_stream(make_records(0)))) == 0
+
+
+def test_reader_reads_null_floats_as_nan():
+    records = make_records(300)
+    nulls = {(1, "unit_weight"), (2, "buy_price"), (2, "sell_price"), (299, "demand_metric")}
+    got = read(copy_stream(records, nulls=nulls), capacity=4, chunk_bytes=500)
+
+    for k, name in nulls:
+        records[k][name] = np.nan
+    assert len(got) == len(records)
+    for name in CANDIDATE_DTYPE.names:
+        assert np.array_equal(got[name], records[name], equal_nan=CANDIDATE_DTYPE[name].kind == "f")
+
+
+def test_reader_rejects_null_ints_and_truncated_streams():
+    with pytest.raises(ValueError):
+        read(copy_stream(make_records(2), nulls={(1, "item_id")}))
+    with pytest.raises(ValueError):
+        read(copy_stream(make_records(2))[:-5])
+
+
+def test_records_from_rows_matches_dtype():
+    rows = [{name: k for name in CANDIDATE_DTYPE.names} for k in range(3)]
+    records = records_from_rows(rows)
+    assert records.dtype == CANDIDATE_DTYPE
+    assert records["item_id"].tolist() == [0, 1, 2]
+
+
+def test_copy_statement_casts_columns_and_keeps_parameters():
+    sql = copy_statement(WAREHOUSES_BY_ITEM_SQL, CANDIDATE_DTYPE)
+    assert sql.startswith("COPY (SELECT q.warehouse_id::int8, q.quantity::float8")
+    assert sql.endswith(") q) TO STDOUT WITH (FORMAT binary)")
+    assert "%(limit)s" in sql and ";" not in sql
+
+
+def test_stream_matches_fetched_rows():
+    db = SessionLocal()
+    try:
+        rows = load_warehouses_by_item(**PARAMS, limit=500, db=db)
+        records = stream_warehouses_by_item(**PARAMS, limit=500, db=db)
+    except OperationalError:
+        pytest.skip("PostGIS database not reachable")
+    finally:
+        db.close()
+    expected = records_from_rows(rows)
+    assert np.array_equal(records["warehouse_id"], expected["warehouse_id"])
+    assert np.allclose(records["demand_metric"], expected["demand_metric"])
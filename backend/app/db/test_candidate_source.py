@@ -0,0 +1,53 @@
+import csv
+import pytest
+from app.db.candidate_source import CandidateSource, InMemoryCandidateSource, save_npz
+from app.testing import PARAMS, make_index
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+
+
+def test_npz_snapshot_round_trips(tmp_path):
+    index, _, _ = make_index()
+    path = str(tmp_path / "snapshot.npz")
+    save_npz(index, path)
+
+    source = InMemoryCandidateSource.from_path(path)
+    assert source.load_warehouses_by_item(**PARAMS) == index.load_warehouses_by_item(**PARAMS)
+    assert source.load_warehouses_by_item(**PARAMS, per_side_limit=5) == \
+        index.load_warehouses_by_item(**PARAMS, per_side_limit=5)
+
+
+def test_csv_snapshot_matches_index(tmp_path):
+    index, lat, lon = make_index()
+    # Columns in another order plus an unused one, as a psql export might have
+    write_csv(tmp_path / "warehouses.csv", ["name", "lon", "lat", "id"],
+              [(f"w{i}", lo, la, i) for i, (la, lo) in enumerate(zip(lat, lon), start=1)])
+    write_csv(tmp_path / "warehouse_items.csv", ["warehouse_id", "item_id", "quantity"],
+              [(index.warehouse_ids[p], item_id, repr(float(q)))
+               for item_id, (positions, quantity) in index.by_item.items()
+               for p, q in zip(positions, quantity)])
+    write_csv(tmp_path / "items.csv", ["id", "unit_weight", "unit_volume", "buy_price", "sell_price"],
+              [(i, *(v[c] for c in ("unit_weight", "unit_volume", "buy_price", "sell_price")))
+               for i, v in index.items.items()])
+
+    source = InMemoryCandidateSource.from_path(str(tmp_path))
+    assert source.load_warehouses_by_item(**PARAMS) == index.load_warehouses_by_item(**PARAMS)
+
+
+def test_csv_missing_column_is_reported(tmp_path):
+    write_csv(tmp_path / "warehouses.csv", ["id", "lat"], [(1, 18.5)])
+    with pytest.raises(ValueError, match="lon"):
+        InMemoryCandidateSource.from_csv(str(tmp_path))
+
+
+def test_incomplete_sources_fail_on_creation():
+    class NoRows(CandidateSource):
+        pass
+
+    with pytest.raises(TypeError):
+        NoRows()
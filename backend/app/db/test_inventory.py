@@ -0,0 +1,63 @@
+import json
+import threading
+from app.db import warehouse_index
+from app.db.inventory import apply_inventory_deltas, fold_changes
+from app.db.inventory_version import DELTA_CHANNEL, handle_notification
+from app.testing import make_index
+
+
+class FakeSession:
+    """Echoes upserted rows back and runs on_commit in place of a commit."""
+
+    def __init__(self, on_commit):
+        self.on_commit = on_commit
+
+    def execute(self, sql, params):
+        rows = list(zip(params.get("warehouse_ids", []), params.get("item_ids", []), params.get("quantities", [])))
+        return type("Result", (), {"fetchall": lambda self: rows})()
+
+    def commit(self):
+        self.on_commit()
+
+    def rollback(self):
+        pass
+
+
+def quantity(index, warehouse_id, item_id):
+    positions, quantities = index.by_item[item_id]
+    return float(quantities[positions == index.positions_of(warehouse_id)][0])
+
+
+def test_deltas_add_up_and_quantity_resets():
+    sets, adds = fold_changes([
+        {"warehouse_id": 1, "item_id": 2, "delta": -10.0},
+        {"warehouse_id": 1, "item_id": 2, "delta": -5.0},
+        {"warehouse_id": 3, "item_id": 2, "delta": 4.0},
+        {"warehouse_id": 3, "item_id": 2, "quantity": 100.0},
+        {"warehouse_id": 3, "item_id": 2, "delta": -1.0},
+    ])
+
+    assert adds == {(1, 2): -15.0}
+    assert sets == {(3, 2): 99.0}
+
+
+def test_local_apply_does_not_overwrite_a_later_replayed_batch(monkeypatch):
+    index, _, _ = make_index(n=50)
+    monkeypatch.setattr(warehouse_index, "_index", index)
+
+    # Our batch (10) commits, then another process's (20); the listener
+    # replays both while our own apply is still pending
+    def replay():
+        for rows in ([[1, 1, 10.0]], [[1, 1, 20.0]]):
+            handle_notification(DELTA_CHANNEL, json.dumps(rows))
+
+    listener = threading.Thread(target=replay)
+
+    def commit():
+        listener.start()
+        listener.join(timeout=0.2)
+
+    apply_inventory_deltas([{"warehouse_id": 1, "item_id": 1, "quantity": 10.0}], db=FakeSession(commit))
+    listener.join()
+
+    assert quantity(index, 1, 1) == 20.0
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app.db.db_session import SessionLocal
+from app.db.queries import (
+    CANDIDATE_WAREHOUSES_SQL,
+    ITEM_STOCK_SQL,
+    WAREHOUSES_BY_ITEM_SQL,
+    corridor_half_width_meters,
+    corridor_params,
+)
+
+# Pune → Mumbai, 50 km detour
+SRC = (18.5204, 73.8567)
+DEST = (19.0760, 72.8777)
+
+
+def explain(sql, params):
+    db = SessionLocal()
+    try:
+        rows = db.execute(text("EXPLAIN " + sql.text), params).fetchall()
+    except OperationalError:
+        pytest.skip("PostGIS database not reachable")
+    finally:
+        db.close()
+    return "\n".join(r[0] for r in rows)
+
+
+def test_candidate_query_uses_location_index():
+    plan = explain(CANDIDATE_WAREHOUSES_SQL, corridor_params(*SRC, *DEST, 50000))
+    assert "warehouses_location_gix" in plan, plan
+
+
+def test_warehouses_by_item_query_uses_location_index():
+    params = corridor_params(*SRC, *DEST, 50000)
+    params.update({"max_load_capacity": 2000, "cost_per_km": 0.02, "limit": 50})
+    plan = explain(WAREHOUSES_BY_ITEM_SQL, params)
+    assert "warehouses_location_gix" in plan, plan
+
+
+def test_corridor_half_width_covers_ellipse_apex():
+    # Planar semi-minor axis sqrt(δ(2D+δ))/2 for D ≈ 120 km, δ = 50 km
+    width = corridor_half_width_meters(*SRC, *DEST, 50000)
+    assert 60000 < width < 70000
+
+
+def test_item_stock_query_uses_stock_location_indexes():
+    params = corridor_params(*SRC, *DEST, 50000)
+    params.update({"max_load_capacity": 2000, "cost_per_km": 0.02, "per_side_limit": 10})
+    plan = explain(ITEM_STOCK_SQL, params)
+    assert "item_supply_location_gix" in plan and "item_demand_location_gix" in plan, plan
@@ -0,0 +1,46 @@
+import json
+import numpy as np
+import pytest
+from app.db.candidate_source import InMemoryCandidateSource
+from app.db.snapshot import MANIFEST, export_snapshot, load_snapshot
+from app.testing import PARAMS, make_index
+
+
+def test_snapshot_round_trips_memory_mapped(tmp_path):
+    index, _, _ = make_index()
+    export_snapshot(index, str(tmp_path))
+
+    loaded = load_snapshot(str(tmp_path))
+    assert isinstance(loaded.lat, np.memmap)
+    positions, quantity = next(iter(loaded.by_item.values()))
+    assert isinstance(quantity, np.memmap)  # a view, not a copy
+    assert loaded.load_warehouses_by_item(**PARAMS) == index.load_warehouses_by_item(**PARAMS)
+    assert loaded.load_warehouses_by_item(**PARAMS, per_side_limit=5) == \
+        index.load_warehouses_by_item(**PARAMS, per_side_limit=5)
+
+    source = InMemoryCandidateSource.from_path(str(tmp_path))
+    assert source.load_warehouses_by_item(**PARAMS) == index.load_warehouses_by_item(**PARAMS)
+
+
+def test_stock_updates_leave_snapshot_untouched(tmp_path):
+    index, _, _ = make_index()
+    export_snapshot(index, str(tmp_path))
+    loaded = load_snapshot(str(tmp_path))
+
+    item_id, (positions, _) = next(iter(loaded.by_item.items()))
+    warehouse_id = int(loaded.warehouse_ids[positions[0]])
+    assert loaded.apply_quantities([(warehouse_id, item_id, 12345.0)]) == 1
+    assert loaded.by_item[item_id][1][0] == 12345.0
+    assert load_snapshot(str(tmp_path)).by_item[item_id][1][0] != 12345.0
+
+
+def test_version_mismatch_is_rejected(tmp_path):
+    index, _, _ = make_index(n=10)
+    export_snapshot(index, str(tmp_path))
+    path = tmp_path / MANIFEST
+    manifest = json.loads(path.read_text())
+    manifest["version"] += 1
+    path.write_text(json.dumps(manifest))
+
+    with pytest.raises(ValueError, match="version"):
+        load_snapshot(str(tmp_path))
@@ -0,0 +1,62 @@
+import numpy as np
+from app.core.geo_utils import haversine_km
+from app.testing import ITEMS, MUMBAI, PUNE, make_index
+
+A = {"lat": PUNE[0], "lon": PUNE[1]}
+C = {"lat": MUMBAI[0], "lon": MUMBAI[1]}
+
+def test_corridor_matches_brute_force_ellipse():
+    index, lat, lon = make_index()
+    d_ac = haversine_km(A["lat"], A["lon"], C["lat"], C["lon"])
+
+    expected = {
+        wid for wid, (la, lo) in enumerate(zip(lat, lon), start=1)
+        if haversine_km(la, lo, A["lat"], A["lon"]) + haversine_km(la, lo, C["lat"], C["lon"]) - d_ac <= 40
+    }
+    found = {w["warehouse_id"] for w in index.load_candidate_warehouses(A, C, max_detour_km=40)}
+
+    assert expected and found == expected
+
+
+def test_load_warehouses_by_item_ranks_by_demand_metric():
+    index, _, _ = make_index(seed=1)
+    rows = index.load_warehouses_by_item(
+        A["lat"], A["lon"], C["lat"], C["lon"],
+        max_detour_meters=50000, max_load_capacity=2000, cost_per_km=0.001,
+    )
+
+    assert len(rows) == 50
+    metrics = [r["demand_metric"] for r in rows]
+    assert metrics == sorted(metrics, reverse=True)
+    assert all(r["sell_price"] == ITEMS[r["item_id"]]["sell_price"] for r in rows)
+
+
+def test_apply_quantities_updates_and_inserts_rows():
+    index, _, _ = make_index(n=200, seed=2)
+    positions, _ = index.by_item[1]
+    existing = int(index.warehouse_ids[positions[3]])
+    missing = next(w for w in range(1, 201) if index.positions_of(np.array([w]))[0] not in positions)
+
+    applied = index.apply_quantities([(existing, 1, 7.0), (missing, 1, -3.0), (missing, 1, -4.0), (9999, 1, 1.0)])
+
+    assert applied == 2  # last write per key wins; unknown warehouse skipped
+    positions, quantities = index.by_item[1]
+    assert np.all(np.diff(positions) > 0)
+    stock = dict(zip(index.warehouse_ids[positions].tolist(), quantities.tolist()))
+    assert stock[existing] == 7.0 and stock[missing] == -4.0
+
+
+def test_per_side_limit_keeps_both_sides_of_every_item():
+    index, _, _ = make_index(seed=1)
+    rows = index.load_warehouses_by_item(
+        A["lat"], A["lon"], C["lat"], C["lon"],
+        max_detour_meters=50000, max_load_capacity=2000, cost_per_km=0.001, per_side_limit=5,
+    )
+
+    sides = {}
+    for r in rows:
+        sides.setdefault((r["item_id"], r["quantity"] > 0), []).append(r["demand_metric"])
+    assert set(sides) == {(item, side) for item in ITEMS for side in (True, False)}
+    assert all(len(m) == 5 for m in sides.values())
+    metrics = [r["demand_metric"] for r in rows]
+    assert metrics == sorted(metrics, reverse=True)
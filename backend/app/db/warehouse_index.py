@@ -0,0 +1,436 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import text
+from app.db.db_session import session_scope
+from app.db.queries import CANDIDATE_LIMIT
+from app.core.geo_utils import haversine_km_np
+
+# ST_DistanceSphere radius (metres), used for demand_metric parity with SQL
+SPHERE_RADIUS_M = 6370986.0
+EARTH_RADIUS_M = 6371000.0
+
+INDEX_ENABLED = os.getenv("WAREHOUSE_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+GRID_CELL_DEG = float(os.getenv("WAREHOUSE_INDEX_CELL_DEG", "0.25"))
+
+
+class WarehouseIndex:
+    """
+    In-memory copy of the warehouses, warehouse_items and items tables.
+
+    Warehouses are bucketed into a lat/lon grid stored CSR-style (warehouse
+    indices sorted by cell plus per-cell offsets), so a corridor query only
+    touches the grid rows overlapping its bounding box. Item rows are kept
+    as per-item columnar arrays keyed by warehouse position.
+    """
+
+    def __init__(
+        self,
+        warehouse_ids: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        wi_warehouse_id: np.ndarray,
+        wi_item_id: np.ndarray,
+        wi_quantity: np.ndarray,
+        items: Dict[int, Dict],
+        cell_deg: float = GRID_CELL_DEG,
+    ):
+        self.warehouse_ids = np.asarray(warehouse_ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.items = items
+        self.cell_deg = cell_deg
+        self._write_lock = threading.Lock()
+        self.track_changes = False
+        self._changes: Dict[int, List[np.ndarray]] = {}
+
+        self._build_grid()
+
+        # warehouse_id -> position in the warehouse arrays
+        self._id_order = np.argsort(self.warehouse_ids)
+        positions = self.positions_of(np.asarray(wi_warehouse_id, dtype=np.int64))
+
+        # item_id -> (warehouse positions, quantities), sorted by position
+        self.by_item = {}
+        wi_item_id = np.asarray(wi_item_id, dtype=np.int64)
+        wi_quantity = np.asarray(wi_quantity, dtype=np.float64)
+        for item_id in np.unique(wi_item_id):
+            rows = np.nonzero(wi_item_id == item_id)[0]
+            order = rows[np.argsort(positions[rows], kind="stable")]
+            self.by_item[int(item_id)] = (positions[order], wi_quantity[order])
+
+    @classmethod
+    def from_built(
+        cls,
+        warehouse_ids: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        by_item: Dict[int, Tuple[np.ndarray, np.ndarray]],
+        items: Dict[int, Dict],
+        grid: Dict,
+        cell_order: np.ndarray,
+        cell_start: np.ndarray,
+        id_order: np.ndarray,
+    ) -> "WarehouseIndex":
+        """
+        Reassembles an index from the structures a previous one built (see
+        grid_params and app.db.snapshot). Arrays are used as given, without
+        sorting or copying, so memory-mapped inputs stay shared.
+        """
+        index = cls.__new__(cls)
+        index.warehouse_ids, index.lat, index.lon = warehouse_ids, lat, lon
+        index.items = items
+        index.by_item = by_item
+        index.cell_deg = float(grid["cell_deg"])
+        index.lat0, index.lon0 = float(grid["lat0"]), float(grid["lon0"])
+        index.n_rows, index.n_cols = int(grid["n_rows"]), int(grid["n_cols"])
+        index.cell_order, index.cell_start = cell_order, cell_start
+        index._id_order = id_order
+        index._write_lock = threading.Lock()
+        index.track_changes = False
+        index._changes = {}
+        return index
+
+    def grid_params(self) -> Dict:
+        return {
+            "cell_deg": self.cell_deg,
+            "lat0": self.lat0,
+            "lon0": self.lon0,
+            "n_rows": self.n_rows,
+            "n_cols": self.n_cols,
+        }
+
+    def __len__(self):
+        return len(self.warehouse_ids)
+
+    def _build_grid(self):
+        n = len(self.lat)
+        self.lat0 = float(self.lat.min()) if n else 0.0
+        self.lon0 = float(self.lon.min()) if n else 0.0
+        self.n_rows = int((self.lat.max() - self.lat0) // self.cell_deg) + 1 if n else 1
+        self.n_cols = int((self.lon.max() - self.lon0) // self.cell_deg) + 1 if n else 1
+
+        rows = ((self.lat - self.lat0) // self.cell_deg).astype(np.int64)
+        cols = ((self.lon - self.lon0) // self.cell_deg).astype(np.int64)
+        cell = rows * self.n_cols + cols
+
+        self.cell_order = np.argsort(cell, kind="stable")
+        counts = np.bincount(cell, minlength=self.n_rows * self.n_cols)
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+
+    def positions_of(self, warehouse_ids: np.ndarray) -> np.ndarray:
+        """Maps warehouse ids to positions in the warehouse arrays (-1 if unknown)."""
+        sorted_ids = self.warehouse_ids[self._id_order]
+        at = np.searchsorted(sorted_ids, warehouse_ids)
+        at = np.minimum(at, len(sorted_ids) - 1)
+        found = sorted_ids[at] == warehouse_ids
+        return np.where(found, self._id_order[at], -1)
+
+    def apply_quantities(self, rows: Iterable[Tuple[int, int, float]]) -> int:
+        """
+        Writes new absolute quantities for (warehouse_id, item_id, quantity)
+        rows, adding pairs the index has not seen. Each item's arrays are
+        rebuilt and swapped in whole, so concurrent readers see either the
+        old or the new stock. Rows of warehouses outside the index are
+        skipped (a refresh picks them up). Returns how many rows applied.
+        """
+        latest = {}
+        for warehouse_id, item_id, quantity in rows:
+            latest[(int(warehouse_id), int(item_id))] = float(quantity)  # last write wins
+        if not latest:
+            return 0
+
+        with self._write_lock:
+            return self._apply(latest)
+
+    def _apply(self, latest: Dict[Tuple[int, int], float]) -> int:
+        keys = np.array(list(latest), dtype=np.int64)
+        quantities = np.array(list(latest.values()), dtype=np.float64)
+        positions = self.positions_of(keys[:, 0])
+
+        applied = 0
+        for item_id in np.unique(keys[:, 1]):
+            sel = (keys[:, 1] == item_id) & (positions >= 0)
+            if not sel.any():
+                continue
+            new_pos, new_qty = positions[sel], quantities[sel]
+            old_pos, old_qty = self.by_item.get(int(item_id), (np.empty(0, np.int64), np.empty(0)))
+
+            at = np.searchsorted(old_pos, new_pos)
+            hit = at < len(old_pos)
+            hit[hit] = old_pos[at[hit]] == new_pos[hit]
+
+            qty = old_qty.copy()
+            qty[at[hit]] = new_qty[hit]
+            # New rows sharing an insertion point go in position order
+            order = np.lexsort((new_pos[~hit], at[~hit]))
+            pos = np.insert(old_pos, at[~hit][order], new_pos[~hit][order])
+            qty = np.insert(qty, at[~hit][order], new_qty[~hit][order])
+
+            self.by_item[int(item_id)] = (pos, qty)
+            applied += int(np.count_nonzero(sel))
+            if self.track_changes:
+                self._changes.setdefault(int(item_id), []).append(new_pos)
+        return applied
+
+    def take_changes(self) -> Dict[int, np.ndarray]:
+        """
+        item_id -> positions whose quantity changed since the last call
+        (recorded only while track_changes is set, e.g. by a pair index).
+        """
+        with self._write_lock:
+            changes, self._changes = self._changes, {}
+        return {item_id: np.unique(np.concatenate(parts)) for item_id, parts in changes.items()}
+
+    @classmethod
+    def load(cls, db=None, bbox: Optional[Tuple[float, float, float, float]] = None) -> "WarehouseIndex":
+        """
+        Reads the three tables from Postgres. With bbox (lat_min, lat_max,
+        lon_min, lon_max) only warehouses inside it, and their items, are
+        loaded.
+        """
+        where = ""
+        params = {}
+        if bbox is not None:
+            where = "WHERE w.location && ST_MakeEnvelope(:lon_min, :lat_min, :lon_max, :lat_max, 4326)::geography"
+            params = dict(zip(("lat_min", "lat_max", "lon_min", "lon_max"), map(float, bbox)))
+
+        with session_scope(db) as db:
+            w = db.execute(text(f"""
+                SELECT w.id, ST_Y(w.location::geometry) AS lat, ST_X(w.location::geometry) AS lon
+                FROM warehouses w
+                {where}
+            """), params).fetchall()
+            wi = db.execute(text(f"""
+                SELECT wi.warehouse_id, wi.item_id, wi.quantity
+                FROM warehouse_items wi
+                JOIN warehouses w ON w.id = wi.warehouse_id
+                {where}
+            """), params).fetchall()
+            it = db.execute(text("""
+                SELECT id, unit_weight, unit_volume, buy_price, sell_price FROM items
+            """)).fetchall()
+
+        return cls(
+            warehouse_ids=np.array([r.id for r in w], dtype=np.int64),
+            lat=np.array([r.lat for r in w], dtype=np.float64),
+            lon=np.array([r.lon for r in w], dtype=np.float64),
+            wi_warehouse_id=np.array([r.warehouse_id for r in wi], dtype=np.int64),
+            wi_item_id=np.array([r.item_id for r in wi], dtype=np.int64),
+            wi_quantity=np.array([r.quantity for r in wi], dtype=np.float64),
+            items={
+                r.id: {
+                    "unit_weight": r.unit_weight,
+                    "unit_volume": r.unit_volume,
+                    "buy_price": r.buy_price,
+                    "sell_price": r.sell_price,
+                }
+                for r in it
+            },
+        )
+
+    def _bbox_positions(self, lat_min, lat_max, lon_min, lon_max) -> np.ndarray:
+        r0 = max(int((lat_min - self.lat0) // self.cell_deg), 0)
+        r1 = min(int((lat_max - self.lat0) // self.cell_deg), self.n_rows - 1)
+        c0 = max(int((lon_min - self.lon0) // self.cell_deg), 0)
+        c1 = min(int((lon_max - self.lon0) // self.cell_deg), self.n_cols - 1)
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, dtype=np.int64)
+
+        # Cells are row-major, so each grid row is one contiguous CSR slice
+        chunks = [
+            self.cell_order[self.cell_start[r * self.n_cols + c0]:self.cell_start[r * self.n_cols + c1 + 1]]
+            for r in range(r0, r1 + 1)
+        ]
+        return np.concatenate(chunks)
+
+    def corridor(self, src_lat, src_lon, dest_lat, dest_lon, max_detour_meters) -> np.ndarray:
+        """
+        Positions of warehouses W with d(W,src) + d(W,dest) - d(src,dest)
+        <= max_detour_meters (great-circle distances).
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        d_sd = float(haversine_km_np(src_lat, src_lon, dest_lat, dest_lon)) * 1000
+        pos = self._bbox_positions(*corridor_bbox(src_lat, src_lon, dest_lat, dest_lon, max_detour_meters))
+        detour = (
+            haversine_km_np(self.lat[pos], self.lon[pos], src_lat, src_lon)
+            + haversine_km_np(self.lat[pos], self.lon[pos], dest_lat, dest_lon)
+        ) * 1000 - d_sd
+        return np.sort(pos[detour <= max_detour_meters])
+
+    def load_candidate_warehouses(self, B: Dict, C: Dict, max_detour_km: float = 30) -> List[Dict]:
+        """In-memory equivalent of queries.load_candidate_warehouses."""
+        pos = self.corridor(B["lat"], B["lon"], C["lat"], C["lon"], max_detour_km * 1000)
+        return [
+            {"warehouse_id": int(self.warehouse_ids[p]), "lat": float(self.lat[p]), "lon": float(self.lon[p])}
+            for p in pos
+        ]
+
+    def load_warehouses_by_item(
+        self,
+        src_lat: float,
+        src_lon: float,
+        dest_lat: float,
+        dest_lon: float,
+        max_detour_meters: float,
+        max_load_capacity: float,
+        cost_per_km: float,
+        per_side_limit: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """In-memory equivalent of queries.load_warehouses_by_item."""
+        in_corridor = np.zeros(len(self), dtype=bool)
+        in_corridor[self.corridor(src_lat, src_lon, dest_lat, dest_lon, max_detour_meters)] = True
+
+        pos_parts, qty_parts, item_parts = [], [], []
+        for item_id, (positions, quantity) in list(self.by_item.items()):
+            if item_id not in self.items:
+                continue  # inner join on items
+            keep = in_corridor[positions]
+            pos_parts.append(positions[keep])
+            qty_parts.append(quantity[keep])
+            item_parts.append(np.full(np.count_nonzero(keep), item_id, dtype=np.int64))
+
+        if not pos_parts:
+            return []
+        pos = np.concatenate(pos_parts)
+        qty = np.concatenate(qty_parts)
+        item_id = np.concatenate(item_parts)
+        if len(pos) == 0:
+            return []
+
+        def item_col(name):
+            return np.array([self.items[int(i)][name] for i in item_id], dtype=np.float64)
+
+        unit_weight = item_col("unit_weight")
+        unit_volume = item_col("unit_volume")
+        sell_price = item_col("sell_price")
+        buy_price = item_col("buy_price")
+
+        lat, lon = self.lat[pos], self.lon[pos]
+        scale = SPHERE_RADIUS_M / EARTH_RADIUS_M * 1000
+        d_src = haversine_km_np(src_lat, src_lon, lat, lon) * scale
+        d_dest = haversine_km_np(dest_lat, dest_lon, lat, lon) * scale
+        margin = sell_price - buy_price
+        if per_side_limit:
+            top, demand_metric = _top_per_side(
+                qty, item_id, np.abs(margin), unit_weight, d_src, d_dest,
+                max_load_capacity, cost_per_km, per_side_limit,
+            )
+        else:
+            demand_metric = (
+                np.minimum(qty * margin, max_load_capacity * margin / unit_weight)
+                - ((d_src * 1.25 + d_dest * 0.75) / 2) * cost_per_km
+            )
+            top = np.argsort(-demand_metric, kind="stable")[:limit or CANDIDATE_LIMIT]
+        return [
+            {
+                "warehouse_id": int(self.warehouse_ids[pos[k]]),
+                "quantity": float(qty[k]),
+                "lat": float(lat[k]),
+                "lon": float(lon[k]),
+                "item_id": int(item_id[k]),
+                "unit_weight": float(unit_weight[k]),
+                "unit_volume": float(unit_volume[k]),
+                "sell_price": float(sell_price[k]),
+                "buy_price": float(buy_price[k]),
+                "demand_metric": float(demand_metric[k]),
+            }
+            for k in top
+        ]
+
+
+def _top_per_side(qty, item_id, margin, unit_weight, d_src, d_dest,
+                  max_load_capacity, cost_per_km, per_side_limit):
+    """
+    ITEM_STOCK_SQL ranking: (row order, demand_metric) keeping the best
+    per_side_limit suppliers and demanders of every item, best first.
+    """
+    supply = qty > 0
+    src_weight = np.where(supply, 1.25, 0.75)
+    demand_metric = (
+        np.minimum(np.abs(qty) * margin, max_load_capacity * margin / unit_weight)
+        - ((d_src * src_weight + d_dest * (2 - src_weight)) / 2) * cost_per_km
+    )
+
+    rows = np.nonzero(qty != 0)[0]
+    # Group by (item, side), best first inside each group
+    rows = rows[np.lexsort((-demand_metric[rows], supply[rows], item_id[rows]))]
+    group = item_id[rows] * 2 + supply[rows]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    rows = rows[rank < per_side_limit]
+    return rows[np.argsort(-demand_metric[rows], kind="stable")], demand_metric
+
+
+def corridor_bbox(src_lat, src_lon, dest_lat, dest_lon, max_detour_meters):
+    """
+    (lat_min, lat_max, lon_min, lon_max) containing the detour ellipse.
+    Every match lies within d(src,dest) + detour of both endpoints, so the
+    box is the intersection of those two caps' boxes.
+    """
+    reach = float(haversine_km_np(src_lat, src_lon, dest_lat, dest_lon)) * 1000 + max_detour_meters
+    a = _cap_bbox(src_lat, src_lon, reach)
+    b = _cap_bbox(dest_lat, dest_lon, reach)
+    return max(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])
+
+
+def _cap_bbox(lat, lon, radius_m):
+    """Lat/lon box containing every point within radius_m of (lat, lon)."""
+    r_deg = np.degrees(radius_m / EARTH_RADIUS_M)
+    lat_min, lat_max = lat - r_deg, lat + r_deg
+    if lat_min <= -90 or lat_max >= 90 or r_deg >= 90:
+        return max(lat_min, -90.0), min(lat_max, 90.0), -180.0, 180.0
+    half_width = np.degrees(np.arcsin(min(np.sin(np.radians(r_deg)) / np.cos(np.radians(lat)), 1.0)))
+    return lat_min, lat_max, lon - half_width, lon + half_width
+
+
+# Process-wide index, swapped atomically on refresh
+_index: Optional[WarehouseIndex] = None
+_lock = threading.Lock()
+
+
+def get_warehouse_index() -> Optional[WarehouseIndex]:
+    """The loaded index, or None when callers should query Postgres."""
+    return _index
+
+
+def refresh_warehouse_index(db=None) -> WarehouseIndex:
+    """Reloads the index from the DB and swaps it in."""
+    global _index
+    index = WarehouseIndex.load(db)
+    with _lock:
+        _index = index
+    return index
+
+
+def set_warehouse_index(index: WarehouseIndex):
+    """Swaps in an index built elsewhere (e.g. from a snapshot file)."""
+    global _index
+    with _lock:
+        _index = index
+
+
+def invalidate_warehouse_index():
+    """Drops the index so lookups fall back to SQL until the next refresh."""
+    global _index
+    with _lock:
+        _index = None
+
+
+# Held by app.db.inventory from a commit through its apply_inventory_rows
+# and by the inventory listener while replaying deltas, so the index sees
+# this process's batches and replayed ones in commit order
+inventory_lock = threading.Lock()
+
+
+def apply_inventory_rows(rows: Iterable[Tuple[int, int, float]]) -> int:
+    """Applies changed warehouse_items rows to the loaded index, if any."""
+    with _lock:
+        index = _index
+    if index is None:
+        return 0
+    return index.apply_quantities(rows)
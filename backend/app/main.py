@@ -1,8 +1,41 @@
 #main.py
+import os
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.routes import router
+from app.core import pair_index, parallel, result_cache
+from app.db import async_session, candidate_source, inventory_version, warehouse_index
 
-app = FastAPI(title="Trade Optimizer API")
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("app")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if candidate_source.CANDIDATE_SNAPSHOT_PATH:
+        index = candidate_source.load_snapshot(candidate_source.CANDIDATE_SNAPSHOT_PATH)
+        logger.info("Loaded %d warehouses from %s", len(index), candidate_source.CANDIDATE_SNAPSHOT_PATH)
+    elif warehouse_index.INDEX_ENABLED:
+        index = warehouse_index.refresh_warehouse_index()
+        logger.info("Loaded warehouse index with %d warehouses", len(index))
+    # Cached results are only safe while writes from other processes invalidate
+    # them; a snapshot has no database to listen on and never changes
+    listen = inventory_version.LISTEN_ENABLED or result_cache.RESULT_CACHE_ENABLED
+    if listen and not candidate_source.CANDIDATE_SNAPSHOT_PATH:
+        inventory_version.start_inventory_listener()
+    if pair_index.PAIR_INDEX_ENABLED:
+        pair_index.start_pair_index_refresher()
+    yield
+    pair_index.stop_pair_index_refresher()
+    inventory_version.stop_inventory_listener()
+    parallel.shutdown_pool()
+    await async_session.dispose_async_engine()
 
-app.include_router(router)
 
+app = FastAPI(title="Trade Optimizer API", lifespan=lifespan)
+
+app.include_router(router)
@@ -1,5 +1,10 @@
-from pydantic import BaseModel
-from typing import List, Tuple, Dict
+import os
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Tuple, Dict
+
+# Largest multi-stop time_budget_s a request may ask for; the search holds a
+# worker thread meanwhile
+MULTISTOP_MAX_TIME_BUDGET_S = float(os.getenv("MULTISTOP_MAX_TIME_BUDGET_S", "5"))
 
 class OptimizationRequest(BaseModel):
     start_location: Tuple[float, float]
@@ -9,6 +14,11 @@ class OptimizationRequest(BaseModel):
     max_truck_weight_kg: float
     curr_truck_weight_kg: float
 
+class MultiStopRequest(OptimizationRequest):
+    max_truck_volume_m3: Optional[float] = None  # unlimited if omitted
+    # search time limit, server default if omitted
+    time_budget_s: Optional[float] = Field(None, gt=0, le=MULTISTOP_MAX_TIME_BUDGET_S)
+
 class ProfitPair(BaseModel):
     buy_warehouse_id: int
     sell_warehouse_id: int
@@ -29,3 +39,72 @@ class ProfitPair(BaseModel):
 
 class OptimizationResponse(BaseModel):
     profitable_pairs: List[ProfitPair]
+
+
+class OptimizationUpdate(BaseModel):
+    phase: str  # "haversine" (or "estimate" with a travel model) first, then "road" once road distances are in
+    profitable_pairs: List[ProfitPair]
+
+
+class BatchOptimizationResult(BaseModel):
+    index: int  # position of the truck in the batch request
+    profitable_pairs: List[ProfitPair]
+
+
+class FleetAssignment(BaseModel):
+    index: int  # position of the truck in the fleet request
+    pair: Optional[ProfitPair]  # None when nothing profitable is left for it
+
+
+class FleetPlanResponse(BaseModel):
+    assignments: List[FleetAssignment]
+    total_net_profit: float
+
+
+class MultiStopStop(BaseModel):
+    warehouse_id: int
+    item_id: int
+    action: str  # "buy" or "sell"
+    quantity: int
+    arrival_time: float  # hours after leaving A
+    load_kg: float  # on board when leaving the stop
+    load_m3: float
+
+
+class MultiStopTrade(BaseModel):
+    buy_warehouse_id: int
+    sell_warehouse_id: int
+    item_id: int
+    traded_quantity: int
+
+
+class MultiStopResponse(BaseModel):
+    stops: List[MultiStopStop]
+    trades: List[MultiStopTrade]
+    gross_profit: float
+    transport_cost: float
+    net_profit: float
+    total_distance_km: float
+    extra_distance_km: float
+    total_trip_time: float
+    peak_load_kg: float
+    peak_load_m3: float
+    weight_utilization: float
+
+
+class InventoryChange(BaseModel):
+    warehouse_id: int
+    item_id: int
+    delta: Optional[float] = None  # added to the stored quantity
+    quantity: Optional[float] = None  # replaces it
+
+    @model_validator(mode="after")
+    def one_of_delta_or_quantity(self):
+        if (self.delta is None) == (self.quantity is None):
+            raise ValueError("give exactly one of delta or quantity")
+        return self
+
+
+class InventoryUpdateResponse(BaseModel):
+    changed: int
+    version: int
@@ -0,0 +1,74 @@
+"""Synthetic data shared by the test modules."""
+
+import random
+import numpy as np
+from app.db.warehouse_index import WarehouseIndex
+from app.models.schemas import OptimizationRequest
+
+PUNE, MUMBAI, THANE = (18.5204, 73.8567), (19.0760, 72.8777), (19.2183, 72.9781)
+DELHI, JAIPUR = (28.7041, 77.1025), (26.9124, 75.7873)
+
+ITEMS = {
+    i: {"unit_weight": 0.5 * i, "unit_volume": 0.1, "buy_price": 90.0 + i, "sell_price": 70.0 + i}
+    for i in range(1, 4)
+}
+
+# load_warehouses_by_item keyword arguments for Pune → Mumbai
+PARAMS = dict(
+    src_lat=PUNE[0], src_lon=PUNE[1], dest_lat=MUMBAI[0], dest_lon=MUMBAI[1],
+    max_detour_meters=40000, max_load_capacity=2000, cost_per_km=0.001,
+)
+
+
+def make_index(n=3000, seed=0):
+    """WarehouseIndex of n random warehouses around Pune/Mumbai stocking ITEMS; also their lat and lon."""
+    rng = random.Random(seed)
+    lat = [rng.uniform(17.0, 21.0) for _ in range(n)]
+    lon = [rng.uniform(71.0, 76.0) for _ in range(n)]
+    wi = [(wid, item, rng.uniform(-5000, 5000)) for wid in range(1, n + 1) for item in ITEMS if rng.random() < 0.5]
+    index = WarehouseIndex(
+        warehouse_ids=np.arange(1, n + 1),
+        lat=np.array(lat),
+        lon=np.array(lon),
+        wi_warehouse_id=np.array([r[0] for r in wi]),
+        wi_item_id=np.array([r[1] for r in wi]),
+        wi_quantity=np.array([r[2] for r in wi]),
+        items=ITEMS,
+    )
+    return index, lat, lon
+
+
+def make_rows(n, seed=0):
+    """Candidate rows for n warehouses between Pune and Mumbai, three of five items each."""
+    rng = random.Random(seed)
+    rows = []
+    for wid in range(1, n + 1):
+        for item_id in rng.sample(range(1, 6), 3):
+            rows.append({
+                "warehouse_id": wid,
+                "item_id": item_id,
+                "quantity": round(rng.uniform(-5000, 5000), 2),
+                "lat": rng.uniform(18.4, 19.2),
+                "lon": rng.uniform(72.8, 73.9),
+                "unit_weight": 0.5 + item_id * 0.4,
+                "unit_volume": 0.1,
+                "sell_price": 60 + item_id * 5,
+                "buy_price": 90 + item_id,
+            })
+    return rows
+
+
+def load_rows(seed=4):
+    """Pune → Mumbai candidate rows from a make_index index."""
+    index, _, _ = make_index(seed=seed)
+    return index.load_warehouses_by_item(
+        PUNE[0], PUNE[1], MUMBAI[0], MUMBAI[1],
+        max_detour_meters=50000, max_load_capacity=2000, cost_per_km=2,
+    )
+
+
+def truck(start, end):
+    return OptimizationRequest(
+        start_location=start, end_location=end, t_max=8,
+        cost_per_km_per_kg=0.001, max_truck_weight_kg=2000, curr_truck_weight_kg=0,
+    )
@@ -0,0 +1,228 @@
+"""
+Optimizer and query benchmarks.
+
+Builds synthetic warehouse sets with the seeding script's city-biased
+generators, loads them into an in-memory WarehouseIndex and times the hot
+paths on random corridors between nearby points:
+
+    find_profitable_pairs   candidate load + scoring, end to end
+    score_pairs             the vectorized scoring kernel alone
+    distance_matrix         generate_warehouse_distance_matrix on a stub router
+    sql_*                   candidate queries against the configured PostGIS
+                            (--sql; seed it first with data/seed_warehouses.py)
+
+Results go to a JSON file with latency percentiles per benchmark and size,
+plus the git revision, so runs of different versions can be compared.
+
+Usage (from backend/):
+    python -m benchmarks.run --sizes 10000 100000 --routes 50 --out bench.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+import numpy as np
+
+from app.core import optimizer
+from app.core.geo_utils import generate_warehouse_distance_matrix
+from app.core.routing import StubProvider, set_routing_provider
+from app.core.scoring import CandidateArrays, score_pairs
+from app.db import warehouse_index
+from app.db.warehouse_index import WarehouseIndex
+from data.seed_warehouses import cities, generate_items, generate_warehouses, make_items
+
+PERCENTILES = (50, 90, 99)
+
+# Truck used for every corridor
+T_MAX = 8.0
+COST_PER_KM_PER_KG = 0.001
+MAX_TRUCK_WEIGHT_KG = 2000.0
+
+
+def build_index(n: int, seed: int) -> WarehouseIndex:
+    """n warehouses with the seeder's spatial and stock distribution."""
+    rng = np.random.default_rng([seed, n])
+    lat, lon = generate_warehouses(rng, n)
+    offset, item_id, quantity = generate_items(rng, n)
+    items = {
+        item["id"]: {k: item[k] for k in ("unit_weight", "unit_volume", "buy_price", "sell_price")}
+        for item in make_items(seed)
+    }
+    return WarehouseIndex(
+        warehouse_ids=np.arange(1, n + 1),
+        lat=lat,
+        lon=lon,
+        wi_warehouse_id=offset + 1,
+        wi_item_id=item_id,
+        wi_quantity=quantity,
+        items=items,
+    )
+
+
+def make_routes(count: int, seed: int) -> List[tuple]:
+    """Corridors starting near a city and ending 50-200 km away."""
+    rng = np.random.default_rng(seed)
+    routes = []
+    for _ in range(count):
+        _, lat, lon, _ = cities[rng.integers(len(cities))]
+        start = (lat + rng.uniform(-0.2, 0.2), lon + rng.uniform(-0.2, 0.2))
+        bearing = rng.uniform(0, 2 * np.pi)
+        reach_deg = rng.uniform(50, 200) / 111.0
+        end = (start[0] + reach_deg * np.cos(bearing), start[1] + reach_deg * np.sin(bearing))
+        routes.append((start, end))
+    return routes
+
+
+def summarize(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s) * 1000
+    out = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+    out.update(mean=float(ms.mean()), min=float(ms.min()), max=float(ms.max()))
+    return out
+
+
+def timed(fn: Callable, args_list: List[tuple], warmup: int = 2) -> List[float]:
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def candidates_for(start, end):
+    return optimizer.load_candidates(start, end, COST_PER_KM_PER_KG, MAX_TRUCK_WEIGHT_KG)
+
+
+def bench_in_memory(n: int, routes: List[tuple], seed: int) -> List[Dict]:
+    started = time.perf_counter()
+    index = build_index(n, seed)
+    build_s = time.perf_counter() - started
+    warehouse_index._index = index
+    try:
+        loaded = [(start, end, candidates_for(start, end)) for start, end in routes]
+        scored = [
+            (CandidateArrays.from_rows(rows), start, end)
+            for start, end, rows in loaded if rows
+        ]
+
+        results = {
+            "find_profitable_pairs": timed(
+                lambda s, e: optimizer.find_profitable_pairs(
+                    s, e, T_MAX, COST_PER_KM_PER_KG, MAX_TRUCK_WEIGHT_KG, 0.0
+                ),
+                routes,
+            ),
+            "score_pairs": timed(
+                lambda c, s, e: score_pairs(c, s, e, T_MAX, COST_PER_KM_PER_KG, MAX_TRUCK_WEIGHT_KG),
+                scored,
+            ),
+            "distance_matrix": timed(
+                generate_warehouse_distance_matrix,
+                [(rows, start, end) for start, end, rows in loaded if rows],
+            ),
+        }
+    finally:
+        warehouse_index._index = None
+
+    out = [{"name": "index_build", "warehouses": n, "samples": 1, "ms": summarize([build_s])}]
+    out += [
+        {"name": name, "warehouses": n, "samples": len(samples), "ms": summarize(samples)}
+        for name, samples in results.items() if samples
+    ]
+    out.append({
+        "name": "candidates_per_route", "warehouses": n, "samples": len(loaded),
+        "mean_rows": float(np.mean([len(rows) for _, _, rows in loaded])),
+    })
+    return out
+
+
+def bench_sql(routes: List[tuple]) -> List[Dict]:
+    """Candidate queries against the configured database, both rankings."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app.db.db_session import SessionLocal
+    from app.db.queries import load_warehouses_by_item
+
+    out = []
+    db = SessionLocal()
+    try:
+        (n,) = db.execute(text("SELECT COUNT(*) FROM warehouses")).one()
+        for name, per_side in (("sql_warehouses_by_item", None), ("sql_item_stock", 10)):
+            def query(start, end):
+                params = optimizer.candidate_query_params(start, end, COST_PER_KM_PER_KG, MAX_TRUCK_WEIGHT_KG)
+                params["per_side_limit"] = per_side
+                return load_warehouses_by_item(**params, db=db)
+
+            try:
+                samples = timed(query, routes)
+            except Exception as exc:  # e.g. item_stock tables missing
+                db.rollback()
+                print(f"{name}: skipped ({exc.__class__.__name__}: {exc})", file=sys.stderr)
+                continue
+            out.append({"name": name, "warehouses": int(n), "samples": len(samples), "ms": summarize(samples)})
+    except OperationalError as exc:
+        print(f"SQL benchmarks skipped: database not reachable ({exc.orig})", file=sys.stderr)
+    finally:
+        db.close()
+    return out
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                        help="warehouse counts to benchmark (default: 10000 100000)")
+    parser.add_argument("--routes", type=int, default=50, help="corridors timed per benchmark (default: 50)")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed for warehouses and routes (default: 0)")
+    parser.add_argument("--sql", action="store_true", help="also time the SQL candidate queries")
+    parser.add_argument("--out", default="bench.json", help="output JSON path (default: bench.json)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Offline, uncached router: distance_matrix measures assembly, not the network
+    set_routing_provider(StubProvider())
+    routes = make_routes(args.routes, args.seed)
+
+    results = []
+    for n in args.sizes:
+        print(f"Benchmarking {n:,} warehouses...", file=sys.stderr)
+        results += bench_in_memory(n, routes, args.seed)
+    if args.sql:
+        results += bench_sql(routes)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for r in results:
+        if "ms" in r:
+            ms = r["ms"]
+            print(f"{r['name']:<24} {r['warehouses']:>10,}  p50 {ms['p50']:8.2f} ms  "
+                  f"p90 {ms['p90']:8.2f} ms  p99 {ms['p99']:8.2f} ms")
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,14 @@
 import os
+import io
+import argparse
+import multiprocessing
+import numpy as np
 import psycopg2
-import random
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Connect to the database
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASS"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT")
-)
-cur = conn.cursor()
-
-# Create tables if not exists
-cur.execute("""
+SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS items (
     id SERIAL PRIMARY KEY,
     name TEXT NOT NULL,
@@ -36,29 +28,19 @@ CREATE TABLE IF NOT EXISTS warehouse_items (
     item_id INTEGER REFERENCES items(id) ON DELETE CASCADE,
     quantity FLOAT
 );
-""")
-
-# Define 10 standard items
-ITEMS = [
-    {"id": i + 1, "name": f"Item {i+1}", "unit_weight": random.uniform(0.5, 5.0),
-     "unit_volume": random.uniform(0.01, 0.5),
-     "buy_price": round(random.uniform(90, 120), 2),
-     "sell_price": round(random.uniform(60, 89), 2)}
-    for i in range(10)
-]
+"""
 
-# Insert items
-cur.execute("DELETE FROM warehouse_items;")
-cur.execute("DELETE FROM warehouses;")
-cur.execute("DELETE FROM items;")
+# Built after the bulk load; much cheaper than maintaining them per row
+INDEXES = {
+    "warehouses_location_gix":
+        "CREATE INDEX warehouses_location_gix ON warehouses USING GIST (location)",
+    "warehouse_items_item_warehouse_idx":
+        "CREATE INDEX warehouse_items_item_warehouse_idx ON warehouse_items (item_id, warehouse_id)",
+    "warehouse_items_warehouse_item_key":
+        "CREATE UNIQUE INDEX warehouse_items_warehouse_item_key ON warehouse_items (warehouse_id, item_id)",
+}
 
-for item in ITEMS:
-    cur.execute("""
-        INSERT INTO items (id, name, unit_weight, unit_volume, buy_price, sell_price)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (item["id"], item["name"], item["unit_weight"], item["unit_volume"],
-          item["buy_price"], item["sell_price"]))
-print(" Seeded items table")
+N_ITEMS = 10
 
 # Indian cities for spatial bias
 cities = [
@@ -84,47 +66,162 @@ cities = [
     ("Ghaziabad", 28.6692, 77.4538, 40)
 ]
 
-city_weights = [c[3] for c in cities]
-city_coords = [(c[1], c[2]) for c in cities]
+city_weights = np.array([c[3] for c in cities], dtype=np.float64)
+city_coords = np.array([(c[1], c[2]) for c in cities])
 min_lat, max_lat = 8.0, 37.0
 min_lon, max_lon = 68.0, 92.0
 
-def random_point_near(lat, lon, max_km=30):
+
+def make_items(seed=None):
+    """10 standard items with random weights, volumes and prices."""
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": i + 1, "name": f"Item {i+1}", "unit_weight": float(rng.uniform(0.5, 5.0)),
+         "unit_volume": float(rng.uniform(0.01, 0.5)),
+         "buy_price": round(float(rng.uniform(90, 120)), 2),
+         "sell_price": round(float(rng.uniform(60, 89)), 2)}
+        for i in range(N_ITEMS)
+    ]
+
+
+def generate_warehouses(rng, n, max_km=30):
+    """
+    n (lat, lon) points: 70% near a city (weighted), the rest uniform over
+    the India bounding box.
+    """
+    near_city = rng.random(n) < 0.7
+    city = rng.choice(len(cities), size=n, p=city_weights / city_weights.sum())
     delta_deg = max_km / 111.0
-    return lat + random.uniform(-delta_deg, delta_deg), lon + random.uniform(-delta_deg, delta_deg)
-
-print("Seeding warehouses...")
-
-for i in range(100_000):
-    if random.random() < 0.7:
-        lat_c, lon_c = random.choices(city_coords, weights=city_weights, k=1)[0]
-        lat, lon = random_point_near(lat_c, lon_c)
-    else:
-        lat = random.uniform(min_lat, max_lat)
-        lon = random.uniform(min_lon, max_lon)
-
-    cur.execute("""
-        INSERT INTO warehouses (location)
-        VALUES (ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography)
-        RETURNING id
-    """, (lon, lat))
-    warehouse_id = cur.fetchone()[0]
-
-    for item in ITEMS:
-        if random.random() < 0.7:
-            quantity = round(random.uniform(-5000, 5000), 2)
-            if abs(quantity) < 100:
-                continue
-            cur.execute("""
-                INSERT INTO warehouse_items (warehouse_id, item_id, quantity)
-                VALUES (%s, %s, %s)
-            """, (warehouse_id, item["id"], quantity))
-
-    if i % 1000 == 0:
-        print(f"Inserted {i} warehouses...")
-        conn.commit()
-
-conn.commit()
-cur.close()
-conn.close()
-print(" Done seeding 100,000 warehouses with item-level data")
+
+    lat = np.where(
+        near_city,
+        city_coords[city, 0] + rng.uniform(-delta_deg, delta_deg, n),
+        rng.uniform(min_lat, max_lat, n),
+    )
+    lon = np.where(
+        near_city,
+        city_coords[city, 1] + rng.uniform(-delta_deg, delta_deg, n),
+        rng.uniform(min_lon, max_lon, n),
+    )
+    return lat, lon
+
+
+def generate_items(rng, n):
+    """
+    Item rows for n warehouses: each item is stocked with probability 0.7,
+    quantity in [-5000, 5000] and rows with |quantity| < 100 dropped.
+    Returns (warehouse offset, item_id, quantity) arrays.
+    """
+    stocked = rng.random((n, N_ITEMS)) < 0.7
+    quantity = np.round(rng.uniform(-5000, 5000, (n, N_ITEMS)), 2)
+    keep = stocked & (np.abs(quantity) >= 100)
+    offset, item = np.nonzero(keep)
+    return offset, item + 1, quantity[keep]
+
+
+def generate_chunk(spec):
+    """
+    Builds one chunk as COPY-ready text. Warehouse ids are pre-assigned from
+    first_id, and the chunk's RNG depends only on (seed, chunk index), so
+    output is identical for any worker count.
+    """
+    seed, chunk_index, first_id, n = spec
+    rng = np.random.default_rng([seed, chunk_index])
+
+    lat, lon = generate_warehouses(rng, n)
+    ids = np.arange(first_id, first_id + n)
+    warehouses = "".join(
+        f"{wid}\tSRID=4326;POINT({lo!r} {la!r})\n" for wid, la, lo in zip(ids.tolist(), lat.tolist(), lon.tolist())
+    )
+
+    offset, item_id, quantity = generate_items(rng, n)
+    items = "".join(
+        f"{wid}\t{iid}\t{q!r}\n" for wid, iid, q in zip((ids[offset]).tolist(), item_id.tolist(), quantity.tolist())
+    )
+    return n, warehouses, items
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed warehouses, items and warehouse_items.")
+    parser.add_argument("--warehouses", type=int, default=100_000, help="number of warehouses to generate")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible datasets")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="warehouses per COPY chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="generator processes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % 2**32)
+    print(f"Seeding {args.warehouses} warehouses with seed {seed}...")
+
+    # Connect to the database
+    conn = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT")
+    )
+    cur = conn.cursor()
+
+    cur.execute(SCHEMA_SQL)
+    cur.execute("TRUNCATE warehouse_items, warehouses, items;")
+    for name in INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name};")
+
+    items = make_items(seed)
+    cur.execute(
+        "INSERT INTO items (id, name, unit_weight, unit_volume, buy_price, sell_price) VALUES "
+        + ",".join(["(%s, %s, %s, %s, %s, %s)"] * len(items)),
+        [v for item in items for v in (item["id"], item["name"], item["unit_weight"],
+                                       item["unit_volume"], item["buy_price"], item["sell_price"])]
+    )
+    print(" Seeded items table")
+
+    specs = [
+        (seed, k, start + 1, min(args.chunk_size, args.warehouses - start))
+        for k, start in enumerate(range(0, args.warehouses, args.chunk_size))
+    ]
+
+    # init.sql's per-row item_supply/item_demand trigger would queue an event
+    # for every COPY row; it is disabled for the load and the tables are
+    # rebuilt in one pass below
+    cur.execute("SELECT to_regprocedure('rebuild_item_stock()') IS NOT NULL;")
+    has_item_stock = cur.fetchone()[0]
+    if has_item_stock:
+        cur.execute("ALTER TABLE warehouse_items DISABLE TRIGGER warehouse_items_stock_sync;")
+
+    done = 0
+    with multiprocessing.Pool(max(args.workers, 1)) as pool:
+        # imap keeps chunk order and lets COPY overlap with generation
+        for n, warehouses, item_rows in pool.imap(generate_chunk, specs):
+            cur.copy_expert("COPY warehouses (id, location) FROM STDIN", io.StringIO(warehouses))
+            cur.copy_expert("COPY warehouse_items (warehouse_id, item_id, quantity) FROM STDIN", io.StringIO(item_rows))
+            done += n
+            print(f"Inserted {done} warehouses...")
+
+    # Ids were assigned client-side; move the sequence past them
+    cur.execute("SELECT setval(pg_get_serial_sequence('warehouses', 'id'), GREATEST(%s, 1));", (args.warehouses,))
+
+    print("Building indexes...")
+    for sql in INDEXES.values():
+        cur.execute(sql)
+
+    if has_item_stock:
+        cur.execute("ALTER TABLE warehouse_items ENABLE TRIGGER warehouse_items_stock_sync;")
+        print("Rebuilding per-item supply/demand tables...")
+        cur.execute("SELECT rebuild_item_stock();")
+    conn.commit()
+
+    conn.autocommit = True
+    cur.execute("ANALYZE warehouses; ANALYZE warehouse_items;")
+    if has_item_stock:
+        cur.execute("ANALYZE item_supply; ANALYZE item_demand;")
+    cur.close()
+    conn.close()
+    print(f" Done seeding {args.warehouses:,} warehouses with item-level data")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,4 +18,141 @@ CREATE TABLE IF NOT EXISTS warehouse_items (
     warehouse_id INTEGER REFERENCES warehouses(id) ON DELETE CASCADE,
     item_id INTEGER REFERENCES items(id) ON DELETE CASCADE,
     quantity FLOAT
-);
\ No newline at end of file
+);
+
+-- Spatial pre-filter of the corridor queries (ST_DWithin / &&)
+CREATE INDEX IF NOT EXISTS warehouses_location_gix
+    ON warehouses USING GIST (location);
+
+-- Candidate joins: by item and by warehouse
+CREATE INDEX IF NOT EXISTS warehouse_items_item_warehouse_idx
+    ON warehouse_items (item_id, warehouse_id);
+
+-- One row per (warehouse, item): the upsert key of inventory deltas, and
+-- the by-warehouse lookup
+CREATE UNIQUE INDEX IF NOT EXISTS warehouse_items_warehouse_item_key
+    ON warehouse_items (warehouse_id, item_id);
+
+
+-- Inventory change version, bumped once per statement touching warehouse_items.
+-- API processes LISTEN on "inventory_changed" to invalidate cached results.
+CREATE TABLE IF NOT EXISTS inventory_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO inventory_version (id, version) VALUES (TRUE, 0)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_inventory_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE inventory_version SET version = version + 1 WHERE id
+    RETURNING version INTO new_version;
+    PERFORM pg_notify('inventory_changed', new_version::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS warehouse_items_version ON warehouse_items;
+CREATE TRIGGER warehouse_items_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON warehouse_items
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_inventory_version();
+
+
+-- Per-item supply (quantity > 0) and demand (quantity < 0), each row with its
+-- warehouse location and the item's margin folded in, so candidate queries
+-- rank suppliers and demanders separately without the three-way join.
+-- Kept in step with warehouse_items and items by the triggers below; call
+-- rebuild_item_stock() after moving warehouses or after a bulk load run with
+-- warehouse_items_stock_sync disabled (as data/seed_warehouses.py does).
+CREATE TABLE IF NOT EXISTS item_supply (
+    item_id INTEGER NOT NULL,
+    warehouse_id INTEGER NOT NULL,
+    quantity FLOAT NOT NULL,
+    location GEOGRAPHY(Point, 4326) NOT NULL,
+    unit_weight FLOAT,
+    unit_volume FLOAT,
+    buy_price FLOAT,
+    sell_price FLOAT,
+    stock_value FLOAT,    -- |quantity * (sell_price - buy_price)|
+    margin_per_kg FLOAT,  -- |sell_price - buy_price| / unit_weight
+    PRIMARY KEY (item_id, warehouse_id)
+);
+
+CREATE TABLE IF NOT EXISTS item_demand (LIKE item_supply INCLUDING ALL);
+
+CREATE INDEX IF NOT EXISTS item_supply_location_gix ON item_supply USING GIST (location);
+CREATE INDEX IF NOT EXISTS item_demand_location_gix ON item_demand USING GIST (location);
+
+-- Same columns, in the same order, as item_supply / item_demand
+CREATE OR REPLACE VIEW item_stock_source AS
+SELECT
+    wi.item_id,
+    wi.warehouse_id,
+    wi.quantity,
+    w.location,
+    i.unit_weight,
+    i.unit_volume,
+    i.buy_price,
+    i.sell_price,
+    ABS(wi.quantity * (i.sell_price - i.buy_price)) AS stock_value,
+    ABS(i.sell_price - i.buy_price) / NULLIF(i.unit_weight, 0) AS margin_per_kg
+FROM warehouse_items wi
+JOIN warehouses w ON w.id = wi.warehouse_id
+JOIN items i ON i.id = wi.item_id;
+
+CREATE OR REPLACE FUNCTION rebuild_item_stock() RETURNS void AS $$
+BEGIN
+    TRUNCATE item_supply, item_demand;
+    INSERT INTO item_supply SELECT * FROM item_stock_source WHERE quantity > 0;
+    INSERT INTO item_demand SELECT * FROM item_stock_source WHERE quantity < 0;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_item_stock() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE item_supply, item_demand;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM item_supply WHERE item_id = OLD.item_id AND warehouse_id = OLD.warehouse_id;
+        DELETE FROM item_demand WHERE item_id = OLD.item_id AND warehouse_id = OLD.warehouse_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO item_supply SELECT * FROM item_stock_source s
+        WHERE s.item_id = NEW.item_id AND s.warehouse_id = NEW.warehouse_id AND s.quantity > 0;
+        INSERT INTO item_demand SELECT * FROM item_stock_source s
+        WHERE s.item_id = NEW.item_id AND s.warehouse_id = NEW.warehouse_id AND s.quantity < 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS warehouse_items_stock_sync ON warehouse_items;
+CREATE TRIGGER warehouse_items_stock_sync
+    AFTER INSERT OR UPDATE OR DELETE ON warehouse_items
+    FOR EACH ROW EXECUTE FUNCTION sync_item_stock();
+
+DROP TRIGGER IF EXISTS warehouse_items_stock_truncate ON warehouse_items;
+CREATE TRIGGER warehouse_items_stock_truncate
+    AFTER TRUNCATE ON warehouse_items
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_item_stock();
+
+-- Price or weight changes re-derive the margin columns of that item
+CREATE OR REPLACE FUNCTION sync_item_stock_prices() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM item_supply WHERE item_id = NEW.id;
+    DELETE FROM item_demand WHERE item_id = NEW.id;
+    INSERT INTO item_supply SELECT * FROM item_stock_source WHERE item_id = NEW.id AND quantity > 0;
+    INSERT INTO item_demand SELECT * FROM item_stock_source WHERE item_id = NEW.id AND quantity < 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS items_stock_sync ON items;
+CREATE TRIGGER items_stock_sync
+    AFTER UPDATE OF unit_weight, unit_volume, buy_price, sell_price ON items
+    FOR EACH ROW EXECUTE FUNCTION sync_item_stock_prices();